@@ -1,35 +1,38 @@
 # app.py - Main Application Entry Point with File-Based Storage
+import argparse
+import logging
 import sys
 from auth import Authentication
-from expenses import ExpenseTracker
-from file_manager import load_data, save_data
-from models import User, Expense, Category
+from expenses import ExpenseTracker, PAGE_SIZE, SORTS, validate_amount, validate_date
+from storage import get_storage, use_backend, BACKENDS
+from models import User, Category
+from importer import DEBIT_SIGNS, import_file, load_rules
+from batch import run_batch_file
 from file_manager import hash_password
+from budgets import alert_message, rolling_days, use_thresholds
+import applog
+import metrics
 
 
-def create_admin(auth):
-    data = load_data()
+def create_admin(auth=None):
+    auth = auth or Authentication()
+    admin = auth.find_user("admin")  # Index lookup; the first one loads the users
 
-    for user in data["users"]:
-        if user["username"] == "admin":
-            # If admin password is in plain text, hash it
-            if len(user["password"]) != 64:  # SHA-256 hashes are always 64 characters long
-                print("[!] Admin password found in plain text. Converting to hash...")
-                user["password"] = hash_password(user["password"])  # Convert to hash
-                save_data(data)
-                print("[✔] Admin password has been secured.")
-            return
+    if admin is not None:
+        # If admin password is in plain text, hash it
+        if len(admin.password) != 64:  # SHA-256 hashes are always 64 characters long
+            print("[!] Admin password found in plain text. Converting to hash...")
+            hashed = hash_password(admin.password)  # Convert to hash
+            get_storage().update_user(admin.user_id, {"password": hashed})
+            print("[✔] Admin password has been secured.")
+        return
 
-    # If no admin exists, create one with a hashed password
+    # If no admin exists, create one with a hashed password; the storage assigns its user ID
     print("[i] No admin found. Creating a new one...")
-    admin_user = {
-        "user_id": 1,
-        "username": "admin",
-        "password": hash_password("adminpass"),  # Store hashed password
-        "role": "admin"
-    }
-    data["users"].append(admin_user)
-    save_data(data)
+    try:
+        auth.create_user("admin", "adminpass", role="admin")
+    except ValueError:
+        return  # Another process created the admin first
     print("[✔] Admin account created with hashed password.")
 
 
@@ -57,71 +60,331 @@ def main_menu(auth):
             print("[!] Invalid choice.")
 
 
-def admin_menu():
-    data = load_data()
+def show_categories(categories):
+    """Prints every category as "ID: name"."""
+    print("\nAvailable Categories:")
+    for cat_id, cat in categories.items():
+        print(f"{cat_id}: {cat['name']}")
+
 
-    # Ensure "categories" exists and is a dictionary
-    if "categories" not in data or not isinstance(data["categories"], dict):
-        data["categories"] = {}
+def read_category_id(prompt, optional=False):
+    """Reads a category ID, raising ValueError on anything but a number (or, if optional, an empty line)."""
+    value = input(prompt).strip()
+    if optional and not value:
+        return None
+    if not value.isdigit():
+        raise ValueError("Invalid input. Please enter a number.")
+    return int(value)
 
+
+def admin_menu(admin=None):
+    storage = get_storage()
     while True:
+        categories = storage.categories()  # Served from the shared cache unless the data changed on disk
+
         print("\n=== Admin Menu ===")
         print("1. Create Category")
         print("2. View Categories")
-        print("3. Edit Category")
-        print("4. Delete Category")
-        print("5. Logout")
+        print("3. Rename Category")
+        print("4. Merge Categories")
+        print("5. Delete Category")
+        print("6. Performance Report")
+        print("7. Logout")
         choice = input("Enter choice: ").strip()
 
-        if choice == "1":
-            name = input("Enter new category name: ").strip()
-            if name:
-                category_id = len(data["categories"]) + 1  # Auto-incrementing category ID
-                new_cat = Category(name=name, user_id=1, category_id=category_id)  # Admin ID assumed as 1
+        try:
+            if choice == "1":
+                name = input("Enter new category name: ").strip()
+                if name:
+                    record = storage.add_category(name, admin.user_id if admin else None)
+                    print(f"[+] Category created: {Category(**record)}")
+            elif choice == "2":
+                show_categories(categories)
+            elif choice == "3":
+                show_categories(categories)
+                cat_id = read_category_id("Enter category ID to rename: ")
+                new_name = input("Enter new category name: ").strip()
+                storage.rename_category(cat_id, new_name)  # Expenses hold the ID, so none of them is rewritten
+                print("[+] Category renamed.")
+            elif choice == "4":
+                show_categories(categories)
+                source = read_category_id("Enter category ID to merge away: ")
+                target = read_category_id("Enter category ID to merge it into: ")
+                moved = storage.merge_categories(source, target)
+                logging.info(f"Category {source} merged into {target}; {moved} expenses moved.")
+                print(f"[+] Categories merged; {moved} expenses moved.")
+            elif choice == "5":
+                show_categories(categories)
+                cat_id = read_category_id("Enter category ID to delete: ")
+                target = read_category_id("Category ID to move its expenses to (Enter if it has none): ", True)
+                moved = storage.delete_category(cat_id, target)
+                logging.info(f"Category {cat_id} deleted; {moved} expenses reassigned.")
+                print(f"[+] Category deleted; {moved} expenses reassigned.")
+            elif choice == "6":
+                performance_report()
+            elif choice == "7":
+                print("Logging out...")
+                break
+            else:
+                print("[!] Invalid choice.")
+        except (ValueError, OSError) as e:
+            print(f"[!] {e}")
 
-                # Store category as a dictionary entry instead of using append()
-                data["categories"][category_id] = vars(new_cat)
 
-                save_data(data)
-                print("[+] Category created.")
-        elif choice == "2":
-            print("\nAvailable Categories:")
-            for cat_id, cat in data["categories"].items():
-                print(f"{cat_id}: {cat['name']}")
-        elif choice == "3":
-            print("\nAvailable Categories:")
-            for cat_id, cat in data["categories"].items():
-                print(f"{cat_id}: {cat['name']}")
-            try:
-                cat_id = int(input("Enter category ID to edit: ").strip())
-                if cat_id in data["categories"]:
-                    new_name = input("Enter new category name: ").strip()
-                    data["categories"][cat_id]["name"] = new_name
-                    save_data(data)
-                    print("[+] Category updated.")
-                else:
-                    print("[!] Invalid Category ID.")
-            except ValueError:
-                print("[!] Invalid input. Please enter a number.")
-        elif choice == "4":
-            print("\nAvailable Categories:")
-            for cat_id, cat in data["categories"].items():
-                print(f"{cat_id}: {cat['name']}")
-            try:
-                cat_id = int(input("Enter category ID to delete: ").strip())
-                if cat_id in data["categories"]:
-                    del data["categories"][cat_id]
-                    save_data(data)
-                    print("[+] Category deleted.")
-                else:
-                    print("[!] Invalid Category ID.")
-            except ValueError:
-                print("[!] Invalid input. Please enter a number.")
-        elif choice == "5":
-            print("Logging out...")
+def performance_report():
+    """Shows per-operation counts, latency percentiles and total I/O recorded by the metrics module."""
+    print(f"\n=== Performance Report (instrumentation {'ON' if metrics.is_enabled() else 'OFF'}) ===")
+    print(metrics.format_report())
+    action = input("\nFile name to export as JSON, 't' to toggle instrumentation, Enter to go back: ").strip()
+    if action.lower() == "t":
+        metrics.disable() if metrics.is_enabled() else metrics.enable()
+        print(f"[i] Instrumentation is now {'ON' if metrics.is_enabled() else 'OFF'}.")
+    elif action:
+        try:
+            metrics.export_json(action)
+            print(f"[+] Report exported to {action}.")
+        except OSError as e:
+            print(f"[!] Could not export report: {e}")
+
+
+def format_expense(exp):
+    return f"ID: {exp['expense_id']} | {exp['date']} - {exp['category']}: {exp['amount']:.2f} ({exp['description']})"
+
+
+def add_expense(tracker):
+    """Prompts the user to select a category and adds an expense."""
+    categories = tracker.categories()
+    if not categories:
+        print("[!] No categories available. Please ask the admin to create categories first.")
+        return
+
+    print("\nAvailable Categories:")
+    for i, cat in enumerate(categories, start=1):
+        print(f"{i}. {cat}")
+
+    while True:
+        try:
+            category_index = int(input("Select category number: ").strip()) - 1
+            if category_index < 0 or category_index >= len(categories):
+                raise ValueError
+            category = categories[category_index]
             break
+        except (ValueError, IndexError):
+            print("[!] Invalid category selection. Please enter a valid number from the list.")
+
+    while True:
+        try:
+            amount = validate_amount(input("Enter expense amount: ").strip())
+            break
+        except ValueError as e:
+            print(f"[!] Invalid amount. {e}")
+
+    while True:
+        description = input("Enter description: ").strip()
+        if not description:
+            print("[!] Description cannot be empty.")
         else:
-            print("[!] Invalid choice.")
+            break
+
+    while True:
+        date = input("Enter date (YYYY-MM-DD) or press Enter for today: ").strip()
+        try:
+            date = validate_date(date) if date else None
+            break
+        except ValueError as e:
+            print(f"[!] {e}")
+
+    expense = tracker.add(amount, category, description, date)
+    print(f"[+] Expense added successfully with ID: {expense['expense_id']}.")
+    for alert in expense["alerts"]:
+        print(f"[!] {alert_message(alert)}")
+
+
+def browse(tracker, title, **filters):
+    """Shows matching expenses one page at a time, fetching each page only when the user asks for it."""
+    cursor, shown = None, 0
+    while True:
+        try:
+            page = tracker.page(PAGE_SIZE, cursor, **filters)
+        except ValueError as e:
+            print(f"[!] {e}")
+            return
+        if not page["expenses"] and cursor is None:
+            print("[i] No matching expenses.")
+            return
+        if cursor is None:
+            print(f"\n------ {title} ------")
+        for exp in page["expenses"]:
+            print(format_expense(exp))
+        shown += len(page["expenses"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            print(f"[i] End of list ({shown} shown).")
+            return
+        if input(f"-- {shown} shown. Press Enter for the next page or 'q' to stop: ").strip().lower() == "q":
+            return
+
+
+def prompt_filters():
+    """Asks for optional filters and a sort order, returned as keyword arguments for tracker.page()."""
+    print("Press Enter to skip a filter.")
+    filters = {
+        "start_date": input("From date (YYYY-MM-DD): ").strip(),
+        "end_date": input("To date (YYYY-MM-DD): ").strip(),
+        "category": input("Category: ").strip(),
+        "min_amount": input("Minimum amount: ").strip(),
+        "max_amount": input("Maximum amount: ").strip(),
+        "text": input("Description contains: ").strip(),
+        "sort": input(f"Sort by ({', '.join(SORTS)}) [date]: ").strip() or "date",
+    }
+    return {name: value for name, value in filters.items() if value}
+
+
+def list_expenses(tracker):
+    """Lists the user's expenses a page at a time, optionally filtered and sorted."""
+    if input("Press Enter to list everything, or 'f' to filter and sort: ").strip().lower() == "f":
+        browse(tracker, "Matching Expenses", **prompt_filters())
+    else:
+        browse(tracker, "Expense List")
+
+
+def search_expenses(tracker):
+    """Finds expenses by words from their description or category, optionally within dates or one category."""
+    query = input("Search for (words or their beginnings, e.g. 'uber' or 'groc'): ").strip()
+    if not query:
+        print("[!] Nothing to search for.")
+        return
+    print("Press Enter to skip a filter.")
+    filters = {
+        "start_date": input("From date (YYYY-MM-DD): ").strip(),
+        "end_date": input("To date (YYYY-MM-DD): ").strip(),
+        "category": input("Category: ").strip(),
+    }
+    browse(tracker, f"Search: {query}", sort="-date", search=query,
+           **{name: value for name, value in filters.items() if value})
+
+
+def list_expenses_between(tracker):
+    """Prompts for a date range and lists the expenses that fall inside it, a page at a time."""
+    start_date = input("Enter start date (YYYY-MM-DD): ").strip()
+    end_date = input("Enter end date (YYYY-MM-DD): ").strip()
+    try:
+        validate_date(start_date), validate_date(end_date)
+    except ValueError as e:
+        print(f"[!] {e}")
+        return
+    browse(tracker, f"Expenses {start_date} to {end_date}", start_date=start_date, end_date=end_date)
+
+
+def choose_expense(tracker, action):
+    """Asks for an expense ID; pressing Enter first searches by filter and pages through the matches."""
+    while True:
+        answer = input(f"Enter Expense ID to {action}, or press Enter to search: ").strip()
+        if answer:
+            break
+        browse(tracker, "Matching Expenses", **prompt_filters())
+    try:
+        return int(answer)
+    except ValueError:
+        print("[!] Invalid Expense ID.")
+        return None
+
+
+def edit_expense(tracker):
+    """Allows the user to edit an existing expense."""
+    expense_id = choose_expense(tracker, "edit")
+    if expense_id is None:
+        return
+    expense = tracker.get(expense_id)
+    if expense is None:
+        print("[!] Expense ID not found.")
+        return
+    print(format_expense(expense))
+    try:
+        new_amount = input("Enter new amount: ").strip()
+        new_description = input("Enter new description: ").strip()
+        tracker.update(expense_id, amount=new_amount, description=new_description)
+        print("[+] Expense updated successfully.")
+    except ValueError as e:
+        print(f"[!] Invalid input. {e}")
+
+
+def delete_expense(tracker):
+    """Allows the user to delete an expense."""
+    expense_id = choose_expense(tracker, "delete")
+    if expense_id is None:
+        return
+    try:
+        tracker.delete(expense_id)
+        print("[+] Expense deleted successfully.")
+    except ValueError as e:
+        print(f"[!] {e}")
+
+
+def view_summary(tracker):
+    """Displays a summary of the user's expenses for a month or month range."""
+    period = input("Enter month (YYYY-MM), range (YYYY-MM:YYYY-MM) or press Enter for this month: ").strip()
+    start_month, _, end_month = period.partition(":")
+    try:
+        summary = tracker.summary(start_month or None, end_month or None)
+    except ValueError as e:
+        print(f"[!] {e}")
+        return
+
+    if summary["start_month"] == summary["end_month"]:
+        period = summary["start_month"]
+    else:
+        period = f"{summary['start_month']} to {summary['end_month']}"
+    print(f"\n------ Expense Summary ({period}) ------")
+    print(f"Total Expenses: {summary['total']:.2f}")
+
+    if summary["start_month"] == summary["end_month"]:
+        if summary["budget"] is not None:
+            print(f"Budget for {period}: {summary['budget']:.2f}")
+            print(f"Remaining Budget: {summary['remaining']:.2f}")
+            if summary["total"] > summary["budget"]:
+                print("[!] Warning: You have exceeded your budget!")
+            else:
+                print("[i] You are within your budget.")
+        else:
+            print(f"[i] No budget set for {period}.")
+
+    print("\nExpenses by Category:")
+    for cat, amt in summary["by_category"].items():
+        print(f"  {cat:<20}: {amt:.2f}")
+
+
+def set_budget(tracker):
+    """Prompts for a period, an optional category and an amount and stores the budget."""
+    period = input("Enter budget period (YYYY-MM for a month, or e.g. 30d for any 30 days): ").strip()
+    category = input("Enter category, or press Enter to budget all spending: ").strip() or None
+    try:
+        amount = float(input("Enter budget amount: ").strip())
+    except ValueError:
+        print("[!] Invalid budget amount. Please enter a numeric value.")
+        return
+    try:
+        tracker.set_budget(period, amount, category)
+        print(f"[+] Budget set for {period}{f' ({category})' if category else ''}: {amount:.2f}")
+    except ValueError as e:
+        print(f"[!] {e}")
+
+
+def view_budgets(tracker):
+    """Shows spending so far against every budget in force today."""
+    status = tracker.budget_status()
+    if not status:
+        print("[i] No budgets apply today. Set one from the menu.")
+        return
+    print("\n------ Budgets ------")
+    for entry in status:
+        days = rolling_days(entry["period"])
+        scope = f"last {days} days" if days else entry["period"]
+        name = f"{scope} ({entry['category']})" if entry["category"] else scope
+        percent = f"{entry['percent']:.0f}%" if entry["percent"] is not None else "-"
+        print(f"  {name:<30}: {entry['spent']:.2f} of {entry['limit']:.2f} ({percent})")
+        if entry["remaining"] < 0:
+            print(f"  [!] Over budget by {-entry['remaining']:.2f}.")
 
 
 def user_menu(auth, user_trackers):
@@ -134,31 +397,35 @@ def user_menu(auth, user_trackers):
         print("\n=== User Menu ===")
         print("1. Add Expense")
         print("2. View Expenses")
-        print("3. Edit Expense")
-        print("4. Delete Expense")
-        print("5. Set Budget")
-        print("6. View Summary")
-        print("7. Logout")
+        print("3. Search Expenses")
+        print("4. Edit Expense")
+        print("5. Delete Expense")
+        print("6. Set Budget")
+        print("7. View Budgets")
+        print("8. View Summary")
+        print("9. View Expenses by Date Range")
+        print("10. Logout")
         choice = input("Enter choice: ").strip()
 
         if choice == "1":
-            tracker.add_expense()
+            add_expense(tracker)
         elif choice == "2":
-            tracker.list_expenses()
+            list_expenses(tracker)
         elif choice == "3":
-            tracker.edit_expense()
+            search_expenses(tracker)
         elif choice == "4":
-            tracker.delete_expense()
+            edit_expense(tracker)
         elif choice == "5":
-            period = input("Enter budget period (YYYY-MM): ").strip()
-            try:
-                amount = float(input("Enter budget amount: ").strip())
-                tracker.set_budget(period, amount)
-            except ValueError:
-                print("[!] Invalid budget amount. Please enter a numeric value.")
+            delete_expense(tracker)
         elif choice == "6":
-            tracker.view_summary()
+            set_budget(tracker)
         elif choice == "7":
+            view_budgets(tracker)
+        elif choice == "8":
+            view_summary(tracker)
+        elif choice == "9":
+            list_expenses_between(tracker)
+        elif choice == "10":
             print("[-] Logging out...")
             auth.logout()
             break
@@ -166,7 +433,6 @@ def user_menu(auth, user_trackers):
             print("[!] Invalid choice. Please select a valid option.")
 
 
-
 def run_app():
     auth = Authentication()
     create_admin(auth)
@@ -174,10 +440,174 @@ def run_app():
     while True:
         user = main_menu(auth)
         if user.role == "admin":
-            admin_menu()
+            admin_menu(user)
         else:
             user_menu(auth, user_trackers)
 
 
+def check_rollups(rebuild=False):
+    """Verifies every user's rollup table against their raw expenses, optionally rebuilding it."""
+    drifted = 0
+    for user_data in get_storage().users():
+        tracker = ExpenseTracker(User(**user_data))
+        drift = tracker.verify_rollups(rebuild)
+        for month, category, have, want in drift:
+            print(f"[!] User {user_data['user_id']} {month} category {category}: "
+                  f"stored {have:.2f}, expected {want:.2f}")
+        drifted += len(drift)
+    if not drifted:
+        print("[✔] All rollups match the recorded expenses.")
+    elif rebuild:
+        print(f"[+] Rebuilt rollups ({drifted} cells had drifted).")
+    else:
+        print(f"[!] {drifted} rollup cells drifted. Run with --rebuild-rollups to repair them.")
+
+
+def find_user(username, auth=None):
+    """Returns the stored User with this username, or None, through the username index."""
+    user = (auth or Authentication()).find_user(username)
+    if user is None:
+        print(f"[!] Unknown user '{username}'.")
+    return user
+
+
+def import_statement(path, username, rules_path=None, default_category=None, debit_sign=None):
+    """Bulk-imports a bank statement into a user's expenses."""
+    user = find_user(username)
+    if user is None:
+        return
+    rules = load_rules(rules_path) if rules_path else None
+    try:
+        stats = import_file(ExpenseTracker(user), path, rules, default_category, debit_sign=debit_sign)
+    except (OSError, ValueError) as e:
+        print(f"[!] Import failed: {e}")
+        return
+    print(f"[+] Import finished: {stats}")
+
+
+def run_batch(path, username):
+    """Runs a file of tracker commands for one user in a single process and commit."""
+    user = find_user(username)
+    if user is None:
+        return
+    try:
+        run_batch_file(ExpenseTracker(user), path)
+    except OSError as e:
+        print(f"[!] Batch failed: {e}")
+
+
+def log_report(path, burst_threshold, burst_window, top, json_path=None):
+    """Prints failed-login bursts, per-user daily activity and the slowest operations found in the logs."""
+    from log_analytics import log_files, analyze, print_report
+    paths = log_files(path)
+    if not paths:
+        print(f"[!] No log files found for {path}.")
+        return
+    report = analyze(paths, burst_threshold, burst_window, top)
+    print_report(report, top)
+    if json_path:
+        import json
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"[+] Full report written to {json_path}.")
+
+
 if __name__ == "__main__":
-    run_app()
+    parser = argparse.ArgumentParser(description="Cha-Ching $$ - Personal Expense Tracker")
+    parser.add_argument("--backend", choices=BACKENDS,
+                        help="storage backend (default: $CHACHING_BACKEND or json)")
+    parser.add_argument("--migrate-to-sqlite", metavar="DB_FILE",
+                        help="copy all JSON data (users, categories, shards) into a SQLite database")
+    parser.add_argument("--export-snapshot", metavar="FILE",
+                        help="write all JSON data to a compact binary snapshot")
+    parser.add_argument("--import-snapshot", metavar="FILE",
+                        help="restore data.json and every shard from a binary snapshot")
+    parser.add_argument("--verify-rollups", action="store_true",
+                        help="recompute monthly rollups from raw expenses and report drift")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="like --verify-rollups, but also repair any drift")
+    parser.add_argument("--import", dest="import_path", metavar="FILE",
+                        help="bulk-import a bank statement (.csv or .ofx) for --user")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run tracker commands (add/update/delete/get/query/summary/budget) from FILE for --user")
+    parser.add_argument("--alert-thresholds", metavar="PERCENTS",
+                        help="budget percentages that raise an alert when crossed "
+                             "(default: $CHACHING_ALERT_THRESHOLDS or 50,80,100)")
+    parser.add_argument("--user", help="username for --import or --batch")
+    parser.add_argument("--rules", help="JSON file mapping description keywords to categories")
+    parser.add_argument("--default-category", help="category for rows no rule matches")
+    parser.add_argument("--debit-sign", choices=DEBIT_SIGNS,
+                        help="sign of spending in the statement (default: negative, or positive for a CSV "
+                             "'debit' column); rows with the other sign are credits and are skipped")
+    parser.add_argument("--metrics-json", metavar="FILE",
+                        help="write the performance report (counts, latency percentiles, I/O) to FILE on exit")
+    parser.add_argument("--no-metrics", action="store_true", help="turn instrumentation off")
+    parser.add_argument("--serve", action="store_true", help="run the JSON-over-HTTP API server instead of the menus")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port for --serve (default: 8080)")
+    parser.add_argument("--log-json", action="store_true",
+                        help="write app.log as JSON lines (default: $CHACHING_LOG_FORMAT or text)")
+    parser.add_argument("--log-max-bytes", type=int, default=applog.MAX_BYTES,
+                        help="rotate app.log once it reaches this size (default: 10 MiB)")
+    parser.add_argument("--log-backups", type=int, default=applog.BACKUP_COUNT,
+                        help="rotated log files to keep (default: 5)")
+    parser.add_argument("--log-rotate-when", metavar="WHEN",
+                        help="rotate by time instead of size, e.g. 'midnight' or 'H'")
+    parser.add_argument("--log-report", nargs="?", const=applog.LOG_FILE, metavar="LOG_FILE",
+                        help="analyze LOG_FILE and its rotated files (default: app.log) and exit")
+    parser.add_argument("--burst-threshold", type=int, default=5,
+                        help="failed logins that count as a burst for --log-report (default: 5)")
+    parser.add_argument("--burst-window", type=int, default=60,
+                        help="seconds those failures must fall within (default: 60)")
+    parser.add_argument("--log-top", type=int, default=10, help="rows per --log-report table (default: 10)")
+    parser.add_argument("--log-report-json", metavar="FILE", help="also write the full --log-report to FILE")
+    args = parser.parse_args()
+    applog.configure(json_lines=True if args.log_json else None, max_bytes=args.log_max_bytes,
+                     backup_count=args.log_backups, when=args.log_rotate_when)
+    if args.backend:
+        use_backend(args.backend)
+    if args.alert_thresholds:
+        try:
+            use_thresholds(args.alert_thresholds)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.no_metrics:
+        metrics.disable()
+    if args.metrics_json:
+        import atexit
+        atexit.register(metrics.export_json, args.metrics_json)
+
+    if args.log_report:
+        log_report(args.log_report, args.burst_threshold, args.burst_window, args.log_top, args.log_report_json)
+    elif args.migrate_to_sqlite:
+        from sqlite_storage import import_from_json
+        counts = import_from_json(args.migrate_to_sqlite)
+        print(f"[+] Copied into {args.migrate_to_sqlite}: " + ", ".join(f"{n} {kind}" for kind, n in counts.items()))
+    elif args.export_snapshot:
+        from snapshot import json_to_snapshot
+        count = json_to_snapshot(args.export_snapshot)
+        print(f"[+] Wrote {count} users to {args.export_snapshot}.")
+    elif args.import_snapshot:
+        from snapshot import snapshot_to_json
+        try:
+            count = snapshot_to_json(args.import_snapshot)
+        except (OSError, ValueError) as e:
+            print(f"[!] Snapshot import failed: {e}")
+        else:
+            print(f"[+] Restored {count} users from {args.import_snapshot}.")
+    elif args.verify_rollups or args.rebuild_rollups:
+        check_rollups(rebuild=args.rebuild_rollups)
+    elif args.import_path:
+        if not args.user:
+            parser.error("--import requires --user")
+        import_statement(args.import_path, args.user, args.rules, args.default_category, args.debit_sign)
+    elif args.batch:
+        if not args.user:
+            parser.error("--batch requires --user")
+        run_batch(args.batch, args.user)
+    elif args.serve:
+        from server import run_server
+        create_admin()
+        run_server(args.host, args.port)
+    else:
+        run_app()
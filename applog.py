@@ -0,0 +1,184 @@
+# applog.py - Queue-Based, Rotating, Optionally Structured Logging Shared by Every Module
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so only one process should write the log at a time
+    fcntl = None
+
+LOG_FILE = "app.log"
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+MAX_BYTES = 10 * 1024 * 1024    # Size at which app.log rolls over to app.log.1 (size-based rotation)
+BACKUP_COUNT = 5                # Rotated files kept
+ROTATE_WHEN = None              # e.g. "midnight" or "H" for time-based rotation instead of size-based
+JSON_LINES = os.environ.get("CHACHING_LOG_FORMAT", "text") == "json"
+
+# Structured fields copied from a record into JSON output when present
+FIELDS = ("user_id", "operation", "latency_ms", "ok", "username")
+
+ops_logger = logging.getLogger("chaching.ops")
+_context = contextvars.ContextVar("chaching_log_context", default=None)
+_listener = None
+_queue_handler = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, msg plus any structured fields set on the record."""
+
+    def format(self, record):
+        entry = {"ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+                 "level": record.levelname, "msg": record.getMessage()}
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class SharedRotation:
+    """Mixin that lets several processes write and rotate one log file (app, batch, import and server processes
+    may share a data directory).
+
+    Each record is written under an exclusive lock on <log>.lock. A process that finds the file was rotated
+    away by another one reopens the new file instead of rotating again, so records never land in a rotated
+    file and no backup is renamed twice.
+    """
+
+    def _open(self):
+        if fcntl is not None and getattr(self, "_lock_fd", None) is None:
+            self._lock_fd = os.open(self.baseFilename + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        return super()._open()
+
+    def emit(self, record):
+        if fcntl is None:
+            super().emit(record)
+            return
+        if self.stream is None:
+            self.stream = self._open()
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            self._follow_rotation()
+            super().emit(record)
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _follow_rotation(self):
+        """Reopens the log if another process rotated it since this one last wrote."""
+        try:
+            current = os.stat(self.baseFilename).st_ino
+        except FileNotFoundError:
+            current = None
+        if self.stream is not None and current == os.fstat(self.stream.fileno()).st_ino:
+            return
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self._open()
+        if hasattr(self, "rolloverAt"):  # Time-based: the other process rolled over for this period already
+            self.rolloverAt = self.computeRollover(time.time())
+
+    def close(self):
+        super().close()
+        if getattr(self, "_lock_fd", None) is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+class SharedRotatingFileHandler(SharedRotation, logging.handlers.RotatingFileHandler):
+    """Size-based rotation that is safe with several writing processes (see SharedRotation)."""
+
+
+class SharedTimedRotatingFileHandler(SharedRotation, logging.handlers.TimedRotatingFileHandler):
+    """Time-based rotation that is safe with several writing processes (see SharedRotation)."""
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the user_id/operation of the tracker call they were logged from."""
+
+    def filter(self, record):
+        context = _context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+def configure(path=LOG_FILE, json_lines=None, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT,
+              when=ROTATE_WHEN):
+    """Routes the root logger through a queue to a background thread that writes a rotating log file.
+
+    Callers only pay for putting the record on the queue; formatting and disk writes happen on the
+    listener thread. Several processes may log to the same path; rotation is coordinated through a lock file
+    (see SharedRotation), except on platforms without fcntl, where only one process should write it. Calling
+    it again replaces the previous setup (flushing it first).
+    """
+    global _listener, _queue_handler
+    json_lines = JSON_LINES if json_lines is None else json_lines
+    if when:
+        handler = SharedTimedRotatingFileHandler(path, when=when, backupCount=backup_count, encoding="utf-8")
+    else:
+        handler = SharedRotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT))
+
+    root = logging.getLogger()
+    shutdown()
+    _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(ContextFilter())
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, handler)
+    _listener.start()
+
+def shutdown():
+    """Flushes queued records to disk and detaches the queue handler."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()  # Drains the queue before returning
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+def ensure_configured():
+    """Sets up logging with the defaults unless a caller already did."""
+    if _listener is None:
+        configure()
+
+atexit.register(shutdown)
+
+
+def operation(name):
+    """Decorator for ExpenseTracker methods: records logged inside the call carry its user_id and operation,
+    and one 'op' record with the latency is logged when the outermost call ends."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if _context.get() is not None:
+                return func(self, *args, **kwargs)  # Nested call (update -> get); the outer one is logged
+            user_id = self.user.user_id
+            token = _context.set({"user_id": user_id, "operation": name})
+            start = time.perf_counter()
+            ok = False
+            try:
+                result = func(self, *args, **kwargs)
+                ok = True
+                return result
+            finally:
+                _context.reset(token)
+                latency = round((time.perf_counter() - start) * 1000, 3)
+                ops_logger.info(f"op={name} user_id={user_id} latency_ms={latency} ok={ok}",
+                                extra={"user_id": user_id, "operation": name, "latency_ms": latency, "ok": ok})
+        return wrapper
+    return decorate
@@ -1,49 +1,166 @@
 # auth.py - Handles User Authentication with Password Encryption
-import itertools
 import logging
 import datetime
+import math
+import time
+from collections import deque
+import metrics
 from models import User
-from file_manager import load_data, save_data, hash_password, verify_password
+from file_manager import hash_password, verify_password
+from storage import get_storage
+
+FREE_ATTEMPTS = 5        # Failed logins a username gets before backoff starts
+BASE_DELAY = 1.0         # Seconds of the first lockout; each further failure doubles it
+MAX_DELAY = 300.0        # Longest lockout, per username or global
+FORGET_AFTER = 900.0     # Seconds without a failure after which a username's count starts over
+GLOBAL_LIMIT = 200       # Failed logins across all usernames ...
+GLOBAL_WINDOW = 10.0     # ... within this many seconds lock every login out for a while
+MAX_TRACKED = 100_000    # Usernames with failures remembered; the least recently failed are forgotten first
+
+
+class LoginThrottled(Exception):
+    """Raised by authenticate() while a username, or every login, is backing off after failed attempts."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many failed login attempts. Try again in {math.ceil(retry_after)} s.")
+        self.retry_after = retry_after
+
+
+class LoginThrottle:
+    """In-memory failed-login tracking with exponential backoff, per username and across all usernames."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._failures = {}  # username -> (failures, locked until, last failure); least recent first
+        self._recent = deque(maxlen=GLOBAL_LIMIT)  # Times of the latest failures across all usernames
+        self._global_until = 0.0
+        self._global_delay = BASE_DELAY
+
+    def check(self, username):
+        """Raises LoginThrottled if this attempt must be rejected before the password is looked at."""
+        now = self.clock()
+        if now < self._global_until:
+            raise LoginThrottled(self._global_until - now)
+        entry = self._failures.get(username)
+        if entry is not None and now < entry[1]:
+            raise LoginThrottled(entry[1] - now)
+
+    def failed(self, username):
+        """Counts a failed attempt and starts the username's (and possibly the global) backoff."""
+        now = self.clock()
+        failures, _, last = self._failures.pop(username, (0, 0.0, now))
+        failures = 1 if now - last > FORGET_AFTER else failures + 1
+        locked_until = 0.0
+        if failures >= FREE_ATTEMPTS:
+            locked_until = now + min(BASE_DELAY * 2 ** min(failures - FREE_ATTEMPTS, 16), MAX_DELAY)
+        self._failures[username] = (failures, locked_until, now)  # Re-inserted, so it is now the most recent
+        if len(self._failures) > MAX_TRACKED:
+            del self._failures[next(iter(self._failures))]
+
+        if self._recent and now - self._recent[-1] > GLOBAL_WINDOW:
+            self._global_delay = BASE_DELAY  # A quiet spell resets the global backoff
+        self._recent.append(now)
+        if len(self._recent) == GLOBAL_LIMIT and now - self._recent[0] <= GLOBAL_WINDOW:
+            self._global_until = now + self._global_delay
+            self._global_delay = min(self._global_delay * 2, MAX_DELAY)
+            self._recent.clear()
+            logging.warning(f"{GLOBAL_LIMIT} failed logins within {GLOBAL_WINDOW:g} s; "
+                            f"all logins paused for {self._global_until - now:g} s.")
+
+    def succeeded(self, username):
+        """Clears the username's failure count."""
+        self._failures.pop(username, None)
+
 
 class Authentication:
     def __init__(self):
-        """Initializes the authentication system and loads user data."""
-        data = load_data()
-        self.users = [User(**user) for user in data["users"]]
-        if self.users:
-            max_id = max(user.user_id for user in self.users)
-            User._id_counter = itertools.count(max_id + 1)
+        """Initializes the authentication system; user records are loaded on the first lookup, not here."""
+        self.by_username = None  # username -> stored user record, built on first lookup
+        self._loaded = 0         # Users in storage when by_username was built
+        self.throttle = LoginThrottle()
         self.current_user = None
 
+    def _load(self, records):
+        """Builds the username -> record index; User objects are only made for the users that are looked up."""
+        self.by_username = {record["username"]: record for record in records}
+        self._loaded = len(records)
+
+    def _sync_users(self):
+        """Picks up users registered by other processes; users are never removed, so a count change is enough."""
+        storage = get_storage()
+        if self.by_username is None or storage.user_count() != self._loaded:
+            self._load(storage.users())
+
+    def find_user(self, username):
+        """Returns the User with this username, or None, in O(1)."""
+        record = self.by_username.get(username) if self.by_username is not None else None
+        if record is None:
+            self._sync_users()  # First lookup, or possibly registered by another process since we loaded
+            record = self.by_username.get(username)
+        return User(**record) if record is not None else None
+
+    def create_user(self, username: str, password: str, role: str = "user"):
+        """Stores a new user and returns it; raises ValueError if the username is taken. No terminal output."""
+        if self.find_user(username) is not None:
+            raise ValueError(f"Username '{username}' already exists.")
+        # The storage assigns the user ID and re-checks the username under its lock, so two processes cannot
+        # both claim it
+        record = get_storage().add_user({"user_id": None, "username": username,
+                                         "password": hash_password(password), "role": role})
+        self.by_username[username] = record
+        self._loaded += 1
+        new_user = User(**record)
+        logging.info(f"User '{username}' registered successfully.",
+                     extra={"operation": "register", "username": username, "user_id": new_user.user_id})
+        return new_user
+
+    @metrics.timed("auth.login")
+    def authenticate(self, username: str, password: str):
+        """Returns the User if the username and password match, otherwise None. No terminal output.
+
+        Raises LoginThrottled, without hashing anything, while the username or all logins are backing off.
+        """
+        try:
+            self.throttle.check(username)
+        except LoginThrottled:
+            metrics.count("auth.throttled")
+            raise
+        user = self.find_user(username)
+        if user is not None and verify_password(user.password, password):
+            self.throttle.succeeded(username)
+            return user
+        self.throttle.failed(username)
+        metrics.count("auth.failed_logins")
+        logging.warning(f"Failed login attempt for username '{username}'",
+                        extra={"operation": "login_failed", "username": username})
+        return None
+
     def register(self, username: str, password: str, role: str = "user"):
         """Registers a new user, ensuring the username is unique."""
-        if any(user.username == username for user in self.users):
+        try:
+            new_user = self.create_user(username, password, role)
+        except ValueError:
             logging.warning(f"Registration failed: Username '{username}' already exists.")
             print("[!] Username already exists. Choose another one.")
             return None
-
-        new_user = User(username, hash_password(password), role)
-        self.users.append(new_user)
-
-        data = load_data()
-        data["users"].append(vars(new_user))
-        save_data(data)
-
-        logging.info(f"User '{username}' registered successfully.")
         print("[+] Registration successful:", new_user)
         return new_user
 
     def login(self, username: str, password: str) -> bool:
         """Logs in a user if the username and password match."""
-        for user in self.users:
-            if user.username == username and verify_password(user.password, password):
-                self.current_user = user
-                logging.info(f"User '{username}' logged in successfully.")
-                print("[+] Login successful:", user)
-                return True
-        logging.warning(f"Failed login attempt for username '{username}'")
-        print("[!] Invalid username or password.")
-        return False
+        try:
+            user = self.authenticate(username, password)
+        except LoginThrottled as e:
+            print(f"[!] {e}")
+            return False
+        if user is None:
+            print("[!] Invalid username or password.")
+            return False
+        self.current_user = user
+        logging.info(f"User '{username}' logged in successfully.",
+                     extra={"operation": "login", "username": username, "user_id": user.user_id})
+        print("[+] Login successful:", user)
+        return True
 
     def logout(self):
         """Logs out the current user."""
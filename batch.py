@@ -0,0 +1,60 @@
+# batch.py - Runs Tracker Operations from a Command File with a Single Load and Commit
+import json
+import logging
+import shlex
+
+# Command name -> (tracker method, positional argument converters)
+COMMANDS = {
+    "add": ("add", (float, str, str, str)),
+    "update": ("update", (int,)),
+    "delete": ("delete", (int,)),
+    "get": ("get", (int,)),
+    "query": ("query", (str, str, str)),
+    "page": ("page", (int, str, str)),
+    "summary": ("summary", (str, str)),
+    "budget": ("set_budget", (str, float)),
+}
+
+
+def parse_command(line):
+    """Splits 'name arg1 arg2 key=value ...' into (name, args, kwargs); returns None for blanks and comments."""
+    tokens = shlex.split(line, comments=True)
+    if not tokens:
+        return None
+    name, *rest = tokens
+    if name not in COMMANDS:
+        raise ValueError(f"Unknown command '{name}'.")
+    _, converters = COMMANDS[name]
+    args = [token for token in rest if "=" not in token]
+    kwargs = dict(token.split("=", 1) for token in rest if "=" in token)
+    if len(args) > len(converters):
+        raise ValueError(f"Too many arguments for '{name}'.")
+    args = [convert(arg) for convert, arg in zip(converters, args)]
+    return name, args, kwargs
+
+
+def run_batch(tracker, lines):
+    """Runs every command against one tracker, yielding a result dict per command; all writes commit together."""
+    with tracker.store.batch():
+        for number, line in enumerate(lines, start=1):
+            try:
+                command = parse_command(line)
+                if command is None:
+                    continue
+                name, args, kwargs = command
+                result = getattr(tracker, COMMANDS[name][0])(*args, **kwargs)
+                yield {"line": number, "command": name, "ok": True, "result": result}
+            except (TypeError, ValueError) as e:
+                logging.warning(f"Batch line {number} failed: {e}")
+                yield {"line": number, "ok": False, "error": str(e)}
+
+
+def run_batch_file(tracker, path):
+    """Runs a command file and prints one JSON result per line."""
+    with open(path) as f:
+        results = list(run_batch(tracker, f))
+    for result in results:
+        print(json.dumps(result))
+    failed = sum(1 for result in results if not result["ok"])
+    logging.info(f"Batch {path} for user {tracker.user.user_id}: {len(results)} commands, {failed} failed.")
+    return results
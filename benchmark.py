@@ -0,0 +1,807 @@
+# benchmark.py - Micro-Benchmarks for Storage and Lookup Paths
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect_left, bisect_right, insort
+from columns import ExpenseColumns
+
+CATEGORIES = ["Food", "Rent", "Utilities", "Transport", "Entertainment", "Miscellaneous"]
+CATEGORY_WEIGHTS = [40, 8, 12, 20, 12, 8]  # Skewed: most expenses are food and transport, few are rent
+CATEGORY_AMOUNTS = {"Food": (5, 80), "Rent": (700, 2000), "Utilities": (30, 250), "Transport": (2, 60),
+                    "Entertainment": (10, 150), "Miscellaneous": (1, 300)}
+CATEGORY_IDS = {name: number for number, name in enumerate(CATEGORIES, start=1)}  # As generate_dataset stores them
+DATASET_START = datetime.date(2022, 1, 1)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_expenses(count, user_id=1, seed=42):
+    """Generates a shard-style {expense_id: record} mapping spread over three years."""
+    rng = random.Random(seed)
+    start = datetime.date(2023, 1, 1)
+    expenses = {}
+    for expense_id in range(1, count + 1):
+        expenses[str(expense_id)] = {
+            "expense_id": expense_id,
+            "amount": round(rng.uniform(1, 500), 2),
+            "category_id": CATEGORY_IDS[rng.choice(CATEGORIES)],
+            "description": f"Expense {expense_id}",
+            "user_id": user_id,
+            "date": (start + datetime.timedelta(days=rng.randrange(3 * 365))).strftime("%Y-%m-%d"),
+        }
+    return expenses
+
+
+def generate_dataset(users, expenses, years=3, seed=42):
+    """Writes a synthetic data.json plus one shard per user into the working directory.
+
+    Every user gets expenses spread over years of dates with a skewed category mix and a budget for
+    each month they spent in. The admin logs in with adminpass, user<N> with password.
+    """
+    import file_manager
+    from rollups import build_rollups
+
+    rng = random.Random(seed)
+    days = (DATASET_START.replace(year=DATASET_START.year + years) - DATASET_START).days
+    ordinals = [DATASET_START.toordinal() + day for day in range(days)]
+    dates = [datetime.date.fromordinal(ordinal).isoformat() for ordinal in ordinals]
+    records = [{"user_id": 0, "username": "admin", "password": file_manager.hash_password("adminpass"),
+                "role": "admin"}]
+    password = file_manager.hash_password("password")
+    for user_id in range(1, users + 1):
+        records.append({"user_id": user_id, "username": f"user{user_id}", "password": password, "role": "user"})
+        shard = {}
+        for expense_id, category in enumerate(rng.choices(CATEGORIES, CATEGORY_WEIGHTS, k=expenses), start=1):
+            low, high = CATEGORY_AMOUNTS[category]
+            shard[str(expense_id)] = {"expense_id": expense_id, "amount": round(rng.uniform(low, high), 2),
+                                      "category_id": CATEGORY_IDS[category],
+                                      "description": f"{category} purchase {expense_id}",
+                                      "user_id": user_id, "date": rng.choice(dates)}
+        budgets = {month: float(rng.randrange(1500, 4000, 100)) for month in {exp["date"][:7]
+                                                                                for exp in shard.values()}}
+        file_manager.user_store(user_id).save({"expenses": shard, "budgets": budgets,
+                                               "rollups": build_rollups(shard.values()),
+                                               "meta": {"next_expense_id": expenses + 1}})
+    categories = {str(n): {"category_id": n, "name": name, "user_id": 0, "used": True}
+                  for name, n in CATEGORY_IDS.items()}
+    file_manager.store.save({"users": records, "categories": categories,
+                             "meta": {"next_user_id": users + 1, "next_category_id": len(CATEGORIES) + 1,
+                                      "categories_by_id": True}})
+    return records
+
+
+def measure(label, func, repeat=1, setup=None):
+    """Times func repeat times (running setup untimed before each call) and prints and returns latency stats."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    stats = {"runs": repeat, "mean_ms": sum(samples) / repeat, "p50_ms": percentile(samples, 50),
+             "p95_ms": percentile(samples, 95), "min_ms": samples[0]}
+    print(f"  {label:<40}{stats['p50_ms']:>12.4f}{stats['p95_ms']:>12.4f}{stats['mean_ms']:>12.4f}")
+    return stats
+
+
+def quietly(func, *args):
+    """Calls func with its terminal output discarded."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def timed(label, func, repeat=1):
+    """Runs func repeat times and prints the mean latency."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<40}{elapsed * 1000:>12.4f} ms")
+    return result
+
+
+class ExpenseIndex:
+    """Hash index by expense ID plus a date-sorted index searched with bisect over plain expense dicts; the
+    baseline the index and memory benchmarks compare ExpenseColumns against."""
+
+    def __init__(self, expenses):
+        """Builds both indexes from a shard's {expense_id: record} mapping."""
+        self.by_id = {exp["expense_id"]: exp for exp in expenses.values()}
+        self.by_date = sorted((exp["date"], exp["expense_id"]) for exp in expenses.values())
+
+    def get(self, expense_id):
+        return self.by_id.get(expense_id)
+
+    def add(self, expense):
+        self.by_id[expense["expense_id"]] = expense
+        insort(self.by_date, (expense["date"], expense["expense_id"]))
+
+    def remove(self, expense_id):
+        expense = self.by_id.pop(expense_id)
+        del self.by_date[bisect_left(self.by_date, (expense["date"], expense_id))]
+
+    def between(self, start_date, end_date):
+        """Returns expenses dated from start_date to end_date inclusive, oldest first, in O(log n + k)."""
+        lo = bisect_left(self.by_date, (start_date,))
+        hi = bisect_right(self.by_date, (end_date, float("inf")))
+        return [self.by_id[expense_id] for _, expense_id in self.by_date[lo:hi]]
+
+
+def bench_index(count):
+    """Compares indexed edit/delete/range lookups against the linear scans they replace."""
+    print(f"\n--- Expense index, {count} expenses ---")
+    expenses = make_expenses(count)
+    as_list = list(expenses.values())
+    rng = random.Random(7)
+    targets = [rng.randrange(1, count + 1) for _ in range(100)]
+
+    index = timed("build index", lambda: ExpenseIndex(expenses))
+    timed("find by id: linear scan", lambda: [next(e for e in as_list if e["expense_id"] == t)
+                                              for t in targets[:10]], repeat=3)
+    timed("find by id: index (x10)", lambda: [index.get(t) for t in targets[:10]], repeat=100)
+    timed("delete: list rebuild", lambda: [e for e in as_list if e["expense_id"] != targets[0]], repeat=3)
+
+    def delete_and_restore():
+        expense = index.get(targets[0])
+        index.remove(targets[0])
+        index.add(expense)
+    timed("delete + re-add: index", delete_and_restore, repeat=100)
+    timed("range (1 month): full scan", lambda: [e for e in as_list if "2024-02-01" <= e["date"] <= "2024-02-29"],
+          repeat=3)
+    matches = timed("range (1 month): bisect", lambda: index.between("2024-02-01", "2024-02-29"), repeat=100)
+    print(f"  range matched {len(matches)} expenses")
+
+
+def bench_memory(count):
+    """Measures resident bytes per expense for shard dicts + index versus ExpenseColumns, Expense objects with and
+    without __slots__, and the drift of a float total against integer cents."""
+    print(f"\n--- Memory, {count} expenses ---")
+    text = json.dumps(make_expenses(count))  # Loaded back below, so strings are not shared as in a real shard
+
+    def allocated(build):
+        tracemalloc.start()
+        kept = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return kept, current, peak
+
+    def show(label, current, peak=None):
+        per_million = current / count * 1_000_000 / 2 ** 20
+        extra = f"  (peak {peak / 2 ** 20:,.0f} MB)" if peak else ""
+        print(f"  {label:<40}{current / count:>8.0f} B/expense{per_million:>10,.0f} MB per 1M{extra}")
+
+    def dicts_and_index():
+        expenses = json.loads(text)
+        return expenses, ExpenseIndex(expenses)
+    (expenses, _), before, before_peak = allocated(dicts_and_index)
+    show("dicts + index (before)", before, before_peak)
+    columns, after, after_peak = allocated(lambda: ExpenseColumns(json.loads(text).values()))
+    show("ExpenseColumns (after)", after, after_peak)
+    print(f"  {before / after:.1f}x smaller; columns report {columns.memory_bytes() / count:.0f} B/expense")
+
+    from models import Expense
+
+    class PlainExpense:
+        def __init__(self, amount, category_id, description, user_id, date, expense_id, category=None):
+            self.expense_id, self.amount, self.category_id = expense_id, amount, category_id
+            self.description, self.user_id, self.date, self.category = description, user_id, date, category
+
+    records = list(expenses.values())
+    for label, cls in (("Expense objects, no __slots__", PlainExpense), ("Expense objects, __slots__", Expense)):
+        _, size, _ = allocated(lambda: [cls(**record) for record in records])
+        show(label, size)
+
+    float_total = 0.0
+    for record in records:
+        float_total += record["amount"]
+    exact = sum(columns.cents)
+    print(f"  float total {float_total!r} vs cents total {exact // 100}.{exact % 100:02d} "
+          f"(drift {abs(float_total * 100 - exact) / 100:.2e})")
+
+
+def bench_backends(count):
+    """Compares add, list and summary latency of the JSON and SQLite backends for one user with count expenses."""
+    os.chdir(tempfile.mkdtemp(prefix="chaching-bench-"))  # Both backends use paths relative to the working dir
+    import storage
+    from expenses import ExpenseTracker
+    from models import User
+
+    rows = [(exp["amount"], CATEGORIES[exp["category_id"] - 1], exp["description"], exp["date"])
+            for exp in make_expenses(count).values()]
+    for backend in storage.BACKENDS:
+        print(f"\n--- {backend} backend, {count} expenses ---")
+        storage.use_backend(backend)
+        db = storage.get_storage()
+        for category_id, name in enumerate(CATEGORIES, start=1):
+            db.save_category({"category_id": category_id, "name": name, "user_id": 0})
+        tracker = ExpenseTracker(User("bench", "x", user_id=1))
+
+        def load():
+            for start in range(0, len(rows), 50_000):
+                tracker.add_many(rows[start:start + 50_000])
+        timed("bulk load", load)
+        timed("add (single expense)", lambda: tracker.add(12.5, "Food", "bench", "2024-06-01"), repeat=200)
+        timed("list all", tracker.query, repeat=3)
+        timed("list one month", lambda: tracker.query("2024-02-01", "2024-02-29"), repeat=20)
+        timed("summary one month", lambda: tracker.summary("2024-02"), repeat=100)
+        timed("summary one year", lambda: tracker.summary("2024-01", "2024-12"), repeat=100)
+
+
+def bench_search(count, years):
+    """Times full-text search of one JSON-backend user with count expenses: building the index, opening it from
+    its file, and pages of rare, prefix, common and filtered matches against the substring scan it replaces."""
+    import file_manager
+    import storage
+    from expenses import ExpenseTracker
+    from models import User
+
+    os.chdir(tempfile.mkdtemp(prefix="chaching-search-"))
+    print(f"\n--- Search, {count} expenses over {years} years ---")
+    generate_dataset(1, count, years)
+    user = User("user1", "x", user_id=1)
+
+    def reopen():
+        storage.get_storage()._users.clear()
+        file_manager._user_stores.clear()
+        tracker = ExpenseTracker(user)
+        tracker.page(1)  # Load the shard, so only the index is timed
+        return tracker
+    tracker = reopen()
+    timed("build index (first search)", lambda: tracker.page(20, search="food"))
+    print(f"  {'index file':<40}{os.path.getsize(file_manager.search_file(1)) / 1e6:>12.1f} MB")
+    tracker = reopen()
+    timed("open index file (first search)", lambda: tracker.page(20, search="food"))
+    word = str(count // 2)
+    timed(f"page: rare word '{word}'", lambda: tracker.page(20, search=word), repeat=100)
+    timed(f"page: prefix '{word[:-1]}'", lambda: tracker.page(20, search=word[:-1]), repeat=100)
+    timed("page: common word 'food'", lambda: tracker.page(20, search="food"), repeat=100)
+    timed("page: 'food' by amount", lambda: tracker.page(20, sort="-amount", search="food"), repeat=100)
+    timed("page: 'purchase' in Rent, one month",
+          lambda: tracker.page(20, search="purchase", category="Rent", start_date=f"{DATASET_START.year}-06-01",
+                               end_date=f"{DATASET_START.year}-06-30"), repeat=100)
+    timed("page: 'food 99' (two words)", lambda: tracker.page(20, search="food 99"), repeat=20)
+    timed(f"page: substring scan '{word}'", lambda: tracker.page(20, text=word), repeat=3)
+    timed("add (indexed)", lambda: tracker.add(12.5, "Food", "Bench lunch", f"{DATASET_START.year}-06-15"),
+          repeat=200)
+
+
+def _stress_worker(backend, directory, worker, user_id, adds):
+    """One writer process: registers a user under a deliberately colliding ID, then adds expenses one by one."""
+    os.chdir(directory)
+    import file_manager
+    import storage
+    from expenses import ExpenseTracker
+    from models import User
+
+    file_manager.COMPACT_THRESHOLD = 20  # Compact often so snapshot rewrites race with other writers' appends
+    storage.use_backend(backend)
+    storage.get_storage().add_user({"user_id": 1000, "username": f"stress-{worker}", "password": "x", "role": "user"})
+    tracker = ExpenseTracker(User(f"stress-{user_id}", "x", user_id=user_id))
+    for n in range(adds):
+        tracker.add(1.25, "Food", f"worker {worker} expense {n}", f"2024-{n % 12 + 1:02d}-15")
+
+
+def bench_stress(processes, adds):
+    """Runs concurrent writer processes (two per user) against each backend and checks nothing was lost.
+    Returns the number of problems found."""
+    ctx = multiprocessing.get_context("spawn")
+    found = 0
+    for backend in ("json", "sqlite"):
+        directory = tempfile.mkdtemp(prefix="chaching-stress-")
+        os.chdir(directory)
+        import storage
+        storage.use_backend(backend)
+        storage.get_storage().save_category({"category_id": 1, "name": "Food", "user_id": 0})
+
+        print(f"\n--- {backend} backend, {processes} processes x {adds} adds, {processes // 2 or 1} users ---")
+        workers = [ctx.Process(target=_stress_worker, args=(backend, directory, worker, worker // 2 + 1, adds))
+                   for worker in range(processes)]
+        start = time.perf_counter()
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - start
+        print(f"  {processes * adds} commits in {elapsed:.2f} s ({processes * adds / elapsed:.0f} commits/sec)")
+
+        storage.use_backend(backend)  # Fresh handles so every file is re-read from disk
+        db = storage.get_storage()
+        problems = [f"worker {w.pid} exited with {w.exitcode}" for w in workers if w.exitcode != 0]
+        users = [user for user in db.users() if user["username"].startswith("stress-")]
+        if len({user["user_id"] for user in users}) != processes:
+            problems.append(f"{len(users)} users registered, {len({u['user_id'] for u in users})} distinct IDs")
+        for user_id in range(1, (processes + 1) // 2 + 1):
+            shard = db.user(user_id)
+            expenses = shard.all()
+            writers = sum(1 for worker in range(processes) if worker // 2 + 1 == user_id)
+            descriptions = {exp["description"] for exp in expenses}
+            if len(expenses) != writers * adds or len(descriptions) != writers * adds:
+                problems.append(f"user {user_id}: expected {writers * adds} expenses, found {len(expenses)}")
+            if len({exp["expense_id"] for exp in expenses}) != len(expenses):
+                problems.append(f"user {user_id}: duplicate expense IDs")
+            total, _ = shard.summary("2024-01", "2024-12")
+            if round(total, 2) != round(1.25 * writers * adds, 2):
+                problems.append(f"user {user_id}: summary total {total} != {1.25 * writers * adds}")
+            if shard.verify_rollups():
+                problems.append(f"user {user_id}: rollups drifted")
+        for problem in problems:
+            print(f"  [!] {problem}")
+        print("  [✔] no lost or duplicated writes" if not problems else f"  [!] {len(problems)} problem(s)")
+        found += len(problems)
+    return found
+
+
+def bench_snapshot(users, count):
+    """Compares size and load time of pretty-printed JSON (monolithic and sharded) against the binary snapshot."""
+    from rollups import build_rollups
+    from snapshot import Snapshot, write_snapshot
+
+    directory = tempfile.mkdtemp(prefix="chaching-snapshot-")
+    print(f"\n--- Snapshot formats, {users} users x {count} expenses ---")
+    shards = {}
+    for user_id in range(1, users + 1):
+        expenses = make_expenses(count, user_id, seed=user_id)
+        shards[user_id] = {"expenses": expenses, "budgets": {"2024-01": 1500.0, "2024-02": 1200.0},
+                           "rollups": build_rollups(expenses.values()), "meta": {"next_expense_id": count + 1}}
+    global_data = {"users": [{"user_id": n, "username": f"user{n}", "password": "x" * 64, "role": "user"}
+                             for n in shards],
+                   "categories": {str(n): {"category_id": n, "name": name, "user_id": 0}
+                                  for n, name in enumerate(CATEGORIES, start=1)}}
+
+    monolithic = os.path.join(directory, "monolithic.json")
+    with open(monolithic, "w") as f:  # The pre-shard data.json layout, as save_data() used to write it
+        json.dump(dict(global_data, expenses={str(uid): list(shard["expenses"].values())
+                                              for uid, shard in shards.items()}), f, indent=4)
+    shard_paths = {}
+    for user_id, shard in shards.items():
+        shard_paths[user_id] = os.path.join(directory, f"user_{user_id}.json")
+        with open(shard_paths[user_id], "w") as f:
+            json.dump(shard, f, indent=4)
+    binary = os.path.join(directory, "snapshot.bin")
+    timed("write binary snapshot", lambda: write_snapshot(binary, global_data, shards.items()))
+    del shards
+
+    sharded_size = sum(os.path.getsize(path) for path in shard_paths.values())
+    print(f"  {'size: monolithic JSON':<40}{os.path.getsize(monolithic) / 1e6:>12.2f} MB")
+    print(f"  {'size: sharded JSON':<40}{sharded_size / 1e6:>12.2f} MB")
+    print(f"  {'size: binary snapshot':<40}{os.path.getsize(binary) / 1e6:>12.2f} MB")
+
+    def load_json(path):
+        with open(path) as f:
+            return json.load(f)
+
+    def load_binary_user(user_id):
+        with Snapshot(binary) as snapshot:
+            return list(snapshot.expenses(user_id))
+
+    def load_binary_all():
+        with Snapshot(binary) as snapshot:
+            return [list(snapshot.expenses(user_id)) for user_id in snapshot.user_ids()]
+
+    middle = users // 2 + 1
+    timed("load all: monolithic JSON", lambda: load_json(monolithic))
+    timed("load all: binary snapshot", load_binary_all)
+    timed("open one user: monolithic JSON", lambda: load_json(monolithic)["expenses"][str(middle)])
+    timed("open one user: JSON shard", lambda: load_json(shard_paths[middle]), repeat=3)
+    timed("open one user: binary snapshot", lambda: load_binary_user(middle), repeat=3)
+    timed("one user's budgets: binary snapshot", lambda: Snapshot(binary).budgets(middle), repeat=100)
+
+
+def bench_login(users, backend, attempts=20_000):
+    """Login throughput with a large user base: valid logins, wrong passwords, a brute-force burst on one
+    username and a password spray, compared against the linear scan the username index replaced."""
+    os.chdir(tempfile.mkdtemp(prefix="chaching-login-"))
+    print(f"\n--- Login, {backend} backend, {users} registered users, {attempts} attempts per case ---")
+    import auth as auth_module
+    import file_manager
+    import metrics
+    import storage
+    from auth import Authentication, LoginThrottle, LoginThrottled
+
+    started = time.perf_counter()
+    password = file_manager.hash_password("password")
+    file_manager.store.save({"users": [{"user_id": n, "username": f"user{n}", "password": password, "role": "user"}
+                                       for n in range(1, users + 1)], "categories": {}})
+    if backend == "sqlite":
+        from sqlite_storage import import_from_json
+        import_from_json(storage.SQLITE_FILE)
+    storage.use_backend(backend)
+    print(f"  users written in {time.perf_counter() - started:.1f} s")
+    auth = Authentication()
+    timed("first lookup (loads users, builds index)", lambda: auth.find_user("user1"))
+    rng = random.Random(3)
+    names = [f"user{rng.randrange(1, users + 1)}" for _ in range(attempts)]
+
+    def throughput(label, attempt, usernames=names):
+        auth.throttle = LoginThrottle()
+        metrics.reset()
+        outcomes = {"ok": 0, "failed": 0, "throttled": 0}
+        start = time.perf_counter()
+        for username in usernames:
+            try:
+                outcomes["ok" if attempt(username) else "failed"] += 1
+            except LoginThrottled:
+                outcomes["throttled"] += 1
+        elapsed = time.perf_counter() - start
+        hashes = metrics.report()["counters"].get("auth.password_hashes", 0)
+        print(f"  {label:<40}{len(usernames) / elapsed:>12,.0f}/s  ok {outcomes['ok']}, failed "
+              f"{outcomes['failed']}, throttled {outcomes['throttled']}, hashes {hashes}")
+
+    throughput("valid logins", lambda username: auth.authenticate(username, "password"))
+    limit = auth_module.GLOBAL_LIMIT
+    auth_module.GLOBAL_LIMIT = attempts + 1  # Let every wrong password reach the hash to price the full path
+    throughput("wrong password (no global limit)", lambda username: auth.authenticate(username, "guess"))
+    auth_module.GLOBAL_LIMIT = limit
+    throughput("brute force on one username", lambda username: auth.authenticate("user1", username),
+               usernames=[f"guess{n}" for n in range(attempts)])
+    throughput("password spray, unknown usernames", lambda username: auth.authenticate(username, "password"),
+               usernames=[f"nobody{n}" for n in range(attempts)])
+
+    scan = names[:20]
+    start = time.perf_counter()
+    for username in scan:  # What authenticate() did before the index: walk every user until the name matches
+        next((user for user in auth.by_username.values()
+              if user["username"] == username and file_manager.verify_password(user["password"], "password")), None)
+    print(f"  {'valid logins, linear scan (before index)':<40}{len(scan) / (time.perf_counter() - start):>12,.0f}/s")
+
+
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {here!r})
+import app
+phases = {{"import": time.perf_counter()}}
+auth = app.Authentication()
+app.create_admin(auth)
+phases["menu shown"] = time.perf_counter()
+user = auth.authenticate("user1", "password")
+phases["first login"] = time.perf_counter()
+tracker = app.ExpenseTracker(user)
+tracker.page(20, sort="-date")
+phases["first page"] = time.perf_counter()
+print(json.dumps({{name: (at - start) * 1000 for name, at in phases.items()}}))
+"""
+
+
+def bench_startup(sizes, years, runs=3):
+    """Times a fresh app process from launch to its first screens as the data grows: size users in data.json and
+    size expenses in the logged-in user's shard. Each phase is milliseconds since launch, median of runs."""
+    import file_manager
+    print(f"\n--- Cold start (ms since launch, median of {runs} runs) ---")
+    phases = ("import", "menu shown", "first login", "first page")
+    print(f"  {'users / expenses':<20}" + "".join(f"{phase:>14}" for phase in phases))
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix="chaching-startup-")
+        os.chdir(directory)
+        generate_dataset(1, size, years)
+        data = file_manager.load_data()
+        password = data["users"][-1]["password"]
+        data["users"].extend({"user_id": n, "username": f"user{n}", "password": password, "role": "user"}
+                             for n in range(2, size + 1))
+        data["meta"]["next_user_id"] = size + 1
+        file_manager.store.save(data)
+        file_manager.store.invalidate()
+        file_manager._user_stores.clear()
+
+        samples = []
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(here=HERE)], cwd=directory,
+                                    capture_output=True, text=True, check=True)
+            samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        medians = [sorted(sample[phase] for sample in samples)[runs // 2] for phase in phases]
+        print(f"  {size:<20,}" + "".join(f"{value:>14.1f}" for value in medians))
+
+
+def bench_core(users, expenses, years, backend, output=None, repeat=50):
+    """Times each core tracker path in isolation on a generated dataset; optionally writes the results as JSON."""
+    output = os.path.abspath(output) if output else None
+    os.chdir(tempfile.mkdtemp(prefix="chaching-core-"))
+    print(f"\n--- Core paths, {backend} backend, {users} users x {expenses} expenses over {years} years ---")
+    started = time.perf_counter()
+    generate_dataset(users, expenses, years)
+    print(f"  dataset generated in {time.perf_counter() - started:.1f} s")
+
+    import file_manager
+    import storage
+    from auth import Authentication
+    from expenses import ExpenseTracker
+    from models import User
+    if backend == "sqlite":
+        from sqlite_storage import import_from_json
+        import_from_json(storage.SQLITE_FILE)
+    storage.use_backend(backend)
+    db = storage.get_storage()
+    user = User(f"user{users}", file_manager.hash_password("password"), user_id=users)
+    rng = random.Random(1)
+    month = f"{DATASET_START.year + years // 2}-06"
+
+    def drop_user_caches():
+        db._users.pop(user.user_id, None)
+        file_manager._user_stores.pop(str(user.user_id), None)
+
+    results = {}
+    print(f"  {'':<40}{'p50 ms':>12}{'p95 ms':>12}{'mean ms':>12}")
+    if backend == "json":
+        results["load_data (cold)"] = measure("load_data (cold)", file_manager.load_data, repeat=5,
+                                              setup=file_manager.store.invalidate)
+        results["save_data"] = measure("save_data", lambda: file_manager.save_data(file_manager.load_data()),
+                                       repeat=5)
+    results["Authentication.__init__"] = measure("Authentication.__init__", Authentication, repeat=5)
+    auth = Authentication()
+    results["login (first user)"] = measure("login (first user)", lambda: quietly(auth.login, "user1", "password"),
+                                            repeat=repeat)
+    results["login (last user)"] = measure("login (last user)",
+                                           lambda: quietly(auth.login, f"user{users}", "password"), repeat=repeat)
+    results["first page (cold shard)"] = measure("first page (cold shard)",
+                                                 lambda: ExpenseTracker(user).page(20, sort="-date"), repeat=5,
+                                                 setup=drop_user_caches)
+    tracker = ExpenseTracker(user)
+    tracker.query("0000-00-00", "9999-99-99")  # Load the shard so the cases below see a warm tracker
+    results["add"] = measure("add", lambda: tracker.add(12.5, "Food", "bench", f"{month}-15"), repeat=repeat)
+    # Every add checks each budget that counts it against running totals, so this should stay flat as data grows
+    tracker.set_budget(month, 800.0, "Food")
+    tracker.set_budget("30d", 2500.0)
+    tracker.set_budget("7d", 150.0, "Food")
+    results["add (category + rolling budgets)"] = measure(
+        "add (category + rolling budgets)", lambda: tracker.add(12.5, "Food", "bench", f"{month}-15"), repeat=repeat)
+    results["budget status"] = measure("budget status", lambda: tracker.budget_status(f"{month}-20"), repeat=repeat)
+    results["list all"] = measure("list all", tracker.query, repeat=5)
+    results["list one month"] = measure("list one month", lambda: tracker.query(f"{month}-01", f"{month}-31"),
+                                        repeat=repeat)
+    results["page (20, newest first)"] = measure("page (20, newest first)", lambda: tracker.page(20, sort="-date"),
+                                                 repeat=repeat)
+    results["page (20, Food by amount)"] = measure("page (20, Food by amount)",
+                                                   lambda: tracker.page(20, sort="-amount", category="Food"),
+                                                   repeat=repeat)
+    tracker.page(1, search="food")  # Build (or open) the search index outside the timings
+    results["search page (rare word)"] = measure("search page (rare word)",
+                                                 lambda: tracker.page(20, search=str(expenses // 2)), repeat=repeat)
+    results["search page (common word)"] = measure("search page (common word)",
+                                                   lambda: tracker.page(20, search="food"), repeat=repeat)
+    ids = rng.sample(range(1, expenses + 1), 2 * repeat)
+    edit_ids, delete_ids = ids[:repeat], ids[repeat:]
+    results["edit"] = measure("edit", lambda: tracker.update(edit_ids.pop(), amount=rng.uniform(1, 99),
+                                                             category=rng.choice(CATEGORIES)), repeat=repeat)
+    results["delete"] = measure("delete", lambda: tracker.delete(delete_ids.pop()), repeat=repeat)
+    results["view_summary (month)"] = measure("view_summary (month)", lambda: tracker.summary(month),
+                                              repeat=repeat)
+    results["view_summary (year)"] = measure(
+        "view_summary (year)", lambda: tracker.summary(month[:4] + "-01", month[:4] + "-12"), repeat=repeat)
+
+    names = iter(range(repeat))
+    created = []
+    results["category create"] = measure(
+        "category create", lambda: created.append(db.add_category(f"Bench {next(names)}", 0)["category_id"]),
+        repeat=repeat)
+    renames = iter(created)
+    results["category rename (in use)"] = measure(
+        "category rename (in use)", lambda: db.rename_category(CATEGORY_IDS["Food"], f"Food {next(renames)}"),
+        repeat=repeat)
+    db.rename_category(CATEGORY_IDS["Food"], "Food")
+    results["category delete"] = measure("category delete", lambda: db.delete_category(created.pop()),
+                                         repeat=repeat)
+    # One bulk pass over every user: each affected shard is rewritten once (JSON), or one UPDATE (SQLite)
+    results["category merge (all users)"] = measure(
+        "category merge (all users)",
+        lambda: db.merge_categories(CATEGORY_IDS["Miscellaneous"], CATEGORY_IDS["Entertainment"]))
+
+    if output:
+        report = {"meta": {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                           "python": platform.python_version(), "platform": platform.platform(),
+                           "backend": backend, "users": users, "expenses": expenses, "years": years},
+                  "results": results}
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"  results written to {output}")
+    return results
+
+
+def compare_results(base_path, new_path, threshold=0.2, min_delta_ms=0.01):
+    """Prints p50 changes between two bench_core JSON reports; returns the number of regressions flagged."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    for key in ("backend", "users", "expenses", "years"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"[!] {key} differs ({base['meta'].get(key)} vs {new['meta'].get(key)}); results may not compare.")
+
+    regressions = 0
+    print(f"  {'':<40}{'base p50':>12}{'new p50':>12}{'change':>10}")
+    for name, stats in new["results"].items():
+        old = base["results"].get(name)
+        if old is None:
+            print(f"  {name:<40}{'-':>12}{stats['p50_ms']:>12.4f}{'new':>10}")
+            continue
+        delta = stats["p50_ms"] - old["p50_ms"]
+        change = delta / old["p50_ms"] if old["p50_ms"] else 0.0
+        flag = ""
+        if change > threshold and delta > min_delta_ms:
+            flag = "  [!] REGRESSION"
+            regressions += 1
+        elif change < -threshold and -delta > min_delta_ms:
+            flag = "  faster"
+        print(f"  {name:<40}{old['p50_ms']:>12.4f}{stats['p50_ms']:>12.4f}{change:>+10.1%}{flag}")
+    for name in base["results"].keys() - new["results"].keys():
+        print(f"  {name:<40}{'(missing from new run)':>34}")
+    print(f"[{'!' if regressions else '✔'}] {regressions} regression(s) above {threshold:.0%}.")
+    return regressions
+
+
+def percentile(sorted_values, pct):
+    """Returns the pct-th percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+async def _http(reader, writer, method, path, body=None, token=None):
+    """Sends one keep-alive request and returns (status, decoded JSON body)."""
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + payload)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    data = await reader.readexactly(length)
+    return status, json.loads(data) if data else None
+
+
+async def _load_test(port, levels, duration, users):
+    """Logs in test users, then drives a read/write mix at each concurrency level."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    _, admin = await _http(reader, writer, "POST", "/login", {"username": "admin", "password": "adminpass"})
+    for name in CATEGORIES:
+        await _http(reader, writer, "POST", "/categories", {"name": name}, admin["token"])
+    tokens = []
+    for n in range(users):
+        await _http(reader, writer, "POST", "/register", {"username": f"load-{n}", "password": "pw"})
+        _, session = await _http(reader, writer, "POST", "/login", {"username": f"load-{n}", "password": "pw"})
+        tokens.append(session["token"])
+    writer.close()
+
+    async def client(number, deadline, latencies, errors):
+        rng = random.Random(number)
+        token = tokens[number % len(tokens)]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < 0.4:
+                request = ("POST", "/expenses", {"amount": round(rng.uniform(1, 200), 2),
+                                                 "category": rng.choice(CATEGORIES),
+                                                 "description": "load test", "date": "2024-03-15"})
+            elif roll < 0.7:
+                request = ("GET", "/summary?start=2024-03", None)
+            elif roll < 0.9:
+                request = ("GET", "/expenses?start=2024-03-01&end=2024-03-31&category=Food", None)
+            else:
+                request = ("GET", "/budgets", None)
+            start = time.perf_counter()
+            status, _ = await _http(reader, writer, *request, token=token)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+        writer.close()
+
+    print(f"  {'clients':>8}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for level in levels:
+        latencies, errors = [], []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n, start + duration, latencies, errors) for n in range(level)))
+        elapsed = time.perf_counter() - start
+        latencies.sort()
+        print(f"  {level:>8}{len(latencies):>10}{len(latencies) / elapsed:>10.0f}"
+              f"{percentile(latencies, 50) * 1000:>10.2f}{percentile(latencies, 99) * 1000:>10.2f}{len(errors):>8}")
+
+
+def bench_server(levels, duration, users):
+    """Starts app.py --serve in a scratch directory and reports latency and throughput per concurrency level."""
+    directory = tempfile.mkdtemp(prefix="chaching-server-")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "app.py"), "--serve", "--port", str(port)],
+                              cwd=directory, stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        print(f"\n--- API server, {users} users, {duration:.0f} s per level, 40% writes ---")
+        asyncio.run(_load_test(port, levels, duration, users))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cha-Ching $$ benchmarks")
+    parser.add_argument("suite", choices=["core", "compare", "dataset", "index", "backends", "stress", "server",
+                                          "snapshot", "login", "memory", "startup", "search"], help="benchmark to run")
+    parser.add_argument("files", nargs="*", help="compare: BASE.json NEW.json")
+    parser.add_argument("--expenses", type=int, help="expenses per user (default: 2000 for core/dataset, "
+                                                     "1000000 for memory, 100000 otherwise)")
+    parser.add_argument("--users", type=int, help="users (default: 50 for core/dataset, 1000000 for login, "
+                                                  "16 otherwise)")
+    parser.add_argument("--years", type=int, default=3, help="years of dates in generated datasets")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json",
+                        help="backend for the core and login suites")
+    parser.add_argument("--repeat", type=int, default=50, help="runs per core case")
+    parser.add_argument("--output", help="core: write results to this JSON file; dataset: directory to fill")
+    parser.add_argument("--threshold", type=float, default=0.2, help="compare: p50 slowdown flagged (0.2 = 20%%)")
+    parser.add_argument("--processes", type=int, default=8, help="writer processes for the stress suite")
+    parser.add_argument("--adds", type=int, default=200, help="expenses each stress process adds")
+    parser.add_argument("--levels", default="1,8,32,128", help="comma-separated client counts for the server suite")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="comma-separated users (and expenses of the first user) for the startup suite")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per concurrency level")
+    args = parser.parse_args()
+    if args.suite in ("core", "dataset"):
+        users, expenses = args.users or 50, args.expenses or 2000
+    elif args.suite == "login":
+        users, expenses = args.users or 1_000_000, 0
+    elif args.suite == "memory":
+        users, expenses = 1, args.expenses or 1_000_000
+    else:
+        users, expenses = args.users or 16, args.expenses or 100_000
+
+    if args.suite == "core":
+        bench_core(users, expenses, args.years, args.backend, args.output, args.repeat)
+    elif args.suite == "compare":
+        if len(args.files) != 2:
+            parser.error("compare needs BASE.json and NEW.json")
+        sys.exit(1 if compare_results(*args.files, threshold=args.threshold) else 0)
+    elif args.suite == "dataset":
+        directory = args.output or tempfile.mkdtemp(prefix="chaching-dataset-")
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, "data.json")):
+            parser.error(f"{directory} already holds a data.json; pick an empty directory")
+        os.chdir(directory)
+        generate_dataset(users, expenses, args.years)
+        print(f"[+] Generated {users} users x {expenses} expenses in {directory}")
+    elif args.suite == "index":
+        bench_index(expenses)
+    elif args.suite == "memory":
+        bench_memory(expenses)
+    elif args.suite == "startup":
+        bench_startup([int(size) for size in args.sizes.split(",")], args.years)
+    elif args.suite == "backends":
+        bench_backends(expenses)
+    elif args.suite == "stress":
+        sys.exit(1 if bench_stress(args.processes, args.adds) else 0)
+    elif args.suite == "snapshot":
+        bench_snapshot(users, expenses)
+    elif args.suite == "login":
+        bench_login(users, args.backend)
+    elif args.suite == "search":
+        bench_search(expenses, args.years)
+    elif args.suite == "server":
+        bench_server([int(level) for level in args.levels.split(",")], args.duration, users)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# budgets.py - Budget Periods, Spending Windows and Threshold Alerts
+import calendar
+import datetime
+import os
+
+MAX_WINDOW_DAYS = 366  # Longest rolling budget, e.g. "30d" is the 30 days up to and including an expense's date
+
+
+def parse_thresholds(text):
+    """Returns '50,80,100' as sorted percentages of a budget, raising ValueError unless all are positive numbers."""
+    try:
+        thresholds = sorted({float(part) for part in str(text).split(",") if part.strip()})
+    except ValueError:
+        thresholds = []
+    if not thresholds or thresholds[0] <= 0:
+        raise ValueError(f"Invalid alert thresholds '{text}'. Use percentages like 50,80,100.")
+    return tuple(int(value) if value.is_integer() else value for value in thresholds)
+
+
+# Percentages of a budget at which an alert fires as spending crosses them
+THRESHOLDS = parse_thresholds(os.environ.get("CHACHING_ALERT_THRESHOLDS", "50,80,100"))  # Overridden by app.py
+
+
+def use_thresholds(text):
+    """Sets the process-wide alert thresholds from a '50,80,100' string."""
+    global THRESHOLDS
+    THRESHOLDS = parse_thresholds(text)
+    return THRESHOLDS
+
+
+def rolling_days(period):
+    """Returns N for an 'Nd' rolling period, or None for a YYYY-MM month."""
+    return int(period[:-1]) if period.endswith("d") and period[:-1].isdigit() else None
+
+
+def validate_period(period):
+    """Returns period if it is a YYYY-MM month or an 'Nd' rolling window of 1..366 days, otherwise raises ValueError."""
+    period = (period or "").strip()
+    days = rolling_days(period)
+    if days is not None:
+        if not 1 <= days <= MAX_WINDOW_DAYS:
+            raise ValueError(f"Rolling budgets cover 1 to {MAX_WINDOW_DAYS} days, not {days}.")
+        return f"{days}d"
+    try:
+        datetime.datetime.strptime(period, "%Y-%m")
+    except ValueError:
+        raise ValueError(f"Invalid budget period '{period}'. Use YYYY-MM for a month or e.g. 30d for 30 days.")
+    return period
+
+
+def month_window(month):
+    """Returns the first and last dates of a YYYY-MM month."""
+    year, number = int(month[:4]), int(month[5:7])
+    return f"{month}-01", f"{month}-{calendar.monthrange(year, number)[1]:02d}"
+
+
+def window(period, date):
+    """Returns the (first, last) dates of the period's window that counts an expense dated date: its calendar
+    month, or the N days ending on date."""
+    days = rolling_days(period)
+    if days is None:
+        return month_window(period)
+    last = datetime.date.fromisoformat(date)
+    return (last - datetime.timedelta(days=days - 1)).isoformat(), date
+
+
+def crossed(limit, before, after, thresholds=None):
+    """Returns the thresholds spending passed on its way up from before to after (compared in cents)."""
+    before, after = round(before * 100), round(after * 100)
+    return [threshold for threshold in (THRESHOLDS if thresholds is None else thresholds)
+            if before < round(limit * threshold) <= after]
+
+
+def check_budgets(store, expenses, thresholds=None):
+    """Returns an alert for every threshold that newly stored expenses pushed spending across, in each monthly
+    or rolling budget that counts them, overall or for their category.
+
+    Monthly budgets are looked up by key and spent-so-far comes from store.spent(), which reads running totals, so
+    the cost depends on the number and length of rolling budgets, never on how much history the user has.
+    """
+    rolling = store.rolling_budgets()
+    limits = {}  # (period, category_id or None) -> amount or None, each looked up once per call
+    added = {}   # (period, category_id or None, first, last) -> [limit, amount the expenses added]
+    for exp in expenses:
+        month, category_id = exp["date"][:7], exp["category_id"]
+        keys = [(month, None), (month, category_id)]
+        keys += [(period, budget_category) for period, budget_category in rolling
+                 if budget_category is None or budget_category == category_id]
+        for key in keys:
+            if key not in limits:
+                limits[key] = rolling[key] if key in rolling else store.budget(*key)
+            if limits[key] is not None:
+                period, budget_category = key
+                window_key = (period, budget_category, *window(period, exp["date"]))
+                added.setdefault(window_key, [limits[key], 0])[1] += exp["amount"]
+
+    alerts = {}
+    for (period, category_id, first, last), (limit, amount) in added.items():
+        spent = store.spent(first, last, category_id)
+        for threshold in crossed(limit, spent - amount, spent, thresholds):
+            # A batch can push several windows of one rolling budget across; each threshold is reported once
+            alerts[(period, category_id, threshold)] = {
+                "period": period, "category_id": category_id, "threshold": threshold, "limit": limit,
+                "spent": spent, "start_date": first, "end_date": last}
+    return list(alerts.values())
+
+
+def merge_budget_categories(category_budgets, source, target):
+    """Moves category source's budgets onto target in a {period: {category key: amount}} table, in place; where
+    target has its own budget for a period, that one is kept. Returns whether anything changed."""
+    source, target = str(source), str(target)
+    changed = False
+    for limits in category_budgets.values():
+        if source in limits:
+            limits.setdefault(target, limits.pop(source))
+            changed = True
+    return changed
+
+
+def budget_status(store, date):
+    """Returns spent-so-far for every budget whose window covers date: its month's, overall and per category, and
+    each rolling one ending on date."""
+    month = date[:7]
+    budgets = [(period, None, limit) for period, limit in store.budgets().items()
+               if period == month or rolling_days(period)]
+    budgets += [(period, category_id, limit) for period, limits in store.category_budgets().items()
+                if period == month or rolling_days(period) for category_id, limit in limits.items()]
+    status = []
+    for period, category_id, limit in budgets:
+        first, last = window(period, date)
+        spent = store.spent(first, last, category_id)
+        status.append({"period": period, "category_id": category_id, "limit": limit, "spent": spent,
+                       "remaining": round(limit - spent, 2),
+                       "percent": round(spent * 100 / limit, 1) if limit else None,
+                       "start_date": first, "end_date": last})
+    return status
+
+
+def alert_message(alert):
+    """Describes an alert in one line, e.g. '80% of the 2024-05 Food budget reached: 322.50 of 400.00 spent.'"""
+    days = rolling_days(alert["period"])
+    scope = f"{days}-day" if days else alert["period"]
+    category = f" {alert['category']}" if alert.get("category") else ""
+    return (f"{alert['threshold']}% of the {scope}{category} budget reached: "
+            f"{alert['spent']:.2f} of {alert['limit']:.2f} spent.")
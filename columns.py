@@ -0,0 +1,587 @@
+# columns.py - Compact Columnar Storage for One User's Expenses (typed arrays, amounts in integer cents)
+import calendar
+import datetime
+import json
+import math
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from collections.abc import ItemsView, MutableMapping, ValuesView
+
+FIELDS = ("expense_id", "amount", "category_id", "description", "user_id", "date")
+UNDATED = 2 ** 31 - 1  # Date column value for legacy dates that are not YYYY-MM-DD; sorts after every real date
+FIND_MATCHES = 1024    # A search that can match at most this many expenses collects its matches up front ...
+SEARCH_WALK = 1024     # ... otherwise it tests this many rows in order before reading its matches from the index
+
+
+def to_cents(amount):
+    """Returns amount as integer cents, or None if it is not a number that cents represent exactly."""
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        return None
+    try:
+        cents = round(amount * 100)
+    except (OverflowError, ValueError):  # inf / nan
+        return None
+    return cents if cents / 100 == amount and -2 ** 63 < cents < 2 ** 63 else None
+
+
+class ExpenseRecord(dict):
+    """An expense read through the mapping interface; assigning to one of its fields also updates the columns,
+    which is how journal replay edits an expense in place."""
+
+    __slots__ = ("columns",)
+
+    def __setitem__(self, field, value):
+        dict.__setitem__(self, field, value)
+        self.columns.set_field(self["expense_id"], field, value)
+
+    def update(self, *args, **kwargs):
+        for field, value in dict(*args, **kwargs).items():
+            self[field] = value
+
+
+class ExpenseColumns(MutableMapping):
+    """One user's expenses as parallel typed arrays sorted by expense_id, usable wherever the shard's
+    {str(expense_id): record} dict was.
+
+    Amounts are integer cents, dates are day ordinals and categories are ids into the global category table,
+    so renaming a category never touches a shard; descriptions live in a plain list. Records are built as plain
+    dicts on access; only those fetched by key (as journal replay does) write field assignments back into the
+    columns. A (date, expense_id) index is maintained alongside, and an (amount, expense_id) order is sorted on
+    first use, as are per-day totals for budget windows. A search index the storage layer attaches is kept
+    current by the same writes.
+    """
+
+    def __init__(self, records=()):
+        self.ids = array("q")
+        self.dates = array("i")
+        self.categories = array("I")
+        self.cents = array("q")
+        self.user_ids = array("q")
+        self.descriptions = []
+        self.extras = {}              # expense_id -> {field: value} the columns cannot hold exactly
+        self.date_keys = array("i")   # Date index: ordinals in (date, expense_id) order ...
+        self.date_ids = array("q")    # ... and the expense ID of each
+        self._amount_order = None     # (cents, expense IDs) in (amount, expense_id) order, built on first use
+        self._daily = None            # {category_id: {ordinal: cents}}, built on first use, then kept current
+        self.search = None            # SearchIndex (see search.py), once the storage layer opens one
+        self._ordinals = {}           # Date string -> ordinal and back; a user's dates repeat heavily
+        self._date_strings = {}
+        self._load(records)
+
+    def _load(self, records):
+        """Bulk-builds the columns and the date index, sorting once instead of inserting row by row."""
+        rows = sorted(records, key=itemgetter("expense_id"))
+        if not self._load_columns(rows):
+            for record in rows:
+                expense_id = record["expense_id"]
+                if self.ids and self.ids[-1] == expense_id:
+                    continue  # Duplicate ID: keep the first, as a dict keyed by ID would
+                ordinal, category, cents, user_id, description, extra = self._encode(record)
+                self.ids.append(expense_id)
+                self.dates.append(ordinal)
+                self.categories.append(category)
+                self.cents.append(cents)
+                self.user_ids.append(user_id)
+                self.descriptions.append(description)
+                if extra:
+                    self.extras[expense_id] = extra
+        order = sorted(range(len(self.ids)), key=self.dates.__getitem__)  # Stable, so ties stay in ID order
+        self.date_keys = array("i", [self.dates[row] for row in order])
+        self.date_ids = array("q", [self.ids[row] for row in order])
+
+    def _load_columns(self, rows):
+        """Fills the columns a whole column at a time; returns False, changing nothing, if any record has a
+        duplicate ID, an extra field or a value the columns cannot hold exactly (those take the row path)."""
+        try:
+            if any(len(row) != len(FIELDS) for row in rows):
+                return False
+            ids = array("q", [row["expense_id"] for row in rows])
+            amounts = [row["amount"] for row in rows]
+            categories = array("I", [row["category_id"] for row in rows])
+            descriptions = [row["description"] for row in rows]
+            dates = [row["date"] for row in rows]
+            user_ids = array("q", [row["user_id"] for row in rows])
+        except (KeyError, TypeError, OverflowError):
+            return False
+        if (any(type(row["expense_id"]) is bool or type(row["category_id"]) is bool for row in rows)
+                or any(ids[row] == ids[row + 1] for row in range(len(ids) - 1))
+                or any(type(amount) not in (int, float) for amount in amounts)
+                or any(type(description) is not str for description in descriptions)
+                or any(type(date) is not str for date in dates)):
+            return False
+        try:
+            cents = [round(amount * 100) for amount in amounts]
+            if any(value / 100 != amount for value, amount in zip(cents, amounts)):
+                return False
+            cents = array("q", cents)
+        except (OverflowError, ValueError):  # inf / nan / beyond 64 bits
+            return False
+        ordinals = {date: self._ordinal(date) for date in set(dates)}
+        if UNDATED in ordinals.values():
+            return False
+        self.ids, self.cents, self.user_ids, self.descriptions = ids, cents, user_ids, descriptions
+        self.dates = array("i", [ordinals[date] for date in dates])
+        self.categories = categories
+        return True
+
+    # --- Mapping interface (keys are str(expense_id), like the shard dict) ---
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for expense_id in self.ids:
+            yield str(expense_id)
+
+    def __contains__(self, key):
+        return self._row_of_key(key) is not None
+
+    def __getitem__(self, key):
+        row = self._row_of_key(key)
+        if row is None:
+            raise KeyError(key)
+        record = ExpenseRecord(self._record(row))
+        record.columns = self
+        return record
+
+    def __setitem__(self, key, record):
+        expense_id = int(key)
+        record = dict(record, expense_id=expense_id)
+        row = self._row(expense_id)
+        if row is None:
+            self._insert(expense_id, self._encode(record))
+        else:
+            self._overwrite(row, expense_id, self._encode(record))
+
+    def __delitem__(self, key):
+        row = self._row_of_key(key)
+        if row is None:
+            raise KeyError(key)
+        expense_id = self.ids[row]
+        self._unindex_date(self.dates[row], expense_id)
+        self._count_day(self.dates[row], self.categories[row], -self.cents[row])
+        if self.search is not None:
+            self.search.remove(expense_id, self.descriptions[row], self.categories[row])
+        for column in (self.ids, self.dates, self.categories, self.cents, self.user_ids, self.descriptions):
+            del column[row]
+        self.extras.pop(expense_id, None)
+        self._amount_order = None
+
+    def values(self):
+        return _ExpenseValues(self)
+
+    def items(self):
+        return _ExpenseItems(self)
+
+    def record(self, expense_id):
+        """Returns the expense with this ID, or None."""
+        row = self._row(expense_id)
+        return None if row is None else self._record(row)
+
+    def recategorize(self, source, target):
+        """Moves every expense in category source to category target in one pass over the category column,
+        returning how many moved."""
+        moved = self.categories.count(source)
+        if moved:
+            self.categories = array("I", [target if category == source else category
+                                          for category in self.categories])
+            self._daily = None
+            if self.search is not None:
+                self.search.recategorize(source, target)
+        return moved
+
+    def search_fields(self, expense_id):
+        """Returns the (description, category_id) an expense is searched by, or None if there is no such expense."""
+        row = self._row(expense_id)
+        return None if row is None else (self.descriptions[row], self.categories[row])
+
+    def last_id(self):
+        """Returns the highest expense ID, or 0 if there are none."""
+        return self.ids[-1] if self.ids else 0
+
+    def set_field(self, expense_id, field, value):
+        """Changes one field of an expense in place (what assigning through an ExpenseRecord does)."""
+        row = self._row(expense_id)
+        if row is None:
+            raise KeyError(expense_id)
+        record = self._record(row)
+        record[field] = value
+        self._overwrite(row, expense_id, self._encode(record))
+
+    # --- Queries over the columns ---
+
+    def scan(self, order="date", descending=False, after=None, filters=None):
+        """Yields records in (order value, expense_id) order ("date", "amount" or "id"), starting just past the
+        after key. The range on the order column is found by bisect; the other filters are checked against the
+        columns, so only matching rows are ever turned into records. A "search" filter holds search.search_terms()
+        and needs the search index attached."""
+        filters = filters or {}
+        start, end = filters.get("start_date"), filters.get("end_date")
+        low_date = self._date_bound(start, upper=False) if start else None
+        high_date = self._date_bound(end, upper=True) if end else None
+        min_amount, max_amount = filters.get("min_amount"), filters.get("max_amount")
+        low_cents = math.ceil(round(min_amount * 100, 6)) if min_amount is not None else None
+        high_cents = math.floor(round(max_amount * 100, 6)) if max_amount is not None else None
+
+        if order == "date":
+            keys, ids, low, high, column = self.date_keys, self.date_ids, low_date, high_date, self.dates
+            low_date = high_date = None
+            after = (self._ordinal(after[0]), after[1]) if after is not None else None
+        elif order == "amount":
+            (keys, ids), low, high, column = self._amount_index(), low_cents, high_cents, self.cents
+            low_cents = high_cents = None
+            after = (round(after[0] * 100), after[1]) if after is not None else None
+        else:
+            keys = ids = column = self.ids
+            low = high = None
+
+        lo = 0 if low is None else bisect_left(keys, low)
+        hi = len(keys) if high is None else bisect_right(keys, high)
+        if after is not None:
+            first = bisect_left(keys, after[0], lo, hi)
+            last = bisect_right(keys, after[0], first, hi)
+            if descending:
+                hi = bisect_left(ids, after[1], first, last)
+            else:
+                lo = bisect_right(ids, after[1], first, last)
+
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        terms = filters.get("search")
+        if terms:
+            rows = self._search_rows(terms, column, keys, ids, positions)
+        elif ids is self.ids:
+            rows = positions
+        else:
+            rows = (self._row(ids[position]) for position in positions)
+
+        category_id = filters.get("category_id")
+        text = filters.get("text")
+        text = text.lower() if text else None
+        dates, cents, categories, descriptions = self.dates, self.cents, self.categories, self.descriptions
+        for row in rows:
+            if category_id is not None and categories[row] != category_id:
+                continue
+            if low_cents is not None and cents[row] < low_cents or high_cents is not None and cents[row] > high_cents:
+                continue
+            if low_date is not None and dates[row] < low_date or high_date is not None and dates[row] > high_date:
+                continue
+            if text is not None and text not in descriptions[row].lower():
+                continue
+            yield self._record(row)
+
+    def _search_rows(self, terms, column, keys, ids, positions):
+        """Yields the rows of the expenses at positions of the (keys, ids) order that match a search, in that order.
+
+        A common search first walks the positions testing each expense, which fills a page in a few rows. Past
+        that (or for a rare search) the matches are read from the index: the rest of the positions are filtered
+        against them if they are many, otherwise they are sorted by their (column value, expense_id) key.
+        """
+        index = self.search
+        groups = index.lookup(terms)
+        if groups[0][0] > FIND_MATCHES:
+            test = index.matcher(terms, groups, self.search_fields)
+            for position in positions[:SEARCH_WALK]:
+                expense_id = ids[position]
+                if test(expense_id):
+                    yield self._row(expense_id)
+            positions = positions[SEARCH_WALK:]
+        if not positions:
+            return
+        found = index.find(terms, groups, self.search_fields)
+        if 8 * len(found) > len(positions):  # Filtering a position costs a fraction of sorting in a match
+            for position in positions:
+                if ids[position] in found:
+                    yield self._row(ids[position])
+            return
+        low, high = sorted(((keys[positions[0]], ids[positions[0]]), (keys[positions[-1]], ids[positions[-1]])))
+        matched = []
+        for expense_id in found:
+            row = self._row(expense_id)
+            key = (column[row], expense_id)
+            if low <= key <= high:
+                matched.append((key, row))
+        matched.sort(reverse=positions.step < 0)
+        for _, row in matched:
+            yield row
+
+    def rollups(self):
+        """Recomputes {month: {str(category_id): total}} straight from the columns, summing integer cents so
+        totals are exact however many expenses there are."""
+        cells = {}
+        extras = self.extras
+        for expense_id, ordinal, category, cents in zip(self.ids, self.dates, self.categories, self.cents):
+            if extras and expense_id in extras:
+                continue
+            key = (ordinal, category)
+            cells[key] = cells.get(key, 0) + cents
+        totals = {}
+        for (ordinal, category), cents in cells.items():
+            month_totals = totals.setdefault(self._date_strings[ordinal][:7], {})
+            key = str(category)
+            month_totals[key] = month_totals.get(key, 0) + cents
+        rollups = {month: {key: cents / 100 for key, cents in month_totals.items() if cents}
+                   for month, month_totals in totals.items()}
+        for expense_id in extras:  # Rows with values the columns could not hold exactly are summed as records
+            record = self.record(expense_id)
+            month_totals = rollups.setdefault(str(record["date"])[:7], {})
+            key = str(record["category_id"])
+            month_totals[key] = round(month_totals.get(key, 0) + record["amount"], 2)
+        return {month: totals for month, totals in rollups.items() if totals}
+
+    def window_total(self, start_date, end_date, category_id=None):
+        """Returns the total dated start_date..end_date inclusive, optionally in one category, from per-day totals;
+        the cost grows with the number of days in the window, not the number of expenses."""
+        low, high = self._date_bound(start_date, upper=False), self._date_bound(end_date, upper=True)
+        daily = self._daily_totals()
+        tables = list(daily.values()) if category_id is None else [daily.get(category_id, {})]
+        cents = 0
+        for table in tables:
+            if high - low < len(table):
+                cents += sum(table.get(ordinal, 0) for ordinal in range(low, high + 1))
+            else:
+                cents += sum(total for ordinal, total in table.items() if low <= ordinal <= high)
+        return cents / 100
+
+    def memory_bytes(self):
+        """Approximate bytes held by the columns and indexes (descriptions counted by their string objects)."""
+        arrays = (self.ids, self.dates, self.categories, self.cents, self.user_ids, self.date_keys, self.date_ids)
+        return (sum(column.buffer_info()[1] * column.itemsize for column in arrays)
+                + sys.getsizeof(self.descriptions) + sum(sys.getsizeof(text) for text in self.descriptions))
+
+    # --- Internals ---
+
+    def _row(self, expense_id):
+        ids = self.ids
+        if not ids:
+            return None
+        if ids[-1] - ids[0] + 1 == len(ids):  # No gaps in the IDs (nothing deleted): the row is an offset
+            row = expense_id - ids[0]
+            return row if 0 <= row < len(ids) else None
+        # IDs are distinct ascending integers, so the row is at most expense_id - ids[0] and at most one row per
+        # missing ID below that; with few deletions the bisect covers a handful of rows
+        hi = min(len(ids), expense_id - ids[0] + 1)
+        if hi <= 0:
+            return None
+        row = bisect_left(ids, expense_id, max(0, hi - 1 - (ids[-1] - ids[0] + 1 - len(ids))), hi)
+        return row if row < len(ids) and ids[row] == expense_id else None
+
+    def _row_of_key(self, key):
+        try:
+            return self._row(int(key))
+        except (TypeError, ValueError):
+            return None
+
+    def _record(self, row):
+        expense_id = self.ids[row]
+        record = {"expense_id": expense_id, "amount": self.cents[row] / 100,
+                  "category_id": self.categories[row], "description": self.descriptions[row],
+                  "user_id": self.user_ids[row], "date": self._date_strings.get(self.dates[row])}
+        if self.extras:
+            extra = self.extras.get(expense_id)
+            if extra:
+                record.update(extra)
+        return record
+
+    def _records(self):
+        """Yields every record in ID order; the bulk counterpart of _record()."""
+        date_strings, extras = self._date_strings, self.extras
+        for expense_id, cents, category, description, user_id, ordinal in zip(
+                self.ids, self.cents, self.categories, self.descriptions, self.user_ids, self.dates):
+            record = {"expense_id": expense_id, "amount": cents / 100, "category_id": category,
+                      "description": description, "user_id": user_id, "date": date_strings.get(ordinal)}
+            if extras and expense_id in extras:
+                record.update(extras[expense_id])
+            yield record
+
+    def _encode(self, record):
+        """Splits a record into column values plus the fields the columns cannot hold exactly."""
+        extra = {field: value for field, value in record.items() if field not in FIELDS}
+        date = record.get("date")
+        ordinal = self._ordinal(date)
+        if ordinal == UNDATED:
+            extra["date"] = date
+        amount = record.get("amount", 0)
+        cents = to_cents(amount)
+        if cents is None:
+            extra["amount"] = amount
+            try:
+                cents = max(-2 ** 62, min(2 ** 62, round(float(amount) * 100)))  # Still sorts about right
+            except (TypeError, ValueError, OverflowError):
+                cents = 0
+        category = record.get("category_id")  # None on a legacy record still naming its category
+        if isinstance(category, bool) or not isinstance(category, int) or not 0 <= category < 2 ** 32:
+            extra["category_id"] = category
+            category = 0
+        description = record.get("description", "")
+        if not isinstance(description, str):
+            extra["description"] = description
+            description = str(description)
+        user_id = record.get("user_id", 0)
+        if isinstance(user_id, bool) or not isinstance(user_id, int) or not -2 ** 63 < user_id < 2 ** 63:
+            extra["user_id"] = user_id
+            user_id = 0
+        return ordinal, category, cents, user_id, description, extra
+
+    def _ordinal(self, date):
+        """Returns the day ordinal of a YYYY-MM-DD date, or UNDATED for anything else."""
+        ordinal = self._ordinals.get(date) if isinstance(date, str) else None
+        if ordinal is None:
+            ordinal = UNDATED
+            if isinstance(date, str) and len(date) == 10 and date[4] == "-" and date[7] == "-":
+                try:
+                    ordinal = datetime.date.fromisoformat(date).toordinal()
+                except ValueError:
+                    pass
+            if ordinal != UNDATED:
+                self._ordinals[date] = ordinal
+                self._date_strings[ordinal] = date
+        return ordinal
+
+    def _date_bound(self, date, upper):
+        """Turns a range bound into an ordinal, matching string comparison: a bound that is not a real day
+        ('2024-02-31', '9999-99-99') becomes the nearest real day inside the range. Undated rows are excluded."""
+        ordinal = self._ordinal(date)
+        if ordinal != UNDATED:
+            return ordinal
+        try:
+            year, month, day = (int(part) for part in date.split("-"))
+        except (AttributeError, ValueError):
+            return UNDATED - 1 if upper else 0
+        if upper:  # Latest real day on or before the bound
+            if month < 1:
+                year, month, day = year - 1, 12, 31
+            elif month > 12:
+                month, day = 12, 31
+            elif day < 1:
+                year, month, day = (year - 1, 12, 31) if month == 1 else (year, month - 1, 31)
+        else:      # Earliest real day on or after the bound
+            if month < 1:
+                month, day = 1, 1
+            elif month > 12:
+                year, month, day = year + 1, 1, 1
+            elif day < 1:
+                day = 1
+            elif 1 <= year <= 9999 and day > calendar.monthrange(year, month)[1]:
+                year, month, day = (year + 1, 1, 1) if month == 12 else (year, month + 1, 1)
+        if year < 1:
+            return 0
+        if year > 9999:
+            return UNDATED - 1 if upper else UNDATED
+        return datetime.date(year, month, min(day, calendar.monthrange(year, month)[1])).toordinal()
+
+    def _daily_totals(self):
+        if self._daily is None:
+            self._daily = {}
+            for ordinal, category, cents in zip(self.dates, self.categories, self.cents):
+                if ordinal != UNDATED:
+                    table = self._daily.setdefault(category, {})
+                    table[ordinal] = table.get(ordinal, 0) + cents
+        return self._daily
+
+    def _count_day(self, ordinal, category, cents):
+        """Adds cents to a day's total, if the per-day totals have been built."""
+        if self._daily is None or ordinal == UNDATED:
+            return
+        table = self._daily.setdefault(category, {})
+        total = table.get(ordinal, 0) + cents
+        if total:
+            table[ordinal] = total
+        else:
+            table.pop(ordinal, None)
+
+    def _insert(self, expense_id, encoded):
+        ordinal, category, cents, user_id, description, extra = encoded
+        row = bisect_left(self.ids, expense_id)
+        for column, value in ((self.ids, expense_id), (self.dates, ordinal), (self.categories, category),
+                              (self.cents, cents), (self.user_ids, user_id), (self.descriptions, description)):
+            column.insert(row, value)
+        if extra:
+            self.extras[expense_id] = extra
+        self._index_date(ordinal, expense_id)
+        self._count_day(ordinal, category, cents)
+        if self.search is not None:
+            self.search.add(expense_id, description, category)
+        self._amount_order = None
+
+    def _overwrite(self, row, expense_id, encoded):
+        ordinal, category, cents, user_id, description, extra = encoded
+        self._count_day(self.dates[row], self.categories[row], -self.cents[row])
+        self._count_day(ordinal, category, cents)
+        if self.dates[row] != ordinal:
+            self._unindex_date(self.dates[row], expense_id)
+            self._index_date(ordinal, expense_id)
+        if self.cents[row] != cents:
+            self._amount_order = None
+        if self.search is not None and (self.descriptions[row], self.categories[row]) != (description, category):
+            self.search.remove(expense_id, self.descriptions[row], self.categories[row])
+            self.search.add(expense_id, description, category)
+        self.dates[row], self.categories[row], self.cents[row] = ordinal, category, cents
+        self.user_ids[row], self.descriptions[row] = user_id, description
+        if extra:
+            self.extras[expense_id] = extra
+        else:
+            self.extras.pop(expense_id, None)
+
+    def _date_slot(self, ordinal, expense_id):
+        lo = bisect_left(self.date_keys, ordinal)
+        hi = bisect_right(self.date_keys, ordinal, lo)
+        return bisect_left(self.date_ids, expense_id, lo, hi)
+
+    def _index_date(self, ordinal, expense_id):
+        slot = self._date_slot(ordinal, expense_id)
+        self.date_keys.insert(slot, ordinal)
+        self.date_ids.insert(slot, expense_id)
+
+    def _unindex_date(self, ordinal, expense_id):
+        slot = self._date_slot(ordinal, expense_id)
+        if slot < len(self.date_ids) and self.date_ids[slot] == expense_id and self.date_keys[slot] == ordinal:
+            del self.date_keys[slot]
+            del self.date_ids[slot]
+
+    def _amount_index(self):
+        if self._amount_order is None:
+            order = sorted(range(len(self.ids)), key=self.cents.__getitem__)  # Stable: ties stay in ID order
+            self._amount_order = (array("q", [self.cents[row] for row in order]),
+                                  array("q", [self.ids[row] for row in order]))
+        return self._amount_order
+
+
+class _ExpenseValues(ValuesView):
+    def __iter__(self):
+        return self._mapping._records()
+
+
+class _ExpenseItems(ItemsView):
+    def __iter__(self):
+        for record in self._mapping._records():
+            yield str(record["expense_id"]), record
+
+
+def decode_shard(shard):
+    """Swaps a loaded shard's {expense_id: record} dict for ExpenseColumns (no-op if it already holds them).
+
+    Shards written before rollups existed get their table computed here; the next snapshot stores it.
+    """
+    expenses = shard.get("expenses")
+    if not isinstance(expenses, ExpenseColumns):
+        shard["expenses"] = ExpenseColumns((expenses or {}).values())
+    if "rollups" not in shard:
+        shard["rollups"] = shard["expenses"].rollups()
+    return shard
+
+
+def dump_shard(shard, f):
+    """Writes a shard as JSON, streaming the expenses one compact line each instead of building them all first."""
+    f.write("{")
+    for n, (key, value) in enumerate(shard.items()):
+        f.write(f"{',' if n else ''}\n    {json.dumps(key)}: ")
+        if isinstance(value, ExpenseColumns):
+            f.write("{")
+            for m, (expense_key, record) in enumerate(value.items()):
+                f.write(f"{',' if m else ''}\n        {json.dumps(expense_key)}: {json.dumps(record)}")
+            f.write("\n    }" if value else "}")
+        else:
+            f.write(json.dumps(value, indent=4).replace("\n", "\n    "))
+    f.write("\n}\n")
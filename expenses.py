@@ -1,184 +1,295 @@
-import logging
-from file_manager import load_data, save_data
-from models import Expense
+# expenses.py - Expense Tracking and Budget Management (headless service layer, no terminal I/O)
+import base64
 import itertools
+import json
+import logging
+import zlib
+from storage import get_storage
 import datetime
-import re
+import applog
+import budgets
+import metrics
 
-logging.basicConfig(filename='app.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+EDITABLE_FIELDS = ("amount", "category", "description", "date")
+PAGE_SIZE = 20
+# Sort option -> (field, record key holding its value, newest/largest first)
+SORTS = {"date": ("date", "date", False), "-date": ("date", "date", True),
+         "amount": ("amount", "amount", False), "-amount": ("amount", "amount", True),
+         "id": ("id", "expense_id", False), "-id": ("id", "expense_id", True)}
 
 
-class ExpenseTracker:
-    expense_id_counter = itertools.count(1)  # Ensures unique expense IDs
+def validate_date(date):
+    """Returns date if it is a real YYYY-MM-DD date, otherwise raises ValueError."""
+    try:
+        datetime.datetime.strptime(date, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date '{date}'. Please use YYYY-MM-DD format.")
+    return date
+
+def validate_month(period):
+    """Returns period if it is a YYYY-MM month, otherwise raises ValueError."""
+    try:
+        datetime.datetime.strptime(period, "%Y-%m")
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid month '{period}'. Please use YYYY-MM format.")
+    return period
+
+def validate_amount(amount):
+    """Returns amount as a positive float, otherwise raises ValueError."""
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount '{amount}'.")
+    if amount <= 0:
+        raise ValueError("Amount must be a positive number.")
+    return amount
+
+
+def filter_key(filters):
+    """Returns a short fingerprint of the filters a listing was made with, so a cursor only continues that listing."""
+    given = {name: str(value) for name, value in filters.items() if value not in (None, "")}
+    return f"{zlib.crc32(json.dumps(given, sort_keys=True).encode()):08x}"
+
+def encode_cursor(sort, expense, filters=None):
+    """Returns an opaque page cursor pointing just past expense in the given sort order and filters."""
+    _, key, _ = SORTS[sort]
+    raw = json.dumps([sort, expense[key], expense["expense_id"], filter_key(filters or {})], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, sort, filters=None):
+    """Returns the (sort value, expense_id) key inside a cursor, raising ValueError if it is not one for this sort
+    and these filters."""
+    try:
+        cursor_sort, value, expense_id, key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid page cursor.")
+    if cursor_sort != sort:
+        raise ValueError(f"Page cursor was made for sort '{cursor_sort}', not '{sort}'.")
+    if key != filter_key(filters or {}):
+        raise ValueError("Page cursor was made for different filters.")
+    return value, expense_id
 
+
+class ExpenseTracker:
+    @metrics.timed("tracker.open")
     def __init__(self, user):
         """Initializes expense tracking for a user."""
         self.user = user
-        data = load_data()
-        user_expenses = data.get("expenses", {}).get(str(user.user_id), [])
-        if user_expenses:
-            max_existing_id = max(exp.get("expense_id", 0) for exp in user_expenses)
-            ExpenseTracker.expense_id_counter = itertools.count(max_existing_id + 1)
-
-    def add_expense(self):
-        """Prompts the user to select a category and adds an expense."""
-        data = load_data()
-        categories = [cat["name"] for cat in data.get("categories", {}).values()]
-
-        if not categories:
-            print("[!] No categories available. Please ask the admin to create categories first.")
-            return
-
-        print("\nAvailable Categories:")
-        for i, cat in enumerate(categories, start=1):
-            print(f"{i}. {cat}")
-
-        while True:
-            try:
-                category_index = int(input("Select category number: ").strip()) - 1
-                if category_index < 0 or category_index >= len(categories):
-                    raise ValueError
-                category = categories[category_index]
-                break
-            except (ValueError, IndexError):
-                print("[!] Invalid category selection. Please enter a valid number from the list.")
-
-        while True:
-            try:
-                amount = float(input("Enter expense amount: ").strip())
-                if amount <= 0:
-                    raise ValueError("Amount must be a positive number.")
-                break
-            except ValueError as e:
-                print(f"[!] Invalid amount. {e}")
-
-        while True:
-            description = input("Enter description: ").strip()
-            if not description:
-                print("[!] Description cannot be empty.")
-            else:
-                break
-
-        while True:
-            date = input("Enter date (YYYY-MM-DD) or press Enter for today: ").strip()
-            if not date:
-                date = datetime.datetime.now().strftime("%Y-%m-%d")
-                break
-            elif re.match(r"^\\d{4}-\\d{2}-\\d{2}$", date):
-                try:
-                    datetime.datetime.strptime(date, "%Y-%m-%d")  # Validate date format
-                    break
-                except ValueError:
-                    print("[!] Invalid date format. Please enter a valid date in YYYY-MM-DD format.")
-            else:
-                print("[!] Invalid date format. Please enter in YYYY-MM-DD format.")
-
-        expense_id = next(ExpenseTracker.expense_id_counter)  # Assign unique ID
-
-        expense = Expense(amount, category, description, self.user.user_id, date, expense_id)
-
-        if str(self.user.user_id) not in data["expenses"]:
-            data["expenses"][str(self.user.user_id)] = []
-        data["expenses"][str(self.user.user_id)].append(vars(expense))
-        save_data(data)
+        self.store = get_storage().user(user.user_id)
+
+    def categories(self):
+        """Returns the category names defined by the admin."""
+        return [cat["name"] for cat in get_storage().categories().values()]
+
+    @metrics.timed("tracker.get")
+    @applog.operation("get")
+    def get(self, expense_id):
+        """Returns one expense record, or None if the user has no expense with that ID."""
+        return self.store.get(expense_id)
+
+    @metrics.timed("tracker.add")
+    @applog.operation("add")
+    def add(self, amount, category, description, date=None):
+        """Validates and records a new expense, returning the stored record with the budget alerts it set off
+        under "alerts"."""
+        amount = validate_amount(amount)
+        category_id = get_storage().category_id(category)
+        description = (description or "").strip()
+        if not description:
+            raise ValueError("Description cannot be empty.")
+        date = validate_date(date) if date else datetime.datetime.now().strftime("%Y-%m-%d")
+
+        expense = self.store.add([{"amount": amount, "category_id": category_id, "description": description,
+                                   "user_id": self.user.user_id, "date": date}])[0]
         logging.info(
-            f"Expense added: {expense.amount}, {expense.category}, {expense.description}, {expense.date}, ID: {expense.expense_id} by user {self.user.user_id}.")
-        print(f"[+] Expense added successfully with ID: {expense.expense_id}.")
-
-    def list_expenses(self):
-        """Lists all expenses for the user."""
-        data = load_data()
-        user_expenses = data["expenses"].get(str(self.user.user_id), [])
-        if not user_expenses:
-            print("[i] No expenses recorded yet.")
-            return
-        print("\n------ Expense List ------")
-        for exp in user_expenses:
-            print(
-                f"ID: {exp['expense_id']} | {exp['date']} - {exp['category']}: {exp['amount']:.2f} ({exp['description']})")
-
-    def view_summary(self):
-        """Displays a summary of the user's expenses."""
-        data = load_data()
-        user_expenses = data["expenses"].get(str(self.user.user_id), [])
-        total_expenses = sum(exp["amount"] for exp in user_expenses)
-        budget_data = data.get("budgets", {}).get(str(self.user.user_id), {})
-        current_month = datetime.datetime.now().strftime("%Y-%m")
-        budget = budget_data.get(current_month, None)
-
-        print("\n------ Expense Summary ------")
-        print(f"Total Expenses: {total_expenses:.2f}")
-
-        if budget is not None:
-            print(f"Budget for {current_month}: {budget:.2f}")
-            remaining_budget = budget - total_expenses
-            print(f"Remaining Budget: {remaining_budget:.2f}")
-            if total_expenses > budget:
-                print("[!] Warning: You have exceeded your budget!")
-            else:
-                print("[i] You are within your budget.")
+            f"Expense added: {expense['amount']}, {expense['category']}, {expense['description']}, {expense['date']}, ID: {expense['expense_id']} by user {self.user.user_id}.")
+        expense["alerts"] = self._budget_alerts([expense])
+        return expense
+
+    @metrics.timed("tracker.add_many")
+    @applog.operation("add_many")
+    def add_many(self, rows):
+        """Adds a batch of (amount, category, description, date) rows with a single commit."""
+        storage = get_storage()
+        category_ids = {category: storage.category_id(category) for category in {row[1] for row in rows}}
+        expenses = self.store.add([{"amount": amount, "category_id": category_ids[category],
+                                    "description": description, "user_id": self.user.user_id, "date": date}
+                                   for amount, category, description, date in rows])
+        if expenses:
+            logging.info(f"Added {len(expenses)} expenses in one batch for user {self.user.user_id}.")
+            self._budget_alerts(expenses)
+        return expenses
+
+    def _budget_alerts(self, expenses):
+        """Returns (and logs) an alert for every budget threshold the just-stored expenses crossed."""
+        alerts = budgets.check_budgets(self.store, expenses)
+        if alerts:
+            names = self._category_names()
+            for alert in alerts:
+                alert["category"] = names.get(alert["category_id"])
+                logging.warning(f"Budget alert for user {self.user.user_id}: {budgets.alert_message(alert)}")
+        return alerts
+
+    def _category_names(self):
+        return {int(category_id): category["name"] for category_id, category in get_storage().categories().items()}
+
+    @metrics.timed("tracker.update")
+    @applog.operation("update")
+    def update(self, expense_id, **fields):
+        """Changes any of amount, category, description or date on an expense, returning the new record."""
+        expense = self.get(expense_id)
+        if expense is None:
+            raise ValueError(f"Expense ID {expense_id} not found.")
+        unknown = set(fields) - set(EDITABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot edit field(s): {', '.join(sorted(unknown))}.")
+
+        changes = {}
+        for field, value in fields.items():
+            if value is None:
+                continue
+            if field == "amount":
+                value = validate_amount(value)
+            elif field == "date":
+                value = validate_date(value)
+            elif field == "category":
+                field, value = "category_id", get_storage().category_id(value)  # Expenses store the id
+            elif field == "description":
+                value = value.strip()
+                if not value:
+                    raise ValueError("Description cannot be empty.")
+            if value != expense[field]:
+                changes[field] = value
+
+        if not changes:
+            return expense
+        updated = self.store.update(expense_id, changes)
+        logging.info(f"Expense {expense_id} updated by user {self.user.user_id}: {changes}.")
+        return updated
+
+    @metrics.timed("tracker.delete")
+    @applog.operation("delete")
+    def delete(self, expense_id):
+        """Removes an expense, returning the deleted record."""
+        if self.get(expense_id) is None:
+            raise ValueError(f"Expense ID {expense_id} not found.")
+        expense = self.store.delete(expense_id)
+        logging.info(f"Expense {expense_id} deleted by user {self.user.user_id}.")
+        return expense
+
+    @metrics.timed("tracker.query")
+    @applog.operation("query")
+    def query(self, start_date=None, end_date=None, category=None):
+        """Returns the user's expenses, optionally limited to a date range and/or one category."""
+        if start_date or end_date:
+            expenses = self.expenses_between(start_date or "0000-00-00", end_date or "9999-99-99")
         else:
-            print(f"[i] No budget set for {current_month}.")
-
-        print("\nExpenses by Category:")
-        category_totals = {}
-        for exp in user_expenses:
-            category_totals[exp["category"]] = category_totals.get(exp["category"], 0) + exp["amount"]
-        for cat, amt in category_totals.items():
-            print(f"  {cat:<20}: {amt:.2f}")
-
-    def set_budget(self, period, amount):
-        """Sets a budget for the user."""
-        data = load_data()
-        if str(self.user.user_id) not in data["budgets"]:
-            data["budgets"][str(self.user.user_id)] = {}
-        data["budgets"][str(self.user.user_id)][period] = amount
-        save_data(data)
-        logging.info(f"Budget set for {period}: {amount} by user {self.user.user_id}.")
-        print(f"[+] Budget set for {period}: {amount:.2f}")
-
-    def edit_expense(self):
-        """Allows the user to edit an existing expense."""
-        self.list_expenses()
+            expenses = self.store.all()
+        if category:
+            expenses = [exp for exp in expenses if exp["category"] == category]
+        return expenses
+
+    def iter_expenses(self, sort="date", cursor=None, start_date=None, end_date=None, category=None,
+                      min_amount=None, max_amount=None, text=None, search=None):
+        """Returns a generator over the expenses matching every given filter, in sort order, starting after cursor.
+
+        search is keyword search: every word in it must start a word of the description or of the category name,
+        so "gro uber" finds "Uber to the grocery store". It is answered from an inverted index rather than by
+        reading every expense. Filters are validated here (raising ValueError), so errors surface before the first
+        expense is read.
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Unknown sort '{sort}'. Choose one of: {', '.join(SORTS)}.")
+        filters = {"start_date": validate_date(start_date) if start_date else None,
+                   "end_date": validate_date(end_date) if end_date else None, "text": text or None,
+                   "search": search or None}
+        for name, amount in (("min_amount", min_amount), ("max_amount", max_amount)):
+            try:
+                filters[name] = float(amount) if amount not in (None, "") else None
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid amount '{amount}'.")
+        field, _, descending = SORTS[sort]
+        given = {"start_date": start_date, "end_date": end_date, "category": category, "min_amount": min_amount,
+                 "max_amount": max_amount, "text": text, "search": search}
+        after = decode_cursor(cursor, sort, given) if cursor else None
+        if category:
+            try:
+                filters["category_id"] = get_storage().category_id(category)
+            except ValueError:
+                return iter(())  # No expense can be in a category that does not exist
+        return self.store.scan(field, descending, after, filters)
+
+    @metrics.timed("tracker.page")
+    @applog.operation("page")
+    def page(self, limit=PAGE_SIZE, cursor=None, sort="date", **filters):
+        """Returns one page of matching expenses plus the cursor for the next page (None on the last page).
+
+        Only limit + 1 expenses are read, so memory is bounded by the page size however long the history is.
+        """
         try:
-            expense_id = int(input("Enter Expense ID to edit: "))
-        except ValueError:
-            print("[!] Invalid Expense ID.")
-            return
-
-        data = load_data()
-        user_expenses = data["expenses"].get(str(self.user.user_id), [])
-        for expense in user_expenses:
-            if expense["expense_id"] == expense_id:
-                try:
-                    new_amount = float(input("Enter new amount: ").strip())
-                    new_description = input("Enter new description: ").strip()
-                    expense["amount"] = new_amount
-                    expense["description"] = new_description
-                    save_data(data)
-                    print("[+] Expense updated successfully.")
-                    return
-                except ValueError:
-                    print("[!] Invalid input.")
-                    return
-        print("[!] Expense ID not found.")
-
-    def delete_expense(self):
-        """Allows the user to delete an expense."""
-        self.list_expenses()
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid page size '{limit}'.")
+        if limit < 1:
+            raise ValueError("Page size must be at least 1.")
+        expenses = list(itertools.islice(self.iter_expenses(sort, cursor, **filters), limit + 1))
+        next_cursor = encode_cursor(sort, expenses[limit - 1], filters) if len(expenses) > limit else None
+        return {"expenses": expenses[:limit], "next_cursor": next_cursor}
+
+    def expenses_between(self, start_date, end_date):
+        """Returns the user's expenses dated between start_date and end_date (YYYY-MM-DD), inclusive."""
+        return self.store.between(start_date, end_date)
+
+    @metrics.timed("tracker.summary")
+    @applog.operation("summary")
+    def summary(self, start_month=None, end_month=None):
+        """Returns totals for a month or month range (default: this month), plus the overall budget for a single
+        month."""
+        start_month = validate_month(start_month) if start_month else datetime.datetime.now().strftime("%Y-%m")
+        end_month = validate_month(end_month) if end_month else start_month
+        total, by_category = self.store.summary(start_month, end_month)
+        budget = self.store.budget(start_month) if start_month == end_month else None
+        return {
+            "start_month": start_month,
+            "end_month": end_month,
+            "total": total,
+            "by_category": by_category,
+            "budget": budget,
+            "remaining": round(budget - total, 2) if budget is not None else None,
+        }
+
+    @metrics.timed("tracker.set_budget")
+    @applog.operation("set_budget")
+    def set_budget(self, period, amount, category=None):
+        """Sets the user's budget for a YYYY-MM month or an 'Nd' rolling window (the N days up to each expense),
+        overall or for one category."""
+        period = budgets.validate_period(period)
         try:
-            expense_id = int(input("Enter Expense ID to delete: "))
-        except ValueError:
-            print("[!] Invalid Expense ID.")
-            return
-
-        data = load_data()
-        user_expenses = data["expenses"].get(str(self.user.user_id), [])
-        updated_expenses = [exp for exp in user_expenses if exp["expense_id"] != expense_id]
-        if len(updated_expenses) == len(user_expenses):
-            print("[!] Expense ID not found.")
-            return
-
-        data["expenses"][str(self.user.user_id)] = updated_expenses
-        save_data(data)
-        print("[+] Expense deleted successfully.")
+            amount = float(amount)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid budget amount '{amount}'.")
+        category_id = get_storage().category_id(category) if category else None
+        self.store.set_budget(period, amount, category_id)
+        scope = f" ({category})" if category else ""
+        logging.info(f"Budget set for {period}{scope}: {amount} by user {self.user.user_id}.")
+        return amount
+
+    @metrics.timed("tracker.budget_status")
+    @applog.operation("budget_status")
+    def budget_status(self, date=None):
+        """Returns spent-so-far against every budget in force on date (default: today): the month's, overall and
+        per category, and each rolling window ending that day."""
+        date = validate_date(date) if date else datetime.datetime.now().strftime("%Y-%m-%d")
+        status = budgets.budget_status(self.store, date)
+        names = self._category_names()
+        for entry in status:
+            entry["category"] = names.get(entry["category_id"])
+        # Budgets on a category that has since been deleted no longer apply to anything
+        return [entry for entry in status if entry["category_id"] is None or entry["category"] is not None]
+
+    def verify_rollups(self, rebuild=False):
+        """Recomputes precomputed totals from raw expenses, returning drifted cells and optionally repairing them."""
+        drift = self.store.verify_rollups(rebuild)
+        if drift and rebuild:
+            logging.info(f"Rebuilt rollups for user {self.user.user_id} ({len(drift)} cells drifted).")
+        return drift
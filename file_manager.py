@@ -1,44 +1,616 @@
 # file_manager.py - Handles File-Based I/O with User-Specific Storage & Logging
+import copy
+import gc
 import json
 import os
 import logging
+import zlib
+from contextlib import contextmanager, suppress
 from hashlib import sha256
+import applog
+import metrics
+from columns import ExpenseColumns, decode_shard, dump_shard
 
-DATA_FILE = "data.json"
-LOG_FILE = "app.log"
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, so only one process should use the data at a time
+    fcntl = None
 
-# Initialize logging
-logging.basicConfig(filename=LOG_FILE, level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+DATA_FILE = "data.json"         # Global file: users and categories
+JOURNAL_FILE = "data.journal"
+SHARD_DIR = "shards"            # One segment per user for expenses and budgets, plus its search index
 
-# Ensure data file exists
-if not os.path.exists(DATA_FILE):
-    with open(DATA_FILE, "w") as f:
-        json.dump({"users": [], "expenses": {}, "categories": {}, "budgets": {}}, f)
+JOURNAL_ENABLED = True    # Append changes to the journal; off, every commit rewrites the snapshot as a new generation
+COMPACT_THRESHOLD = 500   # Journal records kept before they are folded into a new snapshot
+COMPACT_BYTES = 4 * 1024 * 1024  # Journal size that also triggers compaction once it outgrows the snapshot
 
-def load_data():
-    """Loads data from the JSON file. Logs if an error occurs."""
+# Initialize logging (queued, rotating; see applog.py) unless the entry point already configured it
+applog.ensure_configured()
+
+EMPTY_GLOBAL = {"users": [], "categories": {}, "meta": {"categories_by_id": True}}
+EMPTY_SHARD = {"expenses": {}, "budgets": {}, "rollups": {}}
+
+
+class Journal:
+    """Append-only log of changes applied on top of the data.json snapshot."""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = 0      # Records currently in the journal file
+        self.bytes = 0        # Size of the intact part of the journal file
+        self.last_seq = 0     # Sequence number of the newest record seen
+
+    def replay(self, data, offset=0):
+        """Applies every intact journal record from offset on to data, dropping a torn tail left by a crash."""
+        if offset == 0:
+            self.records = 0
+            self.bytes = 0
+            self.last_seq = data.get("meta", {}).get("journal_seq", 0)
+        if not os.path.exists(self.path):
+            return
+
+        good_offset = offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                record = self._decode(line)
+                if record is None:
+                    logging.warning(f"Discarding torn journal tail in {self.path} at byte {good_offset}.")
+                    break
+                good_offset += len(line)
+                self.records += 1
+                if record["seq"] <= self.last_seq:
+                    continue  # Already part of the snapshot (crash during compaction)
+                for change in record["changes"]:
+                    apply_change(data, change)
+                self.last_seq = record["seq"]
+
+        metrics.count("bytes_read", good_offset - offset)
+        self.bytes = good_offset
+        if good_offset != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(good_offset)
+
+    @metrics.timed("storage.journal_append")
+    def append(self, changes):
+        """Durably appends one record holding a list of changes. On failure the sequence number is given back,
+        any partly written line is cut off again, and the error is raised."""
+        payload = json.dumps({"seq": self.last_seq + 1, "changes": changes}, separators=(",", ":")).encode()
+        line = b"%08x %s\n" % (zlib.crc32(payload), payload)  # Bytes, so no platform turns \n into \r\n
+        with open(self.path, "ab") as f:
+            end = f.tell()
+            try:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                with suppress(OSError):
+                    f.truncate(end)
+                raise
+        self.last_seq += 1
+        self.records += 1
+        self.bytes += len(line)
+        metrics.count("bytes_written", len(line))
+
+    def read(self):
+        """Yields the intact records in the journal file without applying them."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = self._decode(line)
+                if record is None:
+                    return
+                yield record
+
+    def reset(self):
+        """Empties the journal once its records are part of the snapshot."""
+        with open(self.path, "w"):
+            pass
+        self.records = 0
+        self.bytes = 0
+
+    @staticmethod
+    def _decode(line):
+        """Returns the record stored on a journal line, or None if the line is incomplete or corrupt."""
+        if not line.endswith(b"\n"):
+            return None
+        checksum, _, payload = line.rstrip(b"\r\n").partition(b" ")  # \r\n: journals written in text mode on Windows
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+
+class DataStore:
+    """Process-wide cache of the snapshot plus journal, shared safely between processes through a lock file.
+
+    Writers are optimistic: changes are computed from the cached data without holding the lock, then the lock
+    is taken and the generation re-checked. If another process committed in between, the cache catches up on
+    the new journal records and the changes are recomputed before anything is written.
+    """
+
+    def __init__(self, data_file, journal_file, empty=None, decode=None, dump=None, after_save=None):
+        self.data_file = data_file
+        self.journal = Journal(journal_file)
+        self.lock_file = os.path.splitext(data_file)[0] + ".lock"
+        self.empty = empty if empty is not None else EMPTY_GLOBAL
+        self.decode = decode or (lambda data: data)  # Turns freshly loaded JSON into the in-memory form
+        self.dump = dump or _dump_json               # Writes the in-memory form back out as JSON
+        self.after_save = after_save                 # Called with the store after each snapshot it writes
+        self.data = None
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0      # Commits recomputed because another process wrote first
+        self.version = 0        # Bumped whenever the cache picks up data it did not write itself
+        self._signature = None  # (inode, mtime, size) of the snapshot and journal when last read or written
+        self._pending = None    # Changes held back by batch() until the block ends
+        self._lock_fd = None
+        self._lock_depth = 0
+
+    @property
+    def generation(self):
+        """Sequence number of the newest change in memory; grows with every commit from any process."""
+        return self.journal.last_seq
+
+    def snapshot_stat(self):
+        """Returns [inode, mtime, size] of the snapshot the cached data was read from or last written to, or None
+        if there is none; anything saved alongside a snapshot can be matched to it by this."""
+        return list(self._signature[0]) if self._signature and self._signature[0] else None
+
+    def changes_since(self, seq):
+        """Yields, oldest first, the changes committed after generation seq that are not in the snapshot: the
+        journal's, then any a batch is still holding back."""
+        for record in self.journal.read():
+            if record["seq"] > seq:
+                yield from record["changes"]
+        yield from self._pending or ()
+
+    def get(self):
+        """Returns the cached data, catching up with the files only if someone else changed them."""
+        if self.data is not None and self._stat() == self._signature:
+            self.hits += 1
+            metrics.count("storage.cache_hits")
+            return self.data
+        self.misses += 1
+        metrics.count("storage.cache_misses")
+        with metrics.timer("storage.load"), self.lock(shared=True):
+            self._refresh()
+        return self.data
+
+    def commit(self, changes):
+        """Applies a fixed list of changes to the cached data and persists them as a single journal record."""
+        self.transact(lambda data: changes)
+
+    def transact(self, build):
+        """Persists the changes build(data) returns, re-running build on fresh data if another process wrote first.
+
+        build must only read data; it may raise to abort. Returns the list of changes committed.
+        """
+        data = self.get()
+        generation = self.generation
+        changes = build(data)
+        with self.lock():
+            if self.data is None or self._stat() != self._signature:
+                self._refresh()
+            if self.generation != generation:
+                self.conflicts += 1
+                metrics.count("storage.conflicts")
+                changes = build(self.data)  # The lock is held, so this attempt cannot conflict
+            if not changes:
+                return changes
+            for change in changes:
+                apply_change(self.data, change)
+            if self._pending is not None:
+                self._pending.extend(changes)
+            else:
+                self._write(changes)
+        return changes
+
+    @contextmanager
+    def batch(self):
+        """Groups every commit made inside the block into one journal record written when it ends.
+
+        The lock is held for the whole block, so other processes wait instead of conflicting with it.
+        """
+        if self._pending is not None:
+            yield self  # Already batching; the outer block writes
+            return
+        with self.lock():
+            self.get()
+            self._pending = []
+            try:
+                yield self
+            except BaseException:
+                self._pending = None
+                self.invalidate()  # Forget the half-applied changes; disk still holds the last good state
+                raise
+            pending, self._pending = self._pending, None
+            if pending:
+                self._write(pending)
+
+    def rewrite(self, mutate):
+        """Edits the cached data in place with mutate(data) and writes it out as a new snapshot, all under the lock.
+
+        For bulk edits that would make an oversized journal record. The generation still advances, so another
+        process's pending transact() sees the conflict and rebuilds on top of the rewritten data. Returns what
+        mutate returns; if it or the snapshot write raises, the cache is dropped, disk keeps the last good state
+        and the error is raised.
+        """
+        with self.lock():
+            if self.data is None or self._stat() != self._signature:
+                self._refresh()
+            try:
+                result = mutate(self.data)
+            except BaseException:
+                self.invalidate()
+                raise
+            if self._pending:
+                self._pending.clear()  # Already applied to the data the snapshot is written from
+            self._save_generation()
+        return result
+
+    @contextmanager
+    def lock(self, shared=False):
+        """Holds the store's lock file: shared while reading, exclusive while writing. Re-entrant in one process."""
+        if self._lock_depth or fcntl is None:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_depth = 1
+            yield
+        finally:
+            self._lock_depth = 0
+            os.close(self._lock_fd)  # Closing the descriptor releases the lock
+            self._lock_fd = None
+
+    def _refresh(self):
+        """Brings the cache up to date, replaying only the new journal tail when the snapshot is unchanged."""
+        signature = self._stat()
+        old = self._signature
+        if (self.data is not None and old is not None and signature[0] == old[0]
+                and signature[1] is not None and signature[1][2] >= self.journal.bytes):
+            try:
+                self.journal.replay(self.data, self.journal.bytes)
+            except Exception as e:
+                logging.error(f"Error replaying journal: {e}")
+        else:
+            self.data = self._read()
+        self._signature = self._stat()
+        self.version += 1
+
+    def _write(self, changes):
+        """Persists already-applied changes as one journal record, compacting when it grows too large. If the
+        record cannot be written the cache is dropped and the error raised, so the caller never sees a change
+        succeed that is not on disk."""
+        if not JOURNAL_ENABLED:
+            self._save_generation()
+            return
+        try:
+            self.journal.append(changes)
+        except Exception as e:
+            logging.error(f"Error writing journal: {e}")
+            self.invalidate()  # The changes are applied in memory only; reload what disk actually holds
+            raise
+        if self._needs_compaction():
+            logging.info(f"Compacting {self.journal.records} journal records into {self.data_file}.")
+            with suppress(Exception):
+                self.save()  # The record is already durable in the journal; a failed compaction is retried later
+        self._signature = self._stat()
+
+    def _save_generation(self):
+        """Writes the cached data as a snapshot that is a generation of its own, so other processes' optimistic
+        checks see it: the new sequence number is stored in the snapshot's meta.journal_seq."""
+        self.journal.last_seq += 1
+        try:
+            self.save()
+        except BaseException:
+            self.journal.last_seq -= 1  # Nothing was written, so no other process will see a new generation
+            raise
+
+    @metrics.timed("storage.snapshot_write")
+    def save(self, data=None):
+        """Atomically writes a full snapshot (temp file + rename) and clears the journal. On failure the error is
+        logged and raised, and the cache is dropped so the next read sees what disk actually holds."""
+        if data is not None:
+            self.data = self.decode(data)
+        with self.lock():
+            data = self.data
+            tmp_file = self.data_file + ".tmp"
+            try:
+                data.setdefault("meta", {})["journal_seq"] = self.journal.last_seq
+                with open(tmp_file, "w") as f:
+                    self.dump(data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    metrics.count("bytes_written", f.tell())
+                os.replace(tmp_file, self.data_file)
+                _fsync_dir(self.data_file)
+                self.journal.reset()
+                logging.info("Data saved successfully.")
+            except Exception as e:
+                logging.error(f"Error saving data: {e}")
+                with suppress(OSError):
+                    os.remove(tmp_file)
+                self.invalidate()
+                raise
+            self._signature = self._stat()
+            if self.after_save is not None:
+                self.after_save(self)
+
+    def _needs_compaction(self):
+        """Compacts after many records, or once the journal is bigger than the snapshot it patches."""
+        if self.journal.records >= COMPACT_THRESHOLD:
+            return True
+        if self.journal.bytes < COMPACT_BYTES:
+            return False
+        try:
+            return self.journal.bytes >= os.path.getsize(self.data_file)
+        except OSError:
+            return True
+
+    def invalidate(self):
+        """Drops the cached data so the next read goes back to disk."""
+        self.data = None
+        self._signature = None
+
+    def cache_stats(self):
+        """Returns the cache hit/miss counters."""
+        return {"hits": self.hits, "misses": self.misses, "conflicts": self.conflicts, "generation": self.generation}
+
+    def _read(self):
+        """Loads data from the JSON snapshot and replays the journal. Logs if an error occurs."""
+        try:
+            with open(self.data_file, "r") as f, gc_paused():
+                data = self.decode(json.load(f))
+                metrics.count("bytes_read", f.tell())
+        except FileNotFoundError:
+            data = self.decode(copy.deepcopy(self.empty))
+        except Exception as e:
+            logging.error(f"Error loading data: {e}")
+            return self.decode(copy.deepcopy(self.empty))
+        try:
+            self.journal.replay(data)
+        except Exception as e:
+            logging.error(f"Error replaying journal: {e}")
+        return data
+
+    def _stat(self):
+        """Returns the inode, modification time and size of the snapshot and the journal."""
+        signature = []
+        for path in (self.data_file, self.journal.path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+
+@contextmanager
+def gc_paused():
+    """Holds off the cyclic garbage collector while a snapshot is turned into objects. A large load would
+    otherwise trigger collections that traverse every object built so far without freeing any."""
+    enabled = gc.isenabled()
+    gc.disable()
     try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except Exception as e:
-        logging.error(f"Error loading data: {e}")
-        return {"users": [], "expenses": {}, "categories": {}, "budgets": {}}
+        yield
+    finally:
+        if enabled:
+            gc.enable()
 
-def save_data(data):
-    """Saves data to the JSON file. Logs success or failure."""
+
+def _dump_json(data, f):
+    json.dump(data, f, indent=4)
+
+
+def _fsync_dir(path):
+    """Flushes the directory entry of a just-renamed file so the rename survives a crash (POSIX only)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
     try:
-        with open(DATA_FILE, "w") as f:
-            json.dump(data, f, indent=4)
-        logging.info("Data saved successfully.")
-    except Exception as e:
-        logging.error(f"Error saving data: {e}")
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+store = DataStore(DATA_FILE, JOURNAL_FILE)
+_user_stores = {}
+
+
+def load_data():
+    """Returns the shared in-memory data, loading it from disk on first use or after an outside change."""
+    return store.get()
+
+def save_data(data):
+    """Saves a full snapshot to the JSON file and clears the journal."""
+    store.save(data)
+
+def commit(changes):
+    """Persists a list of changes as one journal record and applies them to the shared data."""
+    store.commit(changes)
+
+def transact(build):
+    """Commits the changes build(data) computes from the latest global data, retrying if another process wrote."""
+    return store.transact(build)
+
+
+def user_store(user_id):
+    """Returns the DataStore for one user's shard, opening it on first use."""
+    key = str(user_id)
+    if key not in _user_stores:
+        os.makedirs(SHARD_DIR, exist_ok=True)
+        path = os.path.join(SHARD_DIR, f"user_{key}")
+        # Expenses are held as ExpenseColumns in memory (see columns.py) and streamed back out on save
+        _user_stores[key] = DataStore(path + ".json", path + ".journal", empty=EMPTY_SHARD,
+                                      decode=decode_shard, dump=dump_shard)
+    return _user_stores[key]
+
+def search_file(user_id):
+    """Returns the path of the file a user's search index is kept in between runs."""
+    return os.path.join(SHARD_DIR, f"user_{user_id}.search")
+
+def load_user_data(user_id):
+    """Returns a user's expenses and budgets without touching any other user's data."""
+    return user_store(user_id).get()
+
+def commit_user(user_id, changes):
+    """Persists a list of changes to a user's shard as one journal record."""
+    user_store(user_id).commit(changes)
+
+def transact_user(user_id, build):
+    """Commits the changes build(shard) computes from a user's latest shard; only that user's lock is taken."""
+    return user_store(user_id).transact(build)
+
+def rewrite_user(user_id, mutate):
+    """Applies an in-place bulk edit to a user's shard and snapshots it in one step (see DataStore.rewrite)."""
+    return user_store(user_id).rewrite(mutate)
+
+def release_user(user_id):
+    """Drops a user's cached shard, for passes over every user that should not keep them all in memory."""
+    _user_stores.pop(str(user_id), None)
+
+def shard_user_ids():
+    """Returns the IDs of every user that has a shard on disk, including one that so far is only a journal."""
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    return sorted({int(stem[len("user_"):]) for stem, ext in map(os.path.splitext, os.listdir(SHARD_DIR))
+                   if stem.startswith("user_") and stem[len("user_"):].isdigit() and ext in (".json", ".journal")})
+
+def migrate_to_shards():
+    """One-shot split of a monolithic data.json into the global file plus one shard per user. If any shard
+    cannot be written the error is raised and data.json keeps its copy, so the next start repeats the split."""
+    data = store.get()
+    if "expenses" not in data and "budgets" not in data:
+        return False
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    expenses = data.get("expenses", {})
+    budgets = data.get("budgets", {})
+    for user_id in set(expenses) | set(budgets):
+        shard = {"expenses": {}, "budgets": budgets.get(user_id, {})}
+        for expense in expenses.get(user_id, []):
+            key = str(expense.get("expense_id"))
+            if key in shard["expenses"]:
+                new_id = max(int(k) for k in shard["expenses"]) + 1
+                logging.warning(f"Duplicate expense ID {key} for user {user_id} renumbered to {new_id}.")
+                expense["expense_id"] = new_id
+                key = str(new_id)
+            shard["expenses"][key] = expense
+        user_store(user_id).save(shard)  # Raises if the shard did not reach disk
+
+    # Every shard is on disk before the global file drops its copy, so a crash here only repeats the split
+    data.pop("expenses", None)
+    data.pop("budgets", None)
+    store.save(data)
+    logging.info(f"Migrated {len(set(expenses) | set(budgets))} users to per-user shards in {SHARD_DIR}.")
+    return True
+
+
+def migrate_category_ids():
+    """One-shot switch of every shard from category names to category_id references into the global table.
+
+    Names the table does not know are added to it first (committed before the shard that uses them is
+    rewritten), so a crash part-way only repeats the remaining shards on the next start.
+    """
+    data = store.get()
+    if data.get("meta", {}).get("categories_by_id"):
+        return False
+
+    # Tables written by older versions may hold int keys or ids that disagree with their keys
+    table = {}
+    for key, category in data.get("categories", {}).items():
+        category_id = int(category.get("category_id", key))
+        table[str(category_id)] = dict(category, category_id=category_id, used=True)  # Until proven otherwise
+    if table != data.get("categories"):
+        commit([set_change(["categories"], table)])
+    ids = {}
+    for category in sorted(table.values(), key=lambda category: category["category_id"], reverse=True):
+        ids[category["name"]] = category["category_id"]  # Duplicate names resolve to the lowest id
+    next_id = max((int(key) for key in table), default=0) + 1
+
+    def rename(shard):
+        nonlocal next_id
+        records = []
+        for record in shard["expenses"].values():
+            if record.get("category_id") is None and "category" in record:
+                name = str(record.pop("category"))
+                if name not in ids:
+                    ids[name] = next_id
+                    commit([set_change(["categories", str(next_id)],
+                                       {"category_id": next_id, "name": name, "user_id": None, "used": True})])
+                    next_id += 1
+                record["category_id"] = ids[name]
+            records.append(record)
+        shard["expenses"] = ExpenseColumns(records)
+        shard["rollups"] = shard["expenses"].rollups()
+
+    migrated = 0
+    for user_id in shard_user_ids():
+        expenses = load_user_data(user_id)["expenses"]
+        if None in (extra.get("category_id", 0) for extra in expenses.extras.values()):
+            rewrite_user(user_id, rename)
+            migrated += 1
+        release_user(user_id)
+    commit([set_change(["meta", "next_category_id"], next_id), set_change(["meta", "categories_by_id"], True)])
+    logging.info(f"Migrated {migrated} shards to category ids.")
+    return True
+
+
+def set_change(path, value):
+    """Change that stores value at path, creating missing parent dicts."""
+    return {"op": "set", "path": path, "value": value}
+
+def delete_change(path):
+    """Change that removes the key at path."""
+    return {"op": "delete", "path": path}
+
+def append_change(path, value):
+    """Change that appends value to the list at path."""
+    return {"op": "append", "path": path, "value": value}
+
+def update_change(path, field, match, value):
+    """Change that merges value into the first item of the list at path whose field equals match."""
+    return {"op": "update", "path": path, "match": [field, match], "value": value}
+
+def apply_change(data, change):
+    """Applies a single change to the in-memory data."""
+    *parents, key = change["path"]
+    target = data
+    for part in parents:
+        target = target.setdefault(part, {})
+    op = change["op"]
+    if op == "set":
+        target[key] = change["value"]
+    elif op == "delete":
+        target.pop(key, None)
+    elif op == "append":
+        target.setdefault(key, []).append(change["value"])
+    elif op == "update":
+        field, match = change["match"]
+        for item in target.get(key, []):
+            if item.get(field) == match:
+                item.update(change["value"])
+                break
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+
 
 def hash_password(password):
     """Encrypts the password using SHA-256."""
+    metrics.count("auth.password_hashes")
     return sha256(password.encode()).hexdigest()
 
+@metrics.timed("auth.verify_password")
 def verify_password(stored_password, input_password):
     """Verifies the hashed password."""
     return stored_password == hash_password(input_password)
-
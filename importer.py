@@ -0,0 +1,198 @@
+# importer.py - Streaming Bulk Import of Bank CSV/OFX Statements
+import csv
+import datetime
+import itertools
+import json
+import logging
+import re
+import time
+
+BATCH_SIZE = 1000
+DEBIT_SIGNS = ("negative", "positive")  # Sign an amount carries when money leaves the account
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d.%m.%Y", "%Y%m%d")
+
+# Header names used by common bank exports for each field we need
+CSV_COLUMNS = {
+    "date": ("date", "transaction date", "posted date", "posting date", "booking date"),
+    "amount": ("amount", "debit", "transaction amount", "value"),
+    "description": ("description", "memo", "payee", "name", "details", "narrative"),
+    "category": ("category",),
+}
+
+
+class ImportStats:
+    """Counters reported at the end of an import."""
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.credits = 0      # Money coming in (refunds, salary), skipped since it is not an expense
+        self.rejected = 0
+        self.started = time.perf_counter()
+
+    def rows_per_sec(self):
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"read={self.read} imported={self.imported} duplicates={self.duplicates} "
+                f"credits skipped={self.credits} rejected={self.rejected} ({self.rows_per_sec():.0f} rows/sec)")
+
+
+def read_csv(path):
+    """Yields raw {date, amount, description, category} rows from a bank CSV export. A signed amount column
+    holds debits as negative numbers; a "debit" column holds them as positive ones."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [column.strip().lower() for column in next(reader, [])]
+        positions = {}
+        for field, names in CSV_COLUMNS.items():
+            for name in names:
+                if name in header:
+                    positions[field] = header.index(name)
+                    break
+        missing = {"date", "amount", "description"} - set(positions)
+        if missing:
+            raise ValueError(f"CSV file is missing column(s): {', '.join(sorted(missing))}")
+        debit_sign = "positive" if header[positions["amount"]] == "debit" else "negative"
+        for line in reader:
+            row = {field: line[pos] if pos < len(line) else "" for field, pos in positions.items()}
+            row["debit_sign"] = debit_sign
+            yield row
+
+
+def read_ofx(path):
+    """Yields raw rows from the <STMTTRN> blocks of an OFX (SGML or XML) statement, line by line. OFX amounts
+    are negative for debits."""
+    tag = re.compile(r"<(\w+)>([^<\r\n]*)")
+    transaction = None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            for name, value in tag.findall(line):
+                name = name.upper()
+                if name == "STMTTRN":
+                    transaction = {}
+                elif transaction is not None and name in ("TRNTYPE", "DTPOSTED", "TRNAMT", "NAME", "MEMO"):
+                    transaction[name] = value.strip()
+            if transaction is not None and "</STMTTRN>" in line.upper():
+                yield {"date": transaction.get("DTPOSTED", "")[:8],
+                       "amount": transaction.get("TRNAMT", ""),
+                       "description": transaction.get("NAME") or transaction.get("MEMO", ""),
+                       "credit": transaction.get("TRNTYPE", "").upper() == "CREDIT", "debit_sign": "negative"}
+                transaction = None
+
+
+def parse_rows(rows, stats, debit_sign=None):
+    """Validates dates and amounts, yielding normalized rows with positive amounts. Credits (amounts with the
+    other sign than debit_sign, by default the one the reader reports for the file) are counted and skipped,
+    as are rejected rows."""
+    for row in rows:
+        stats.read += 1
+        date = _parse_date(row["date"].strip())
+        amount = _parse_amount(row["amount"])
+        description = row["description"].strip()
+        if date is None or amount is None or not description:
+            stats.rejected += 1
+            logging.warning(f"Import row {stats.read} rejected: {row}")
+            continue
+        if row.get("credit") or (amount < 0) != ((debit_sign or row["debit_sign"]) == "negative"):
+            stats.credits += 1
+            continue
+        yield {"date": date, "amount": abs(amount), "description": description,
+               "category": row.get("category", "").strip()}
+
+
+def map_categories(rows, categories, rules, default, stats):
+    """Assigns each row an existing category: its own column, then the first matching rule, then default."""
+    by_name = {name.lower(): name for name in categories}
+    rules = [(keyword.lower(), by_name[category.lower()]) for keyword, category in rules.items()
+             if category.lower() in by_name]
+    for row in rows:
+        category = by_name.get(row["category"].lower())
+        if category is None:
+            description = row["description"].lower()
+            category = next((cat for keyword, cat in rules if keyword in description), default)
+        if category is None:
+            stats.rejected += 1
+            logging.warning(f"Import row {stats.read} rejected: no category for '{row['description']}'.")
+            continue
+        row["category"] = category
+        yield row
+
+
+def skip_duplicates(rows, seen, stats):
+    """Drops rows whose (date, amount, description) already exists for the user."""
+    for row in rows:
+        if expense_key(row) in seen:
+            stats.duplicates += 1
+            continue
+        yield row
+
+
+def expense_key(expense):
+    """Hash used to recognise an expense that was already imported."""
+    return hash((expense["date"], round(expense["amount"], 2), expense["description"].lower()))
+
+
+def import_file(tracker, path, rules=None, default_category=None, batch_size=BATCH_SIZE, debit_sign=None):
+    """Streams a CSV or OFX statement into the tracker, committing once per batch. debit_sign ("negative" or
+    "positive") overrides the sign the file's debits are taken to have."""
+    if debit_sign is not None and debit_sign not in DEBIT_SIGNS:
+        raise ValueError(f"Invalid debit sign '{debit_sign}'. Use {' or '.join(DEBIT_SIGNS)}.")
+    stats = ImportStats()
+    categories = tracker.categories()
+    if default_category is not None and default_category not in categories:
+        raise ValueError(f"Default category '{default_category}' does not exist.")
+    seen = {expense_key(exp) for exp in tracker.query()}
+
+    reader = read_ofx if path.lower().endswith((".ofx", ".qfx")) else read_csv
+    rows = parse_rows(reader(path), stats, debit_sign)
+    rows = map_categories(rows, categories, rules or {}, default_category, stats)
+    rows = skip_duplicates(rows, seen, stats)
+
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        tracker.add_many([(row["amount"], row["category"], row["description"], row["date"]) for row in batch])
+        stats.imported += len(batch)
+
+    logging.info(f"Imported {path} for user {tracker.user.user_id}: {stats}")
+    return stats
+
+
+def load_rules(path):
+    """Loads a {keyword: category} JSON rules file."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(value):
+    """Parses '-1,234.50', '1.234,50', '12,50', '$12.00' or '(12.00)' into a signed amount; None if it is not a
+    non-zero amount. The last of '.' and ',' is the decimal mark unless it is followed by three digits."""
+    value = (value or "").strip()
+    negative = value.startswith("-") or value.startswith("(") and value.endswith(")")
+    number = re.sub(r"[^\d.,]", "", value)
+    separators = [i for i, char in enumerate(number) if char in ".,"]
+    decimal = separators[-1] if separators else None
+    if decimal is not None and len(separators) == number.count(number[decimal]) and len(number) - decimal == 4:
+        decimal = None  # Only one kind of separator, three digits after it: '1,234' or '1.234.567'
+    groups = number[:decimal].replace(",", ".").split(".")
+    if not all(groups) or any(len(group) != 3 for group in groups[1:]):
+        return None  # Thousands separators must split the whole part into groups of three
+    whole = "".join(groups)
+    fraction = number[decimal + 1:] if decimal is not None else ""
+    if not whole.isdigit() or fraction and not fraction.isdigit():
+        return None
+    amount = round(float(f"{whole}.{fraction or 0}"), 2)
+    return (-amount if negative else amount) or None
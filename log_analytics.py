@@ -0,0 +1,164 @@
+# log_analytics.py - Streaming Reports over app.log and Its Rotated Files
+import datetime
+import glob
+import heapq
+import json
+import os
+import re
+from collections import deque
+
+TEXT_LINE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}) - (\w+) - (.*)$")
+FAILED_LOGIN = re.compile(r"^Failed login attempt for username '(.*)'")
+OP_RECORD = re.compile(r"^op=(\w+) user_id=(\S+) latency_ms=([\d.]+) ok=(\w+)")
+DATE_SUFFIX = re.compile(r"^\d{4}-\d\d-\d\d(_\d\d(-\d\d){0,2})?$")  # TimedRotatingFileHandler's suffixes
+
+BURST_THRESHOLD = 5   # Failed logins for one username ...
+BURST_WINDOW = 60     # ... within this many seconds count as a burst
+TOP = 10
+
+
+def log_files(path="app.log"):
+    """Returns the log and its rotated siblings, oldest first (app.log.5 ... app.log.1, app.log). Other files
+    next to it, such as the app.log.lock rotation lock, are left out."""
+    rotated = []
+    for name in glob.glob(glob.escape(path) + ".*"):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            rotated.append(((0, -int(suffix)), name))  # Size rotation: higher numbers are older
+        elif DATE_SUFFIX.match(suffix):
+            rotated.append(((1, suffix), name))  # Time rotation: date suffixes sort chronologically
+    files = [name for _, name in sorted(rotated)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_records(paths):
+    """Yields (timestamp, level, message, fields) per log line, text or JSON, one line in memory at a time."""
+    last_stamp, last_time = None, None
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("{"):
+                    try:
+                        entry = json.loads(line)
+                        stamp = entry["ts"][:19]
+                        millis = int(entry["ts"][20:23] or 0)
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    level, message, fields = entry.get("level"), entry.get("msg", ""), entry
+                else:
+                    match = TEXT_LINE.match(line)
+                    if match is None:
+                        continue  # Traceback or other continuation line
+                    stamp, millis = match.group(1).replace(" ", "T"), int(match.group(2))
+                    level, message, fields = match.group(3), match.group(4), _text_fields(match.group(4))
+                if stamp != last_stamp:  # Lines arrive in time order, so one parse per distinct second
+                    try:
+                        last_time = datetime.datetime.strptime(stamp, "%Y-%m-%dT%H:%M:%S")
+                    except ValueError:
+                        continue
+                    last_stamp = stamp
+                yield last_time + datetime.timedelta(milliseconds=millis), level, message, fields
+
+
+def _text_fields(message):
+    """Recovers the structured fields from a text-format message."""
+    match = OP_RECORD.match(message)
+    if match:
+        user_id = match.group(2)
+        return {"operation": match.group(1), "user_id": int(user_id) if user_id.isdigit() else user_id,
+                "latency_ms": float(match.group(3)), "ok": match.group(4) == "True"}
+    match = FAILED_LOGIN.match(message)
+    if match:
+        return {"operation": "login_failed", "username": match.group(1)}
+    return {}
+
+
+def analyze(paths, burst_threshold=BURST_THRESHOLD, burst_window=BURST_WINDOW, top=TOP):
+    """Streams the logs once and returns failed-login bursts, operations per user per day and the slowest
+    operations. Memory depends on distinct usernames and (user, day) pairs, never on the size of the logs."""
+    window = datetime.timedelta(seconds=burst_window)
+    recent_failures = {}  # username -> deque of the last burst_threshold failure times
+    logins = {}           # username -> {"failures", "bursts", "in_burst", "largest_burst", "last_burst"}
+    per_user_day = {}     # (day, user_id) -> operation count
+    operations = {}       # operation -> [count, total latency]
+    slowest = []          # Min-heap of the top slowest (latency, time, operation, user_id)
+    lines = 0
+
+    for when, _, _, fields in read_records(paths):
+        lines += 1
+        operation = fields.get("operation")
+        if operation == "login_failed":
+            username = fields.get("username", "?")
+            times = recent_failures.get(username)
+            if times is None:
+                times = recent_failures[username] = deque(maxlen=burst_threshold)
+                logins[username] = {"failures": 0, "bursts": 0, "in_burst": 0, "largest_burst": 0,
+                                    "last_burst": None}
+            stats = logins[username]
+            stats["failures"] += 1
+            if times and when - times[-1] > window:
+                stats["in_burst"] = 0  # A quiet gap ends the current burst
+            times.append(when)
+            if stats["in_burst"]:
+                stats["in_burst"] += 1
+            elif len(times) == burst_threshold and when - times[0] <= window:
+                stats["bursts"] += 1
+                stats["in_burst"] = burst_threshold
+                stats["last_burst"] = times[0].isoformat(sep=" ", timespec="seconds")
+            stats["largest_burst"] = max(stats["largest_burst"], stats["in_burst"])
+        elif "latency_ms" in fields and operation:
+            latency = fields["latency_ms"]
+            key = (when.date().isoformat(), fields.get("user_id"))
+            per_user_day[key] = per_user_day.get(key, 0) + 1
+            totals = operations.setdefault(operation, [0, 0.0])
+            totals[0] += 1
+            totals[1] += latency
+            entry = (latency, when.isoformat(sep=" ", timespec="milliseconds"), operation, fields.get("user_id"))
+            if len(slowest) < top:
+                heapq.heappush(slowest, entry)
+            elif entry > slowest[0]:
+                heapq.heapreplace(slowest, entry)
+
+    for stats in logins.values():
+        del stats["in_burst"]
+    return {
+        "files": paths,
+        "lines": lines,
+        "burst_rule": {"failures": burst_threshold, "seconds": burst_window},
+        "failed_logins": {name: stats for name, stats in sorted(logins.items(),
+                                                                key=lambda item: -item[1]["failures"])},
+        "operations_per_user_per_day": [{"day": day, "user_id": user_id, "operations": count}
+                                        for (day, user_id), count in sorted(per_user_day.items(),
+                                                                            key=lambda item: str(item[0]))],
+        "operations": {name: {"count": count, "mean_ms": round(total / count, 3)}
+                       for name, (count, total) in sorted(operations.items())},
+        "slowest": [{"latency_ms": latency, "time": when, "operation": operation, "user_id": user_id}
+                    for latency, when, operation, user_id in sorted(slowest, reverse=True)],
+    }
+
+
+def print_report(report, top=TOP):
+    """Prints the analyze() result as terminal tables."""
+    print(f"\n=== Log Report: {report['lines']} records in {len(report['files'])} file(s) ===")
+    rule = report["burst_rule"]
+    print(f"\nFailed logins (burst = {rule['failures']}+ failures within {rule['seconds']} s):")
+    if not report["failed_logins"]:
+        print("  none")
+    for username, stats in list(report["failed_logins"].items())[:top]:
+        print(f"  {username:<24}{stats['failures']:>6} failed  {stats['bursts']:>4} burst(s)"
+              f"  largest {stats['largest_burst']:>4}  last burst {stats['last_burst'] or '-'}")
+
+    print("\nOperations per user per day (busiest first):")
+    busiest = sorted(report["operations_per_user_per_day"], key=lambda row: -row["operations"])[:top]
+    if not busiest:
+        print("  none")
+    for row in busiest:
+        print(f"  {row['day']}  user {str(row['user_id']):<8}{row['operations']:>8} operations")
+
+    print("\nSlowest operations:")
+    if not report["slowest"]:
+        print("  none")
+    for row in report["slowest"]:
+        print(f"  {row['latency_ms']:>10.3f} ms  {row['operation']:<12} user {str(row['user_id']):<8}{row['time']}")
@@ -0,0 +1,150 @@
+# metrics.py - Low-Overhead Timers, Counters and Latency Histograms for the Hot Paths
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_PER_DOUBLING = 8  # Histogram resolution: each bucket is ~9% wider than the one before it
+
+_enabled = os.environ.get("CHACHING_METRICS", "1") != "0"
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets: fixed memory, percentiles accurate to one bucket (~9%)."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = seconds * 1e6
+        index = int(math.log2(micros) * BUCKETS_PER_DOUBLING) if micros > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Returns the pct-th percentile in seconds (the upper edge of its bucket, capped at the maximum seen)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(2 ** ((index + 1) / BUCKETS_PER_DOUBLING) / 1e6, self.max)
+        return self.max
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    """Forgets every recorded timing and counter."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def record(name, seconds):
+    """Adds one latency sample for operation name."""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.record(seconds)
+
+def count(name, amount=1):
+    """Adds amount to counter name (bytes, cache hits, failed checks, ...)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+@contextmanager
+def timer(name):
+    """Times the block as one sample of operation name."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def timed(name):
+    """Decorator form of timer(); when instrumentation is off the only cost is one flag check."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                count(f"{name}.errors")
+                raise
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def report():
+    """Returns every operation's count and latency percentiles (ms) plus the counters, as plain data."""
+    with _lock:
+        operations = {
+            name: {"count": h.count, "total_ms": h.total * 1000, "mean_ms": h.total / h.count * 1000,
+                   "p50_ms": h.percentile(50) * 1000, "p95_ms": h.percentile(95) * 1000,
+                   "p99_ms": h.percentile(99) * 1000, "max_ms": h.max * 1000}
+            for name, h in sorted(_histograms.items())}
+        counters = dict(sorted(_counters.items()))
+    return {"enabled": _enabled, "operations": operations, "counters": counters}
+
+def export_json(path):
+    """Writes report() to a JSON file for offline analysis."""
+    data = dict(report(), exported_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+    return data
+
+def format_report(data=None):
+    """Renders report() as the table shown in the admin menu."""
+    data = data or report()
+    lines = [f"{'Operation':<32}{'Count':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Total ms':>12}"]
+    for name, op in data["operations"].items():
+        lines.append(f"{name:<32}{op['count']:>9}{op['p50_ms']:>10.3f}{op['p95_ms']:>10.3f}{op['p99_ms']:>10.3f}"
+                     f"{op['total_ms']:>12.1f}")
+    if not data["operations"]:
+        lines.append("(no operations recorded yet)")
+    counters = data["counters"]
+    lines.append("")
+    lines.append(f"I/O: {counters.get('bytes_read', 0) / 1024:.1f} KiB read, "
+                 f"{counters.get('bytes_written', 0) / 1024:.1f} KiB written")
+    for name, value in counters.items():
+        if name not in ("bytes_read", "bytes_written"):
+            lines.append(f"{name:<32}{value:>9}")
+    return "\n".join(lines)
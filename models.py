@@ -1,8 +1,9 @@
-# models.py - User, Expense, Category, Budget Classes
+# models.py - User, Expense, Category Classes
 import itertools
 import datetime
 
 class User:
+    __slots__ = ("user_id", "username", "password", "role")
     _id_counter = itertools.count(1)
     def __init__(self, username: str, password: str, role="user", user_id=None):
         """Initializes a User object with unique IDs."""
@@ -19,37 +20,29 @@ class User:
 
 
 class Expense:
+    __slots__ = ("expense_id", "amount", "category_id", "description", "user_id", "date", "category")
     _id_counter = itertools.count(1)
 
-    def __init__(self, amount: float, category: str, description: str, user_id: int, date: str = None, expense_id=None):
-        """Initializes an Expense object."""
+    def __init__(self, amount: float, category_id: int, description: str, user_id: int, date: str = None,
+                 expense_id=None, category: str = None):
+        """Initializes an Expense object; category is the display name looked up from category_id, if known."""
         self.expense_id = expense_id if expense_id is not None else next(Expense._id_counter)
         self.amount = amount
+        self.category_id = category_id
         self.category = category
         self.description = description
         self.user_id = user_id
 
-        # If date is None, prompt the user for input instead of setting today's date automatically
-        if date is None:
-            while True:
-                date_input = input("Enter Date (YYYY-MM-DD) or press Enter for today's date: ").strip()
-                if not date_input:
-                    self.date = datetime.datetime.now().strftime("%Y-%m-%d")
-                    break
-                try:
-                    datetime.datetime.strptime(date_input, "%Y-%m-%d")  # Validate format
-                    self.date = date_input
-                    break
-                except ValueError:
-                    print("[!] Invalid date format. Please enter in YYYY-MM-DD format.")
-        else:
-            self.date = date
+        # Scripts and services may omit the date; it then defaults to today
+        self.date = date if date is not None else datetime.datetime.now().strftime("%Y-%m-%d")
 
     def __str__(self):
-        return f"{self.expense_id:<4}{self.date:<12}{self.category:<20}{self.amount:<10.2f}{self.description}"
+        category = self.category if self.category is not None else f"#{self.category_id}"
+        return f"{self.expense_id:<4}{self.date:<12}{category:<20}{self.amount:<10.2f}{self.description}"
 
 
 class Category:
+    __slots__ = ("category_id", "name", "user_id")
     _id_counter = itertools.count(1)
     def __init__(self, name: str, user_id: int, category_id=None):
         """Initializes a category assigned to a user."""
@@ -58,14 +51,3 @@ class Category:
         self.user_id = user_id
     def __str__(self):
         return f"{self.category_id}: {self.name}"
-
-class Budget:
-    def __init__(self, user_id: int, period: str, amount: float):
-        """Initializes a budget assigned to a user."""
-        self.user_id = user_id
-        self.period = period
-        self.amount = amount
-    def __str__(self):
-        return f"Budget(user_id={self.user_id}, period={self.period}, amount={self.amount:.2f})"
-
-
@@ -0,0 +1,104 @@
+# rollups.py - Monthly Per-Category Totals Maintained Alongside Expenses
+from file_manager import set_change, delete_change
+
+
+def month_of(date):
+    """Returns the YYYY-MM period an expense date belongs to."""
+    return date[:7]
+
+
+def category_key(expense):
+    """Returns the rollup key of an expense's category: its category_id as a string (JSON object keys are)."""
+    return str(expense["category_id"])
+
+
+def rollup_changes(rollups, removed=None, added=None):
+    """Returns journal changes that swap removed's contribution to the rollups for added's."""
+    deltas = {}
+    if removed is not None:
+        key = (month_of(removed["date"]), category_key(removed))
+        deltas[key] = deltas.get(key, 0) - removed["amount"]
+    if added is not None:
+        key = (month_of(added["date"]), category_key(added))
+        deltas[key] = deltas.get(key, 0) + added["amount"]
+    return _delta_changes(rollups, deltas)
+
+
+def batch_rollup_changes(rollups, added):
+    """Returns journal changes that fold a whole batch of new expenses into the rollups."""
+    deltas = {}
+    for exp in added:
+        key = (month_of(exp["date"]), category_key(exp))
+        deltas[key] = deltas.get(key, 0) + exp["amount"]
+    return _delta_changes(rollups, deltas)
+
+
+def _delta_changes(rollups, deltas):
+    """Turns {(month, category): delta} into set/delete changes on the rollup table."""
+    changes = []
+    for (month, category), delta in deltas.items():
+        if delta == 0:
+            continue
+        total = round(rollups.get(month, {}).get(category, 0) + delta, 2)
+        if total == 0:
+            changes.append(delete_change(["rollups", month, category]))
+        else:
+            changes.append(set_change(["rollups", month, category], total))
+    return changes
+
+
+def build_rollups(expenses):
+    """Recomputes the rollup table from raw expense records."""
+    rollups = {}
+    for exp in expenses:
+        month_totals = rollups.setdefault(month_of(exp["date"]), {})
+        key = category_key(exp)
+        month_totals[key] = month_totals.get(key, 0) + exp["amount"]
+    for month_totals in rollups.values():
+        for category in list(month_totals):
+            month_totals[category] = round(month_totals[category], 2)
+            if month_totals[category] == 0:
+                del month_totals[category]
+    return {month: totals for month, totals in rollups.items() if totals}
+
+
+def merge_rollup_categories(rollups, source, target):
+    """Folds category source's monthly totals into target's, in place; returns whether anything changed."""
+    source, target = str(source), str(target)
+    changed = False
+    for month_totals in rollups.values():
+        if source in month_totals:
+            total = round(month_totals.get(target, 0) + month_totals.pop(source), 2)
+            if total:
+                month_totals[target] = total
+            else:
+                month_totals.pop(target, None)
+            changed = True
+    return changed
+
+
+def rollup_drift(stored, rebuilt):
+    """Lists (month, category, stored, expected) for every rollup cell that disagrees with the rebuild."""
+    drift = []
+    for month in sorted(set(stored) | set(rebuilt)):
+        stored_month = stored.get(month, {})
+        rebuilt_month = rebuilt.get(month, {})
+        for category in sorted(set(stored_month) | set(rebuilt_month)):
+            have = stored_month.get(category, 0)
+            want = rebuilt_month.get(category, 0)
+            if abs(have - want) >= 0.005:
+                drift.append((month, category, have, want))
+    return drift
+
+
+def summarize(rollups, start_month, end_month):
+    """Totals the rollups for months start_month..end_month inclusive, returning (total, {category key: total})."""
+    if start_month == end_month:
+        months = [rollups.get(start_month, {})]
+    else:
+        months = [totals for month, totals in rollups.items() if start_month <= month <= end_month]
+    by_category = {}
+    for totals in months:
+        for category, amount in totals.items():
+            by_category[category] = by_category.get(category, 0) + amount
+    return round(sum(by_category.values()), 2), by_category
@@ -0,0 +1,348 @@
+# search.py - Keyword Search: an Inverted Index over Expense Descriptions and Categories
+import json
+import logging
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate, islice
+from file_manager import gc_paused
+
+WORD = re.compile(r"[^\W_]+")  # Runs of letters and digits, so "7-Eleven" is the words "7" and "eleven"
+INDEX_VERSION = 1
+LAST_CHAR = "\U0010ffff"       # Sorts after any character a word can continue with
+
+
+def tokenize(text):
+    """Returns the distinct lowercase words of text, in order of first appearance."""
+    return list(dict.fromkeys(WORD.findall(str(text).lower())))
+
+
+def search_terms(query, category_names):
+    """Turns a search string into [(word, ids of the categories with a name word starting with it)], raising
+    ValueError if it holds no words. An expense matches when, for every word, a word of its description starts
+    with it or the expense is in one of that word's categories."""
+    words = tokenize(query or "")
+    if not words:
+        raise ValueError(f"Nothing to search for in '{query}'. Use letters or digits.")
+    named = [(category_id, tokenize(name)) for category_id, name in category_names.items()]
+    return [(word, frozenset(category_id for category_id, name_words in named
+                             if any(name_word.startswith(word) for name_word in name_words)))
+            for word in words]
+
+
+def matches(terms, description, category_id):
+    """Returns whether an expense with this description and category matches every search term."""
+    words = tokenize(description)
+    return all(category_id in category_ids or any(word.startswith(term) for word in words)
+               for term, category_ids in terms)
+
+
+class SearchIndex:
+    """One user's word -> expense IDs postings over descriptions, plus category_id -> expense IDs.
+
+    Postings are ascending array("q")s, or a bare int while only one expense is listed (as under most reference
+    numbers), which keeps them small. Every word is also in one sorted list, so the words starting with a prefix
+    are a bisected slice of it. IDs in stale may still be listed under words they lost (see open_index); they are
+    checked against the expense itself when they match, and dropped for good by purge().
+    """
+
+    def __init__(self):
+        self.words = {}       # word -> posting
+        self.vocabulary = []  # Every key of words, sorted
+        self.categories = {}  # category_id -> posting
+        self.stale = set()
+
+    @classmethod
+    def build(cls, ids, descriptions, categories):
+        """Builds the index of expenses given as parallel sequences in ascending ID order."""
+        with gc_paused():
+            return cls._build(ids, descriptions, categories)
+
+    @classmethod
+    def _build(cls, ids, descriptions, categories):
+        words, by_category, cache = {}, {}, {}
+        for expense_id, description, category in zip(ids, descriptions, categories):
+            tokens = cache.get(description)
+            if tokens is None:
+                tokens = cache[description] = tokenize(description)  # Descriptions repeat heavily
+            for word in tokens:
+                posting = words.get(word)
+                if posting is None:
+                    words[word] = expense_id
+                elif type(posting) is int:
+                    words[word] = array("q", (posting, expense_id))
+                else:
+                    posting.append(expense_id)
+            _post(by_category, category, expense_id)
+        index = cls()
+        index.words, index.vocabulary, index.categories = words, sorted(words), by_category
+        return index
+
+    def add(self, expense_id, description, category_id):
+        """Indexes an expense (again, for one whose entries are stale)."""
+        for word in tokenize(description):
+            if word not in self.words:
+                insort(self.vocabulary, word)
+            _post(self.words, word, expense_id)
+        _post(self.categories, category_id, expense_id)
+
+    def remove(self, expense_id, description, category_id):
+        """Unindexes an expense as it was stored: with this description and category."""
+        for word in tokenize(description):
+            if _unpost(self.words, word, expense_id) and word not in self.words:
+                del self.vocabulary[bisect_left(self.vocabulary, word)]
+        _unpost(self.categories, category_id, expense_id)
+
+    def recategorize(self, source, target):
+        """Moves every expense in category source to target, as a category merge does."""
+        moved = self.categories.pop(source, None)
+        if moved is not None:
+            ids = [*_ids(moved), *_ids(self.categories.get(target, ()))]
+            self.categories[target] = array("q", sorted(ids)) if len(ids) > 1 else ids[0]
+
+    def lookup(self, terms):
+        """Returns [(size, postings)] for the (word, category IDs) terms from search_terms(), smallest first: the
+        postings a match must be in one of, per term, and how many IDs they hold between them."""
+        groups = []
+        for word, category_ids in terms:
+            end = bisect_left(self.vocabulary, word + LAST_CHAR)
+            postings = [self.words[w] for w in self.vocabulary[bisect_left(self.vocabulary, word):end]]
+            postings += [self.categories[c] for c in category_ids if c in self.categories]
+            groups.append((sum(map(_length, postings)), postings))
+        return sorted(groups, key=lambda group: group[0])
+
+    def find(self, terms, groups, current):
+        """Returns the set of IDs matching every term, given the terms' lookup() groups.
+
+        current(expense_id) returns an expense's (description, category_id), or None, to check stale IDs with.
+        The smallest group is read in full and each other one intersected with what is left, or, if it is far
+        larger, looked up in by bisecting its postings instead.
+        """
+        found = set()
+        for posting in groups[0][1]:
+            found.update(_ids(posting))
+        for size, postings in groups[1:]:
+            if not found:
+                break
+            if size > 64 * len(found):  # A bisect of an array costs about what reading 64 of its IDs does
+                found = {expense_id for expense_id in found if any(_listed(p, expense_id) for p in postings)}
+            else:
+                found = set().union(*(found.intersection(_ids(posting)) for posting in postings))
+        for expense_id in (found & self.stale) if self.stale else ():
+            fields = current(expense_id)
+            if fields is None or not matches(terms, *fields):
+                found.discard(expense_id)
+        return found
+
+    def matcher(self, terms, groups, current):
+        """Returns a test of whether one expense ID matches every term, given the terms' lookup() groups, for
+        checking a few candidates met in some other order without reading whole postings: each posting is
+        bisected, or a term's postings are read into a set once if there are many."""
+        tests = []
+        for _, postings in groups:
+            if len(postings) > 8:
+                wanted = set()
+                for posting in postings:
+                    wanted.update(_ids(posting))
+                tests.append(wanted)
+            else:
+                tests.append(postings)
+        stale = self.stale
+
+        def test(expense_id):
+            for postings in tests:
+                if type(postings) is set:
+                    if expense_id not in postings:
+                        return False
+                    continue
+                for posting in postings:
+                    if type(posting) is int:
+                        if posting == expense_id:
+                            break
+                    else:
+                        position = bisect_left(posting, expense_id)
+                        if position < len(posting) and posting[position] == expense_id:
+                            break
+                else:
+                    return False
+            if stale and expense_id in stale:
+                fields = current(expense_id)
+                return fields is not None and matches(terms, *fields)
+            return True
+        return test
+
+    def purge(self, current):
+        """Drops the entries stale IDs no longer hold, checking each against current() (see find)."""
+        if not self.stale:
+            return
+        kept = {}
+        for expense_id in self.stale:
+            fields = current(expense_id)
+            kept[expense_id] = (set(tokenize(fields[0])), fields[1]) if fields is not None else (set(), None)
+        for word, posting in list(self.words.items()):
+            for expense_id in self.stale.intersection(_ids(posting)):
+                if word not in kept[expense_id][0] and _unpost(self.words, word, expense_id):
+                    if word not in self.words:
+                        del self.vocabulary[bisect_left(self.vocabulary, word)]
+        for category_id, posting in list(self.categories.items()):
+            for expense_id in self.stale.intersection(_ids(posting)):
+                if kept[expense_id][1] != category_id:
+                    _unpost(self.categories, category_id, expense_id)
+        self.stale.clear()
+
+    def size(self):
+        """Returns how many (word, expense) entries the index holds."""
+        return sum(map(_length, self.words.values()))
+
+    def save(self, path, stamp):
+        """Writes the index atomically: a JSON header holding stamp, a line with the vocabulary, then the number
+        of IDs under each word and every posting, as raw 64-bit integers."""
+        header = {"version": INDEX_VERSION, "byteorder": sys.byteorder, "stamp": stamp,
+                  "words": len(self.vocabulary),
+                  "categories": [[category_id, _length(posting)] for category_id, posting in self.categories.items()]}
+        postings = [self.words[word] for word in self.vocabulary]
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(json.dumps(header, separators=(",", ":")).encode() + b"\n")
+            f.write(" ".join(self.vocabulary).encode() + b"\n")
+            array("q", map(_length, postings)).tofile(f)
+            buffer = array("q")
+            for posting in postings + list(self.categories.values()):
+                if type(posting) is int:
+                    buffer.append(posting)
+                else:
+                    buffer.extend(posting)
+                if len(buffer) >= 1 << 16:
+                    buffer.tofile(f)
+                    buffer = array("q")
+            buffer.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    @classmethod
+    def load(cls, path):
+        """Returns (index, stamp) from a file save() wrote, or None if there is none or it cannot be used."""
+        try:
+            with open(path, "rb") as f, gc_paused():
+                header = json.loads(f.readline())
+                if header.get("version") != INDEX_VERSION or header.get("byteorder") != sys.byteorder:
+                    return None
+                vocabulary = f.readline().decode().split()
+                lengths = array("q")
+                lengths.fromfile(f, header["words"])
+                values = array("q")
+                values.frombytes(f.read())
+                index = cls()
+                offsets = list(accumulate(lengths, initial=0))
+                if len(vocabulary) != len(lengths) or offsets[-1] + sum(
+                        length for _, length in header["categories"]) != len(values):
+                    return None
+                index.vocabulary = vocabulary
+                index.words = dict(zip(vocabulary, [values[start] if end - start == 1 else values[start:end]
+                                                    for start, end in zip(offsets, islice(offsets, 1, None))]))
+                offset = offsets[-1]
+                for category_id, length in header["categories"]:
+                    index.categories[category_id] = values[offset] if length == 1 else values[offset:offset + length]
+                    offset += length
+        except (OSError, EOFError, ValueError, TypeError, KeyError, AttributeError):
+            return None
+        return index, header["stamp"]
+
+
+def open_index(path, store, columns):
+    """Returns the search index for a shard's columns: the one saved at path if it was saved on top of the
+    snapshot the store holds, caught up with every change made since, or else one built from the columns and
+    saved for the next start. Call it with the store's lock held, so nothing is committed meanwhile."""
+    loaded = SearchIndex.load(path)
+    if loaded is not None:
+        index, stamp = loaded
+        if stamp.get("snapshot") == store.snapshot_stat() and stamp.get("seq", -1) <= store.generation:
+            touched = set()
+            for change in store.changes_since(stamp["seq"]):
+                path_parts = change["path"]
+                if path_parts[0] == "expenses":
+                    if len(path_parts) < 2:
+                        touched = None  # The whole table was replaced
+                        break
+                    touched.add(int(path_parts[1]))
+            if touched is not None:
+                # The old entries of an expense changed since are unknown, so it is indexed as it is now and
+                # marked stale until the next save purges whatever it no longer holds
+                for expense_id in touched:
+                    fields = columns.search_fields(expense_id)
+                    if fields is not None:
+                        index.add(expense_id, *fields)
+                index.stale |= touched
+                return index
+    index = SearchIndex.build(columns.ids, columns.descriptions, columns.categories)
+    _save(index, path, store)
+    return index
+
+
+def save_index(path, store):
+    """Persists the search index of a shard the store just wrote as a snapshot, if one was opened."""
+    columns = store.data["expenses"]
+    if columns.search is not None:
+        columns.search.purge(columns.search_fields)
+        _save(columns.search, path, store)
+
+
+def _save(index, path, store):
+    try:
+        index.save(path, {"seq": store.generation, "snapshot": store.snapshot_stat()})
+    except OSError as e:
+        logging.error(f"Error saving search index {path}: {e}")
+
+
+def _ids(posting):
+    return (posting,) if type(posting) is int else posting
+
+
+def _length(posting):
+    return 1 if type(posting) is int else len(posting)
+
+
+def _listed(posting, expense_id):
+    if type(posting) is int:
+        return posting == expense_id
+    position = bisect_left(posting, expense_id)
+    return position < len(posting) and posting[position] == expense_id
+
+
+def _post(table, key, expense_id):
+    """Adds expense_id to the posting under key, keeping it ascending (new IDs are usually the largest)."""
+    posting = table.get(key)
+    if posting is None:
+        table[key] = expense_id
+    elif type(posting) is int:
+        if posting != expense_id:
+            table[key] = array("q", sorted((posting, expense_id)))
+    elif not posting or posting[-1] < expense_id:
+        posting.append(expense_id)
+    else:
+        position = bisect_left(posting, expense_id)
+        if posting[position] != expense_id:
+            posting.insert(position, expense_id)
+
+
+def _unpost(table, key, expense_id):
+    """Removes expense_id from the posting under key, dropping the key once it is empty; returns whether it
+    was there."""
+    posting = table.get(key)
+    if posting is None:
+        return False
+    if type(posting) is int:
+        if posting != expense_id:
+            return False
+        del table[key]
+        return True
+    position = bisect_left(posting, expense_id)
+    if position == len(posting) or posting[position] != expense_id:
+        return False
+    del posting[position]
+    if not posting:
+        del table[key]
+    return True
@@ -0,0 +1,494 @@
+# server.py - Asyncio JSON-over-HTTP Server for Many Concurrent Users
+import asyncio
+import functools
+import json
+import logging
+import re
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import metrics
+from auth import Authentication, LoginThrottled
+from expenses import EDITABLE_FIELDS, ExpenseTracker, PAGE_SIZE, validate_date
+from storage import get_storage
+
+SESSION_TTL = 3600          # Seconds a token stays valid after its last use
+MAX_BODY = 1024 * 1024      # Largest request body accepted, in bytes
+WRITE_BATCH = 500           # Most queued writes folded into a single commit
+
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden",
+               404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+               429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    """Aborts a request with an HTTP status and a JSON error message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """One parsed HTTP request plus the session user, once authenticated."""
+
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path.rstrip("/") or "/"
+        self.query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.user = None
+
+    def json(self):
+        """Returns the body as a JSON object ({} when empty), raising HttpError 400 if it is not one."""
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Request body must be a JSON object.")
+        return data
+
+    def token(self):
+        """Returns the bearer token from the Authorization header, or None."""
+        scheme, _, token = self.headers.get("authorization", "").partition(" ")
+        return token.strip() if scheme.lower() == "bearer" else None
+
+
+class Sessions:
+    """Bearer tokens mapped to logged-in users; replaces Authentication.current_user for the server."""
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self.tokens = {}  # token -> [user, expires_at]
+
+    def create(self, user):
+        """Starts a session for user and returns its token."""
+        if len(self.tokens) % 1024 == 1023:
+            self.purge()
+        token = secrets.token_urlsafe(32)
+        self.tokens[token] = [user, time.monotonic() + self.ttl]
+        return token
+
+    def user(self, token):
+        """Returns the user behind a live token and extends its lifetime, or None."""
+        entry = self.tokens.get(token)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if entry[1] < now:
+            del self.tokens[token]
+            return None
+        entry[1] = now + self.ttl
+        return entry[0]
+
+    def end(self, token):
+        """Logs a session out."""
+        self.tokens.pop(token, None)
+
+    def purge(self):
+        """Drops every expired token."""
+        now = time.monotonic()
+        for token in [token for token, (_, expires) in self.tokens.items() if expires < now]:
+            del self.tokens[token]
+
+
+class WriteCoalescer:
+    """Queues each user's writes and runs every burst inside one storage batch, so the burst costs one commit.
+
+    While one batch is being written the next requests pile up behind it and go out together in the
+    following batch, so a lone request is never delayed waiting for company.
+    """
+
+    def __init__(self, executor, max_batch=WRITE_BATCH):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.pending = {}     # user_id -> [(func, future)]
+        self.draining = set()
+        self.batches = 0
+        self.writes = 0
+
+    async def submit(self, tracker, func):
+        """Queues func (a zero-argument write on tracker) and returns its result once committed."""
+        future = asyncio.get_event_loop().create_future()
+        key = tracker.user.user_id
+        self.pending.setdefault(key, []).append((func, future))
+        if key not in self.draining:
+            self.draining.add(key)
+            asyncio.ensure_future(self._drain(tracker))
+        return await future
+
+    async def _drain(self, tracker):
+        key = tracker.user.user_id
+        loop = asyncio.get_event_loop()
+        try:
+            while self.pending.get(key):
+                queue = self.pending[key]
+                batch, self.pending[key] = queue[:self.max_batch], queue[self.max_batch:]
+                try:
+                    outcomes = await loop.run_in_executor(self.executor, _run_writes, tracker,
+                                                          [func for func, _ in batch])
+                except Exception as e:
+                    outcomes = [(False, e)] * len(batch)
+                self.batches += 1
+                self.writes += len(batch)
+                for (_, future), (ok, value) in zip(batch, outcomes):
+                    if future.done():
+                        continue  # The client went away
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+        finally:
+            self.draining.discard(key)
+            if not self.pending.get(key):
+                self.pending.pop(key, None)
+
+
+def _run_writes(tracker, funcs):
+    """Runs queued writes in one storage batch. A write that raises fails alone: its exception is returned for
+    it and the rest of the batch still commits."""
+    outcomes = []
+    with tracker.store.batch():
+        for func in funcs:
+            try:
+                outcomes.append((True, func()))
+            except Exception as e:
+                outcomes.append((False, e))
+    return outcomes
+
+
+class ExpenseServer:
+    """Routes JSON requests to per-user ExpenseTrackers.
+
+    The storage layer is not thread-safe, so every storage call runs on one worker thread; the event loop
+    only parses requests and writes responses and never blocks on disk.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage")
+        self.sessions = Sessions()
+        self.writes = WriteCoalescer(self.executor)
+        self.auth = None
+        self.trackers = {}
+        self.routes = [
+            ("POST", r"/login", self.login, None),
+            ("POST", r"/register", self.register, None),
+            ("POST", r"/logout", self.logout, "user"),
+            ("GET", r"/expenses", self.list_expenses, "user"),
+            ("POST", r"/expenses", self.add_expense, "user"),
+            ("GET", r"/expenses/(\d+)", self.get_expense, "user"),
+            ("PATCH", r"/expenses/(\d+)", self.update_expense, "user"),
+            ("DELETE", r"/expenses/(\d+)", self.delete_expense, "user"),
+            ("GET", r"/budgets", self.list_budgets, "user"),
+            ("GET", r"/budgets/status", self.budget_status, "user"),
+            ("PUT", r"/budgets/(\d{4}-\d{2}|\d+d)", self.set_budget, "user"),
+            ("GET", r"/summary", self.summary, "user"),
+            ("GET", r"/categories", self.list_categories, "user"),
+            ("POST", r"/categories", self.create_category, "admin"),
+            ("PATCH", r"/categories/(\d+)", self.rename_category, "admin"),
+            ("DELETE", r"/categories/(\d+)", self.delete_category, "admin"),
+            ("POST", r"/categories/(\d+)/merge", self.merge_category, "admin"),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler, role)
+                       for method, pattern, handler, role in self.routes]
+
+    async def run(self, func, *args, **kwargs):
+        """Runs a blocking storage call on the storage thread."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def start(self):
+        """Loads users on the storage thread before the first request arrives."""
+        self.auth = await self.run(Authentication)
+
+    async def tracker(self, user):
+        """Returns the user's ExpenseTracker, opening it on the storage thread on first use."""
+        tracker = self.trackers.get(user.user_id)
+        if tracker is None:
+            tracker = self.trackers[user.user_id] = await self.run(ExpenseTracker, user)
+        return tracker
+
+    # --- HTTP plumbing ---
+
+    async def handle_connection(self, reader, writer):
+        """Serves keep-alive HTTP/1.1 requests on one connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line."}, close=True)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, 400, {"error": "Invalid Content-Length header."}, close=True)
+                    break
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "Request body too large."}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(Request(method.upper(), target, headers, body))
+                close = version == "HTTP/1.0" or headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, payload, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, close=False):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+        writer.write(head.encode() + body)
+        await writer.drain()
+
+    async def dispatch(self, request):
+        """Finds the route for a request, checks its session and role, and returns (status, payload)."""
+        allowed = False
+        for method, pattern, handler, role in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            allowed = True
+            if method != request.method:
+                continue
+            try:
+                if role is not None:
+                    request.user = self.sessions.user(request.token())
+                    if request.user is None:
+                        raise HttpError(401, "Login required.")
+                    if role == "admin" and request.user.role != "admin":
+                        raise HttpError(403, "Admin access required.")
+                with metrics.timer(f"http.{method} {pattern.pattern[:-1]}"):
+                    return await handler(request, *match.groups())
+            except HttpError as e:
+                return e.status, {"error": str(e)}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                logging.error(f"Server error on {request.method} {request.path}: {e}")
+                return 500, {"error": "Internal server error."}
+        if allowed:
+            return 405, {"error": f"{request.method} is not allowed on {request.path}."}
+        return 404, {"error": f"No endpoint {request.path}."}
+
+    # --- Sessions ---
+
+    async def login(self, request):
+        body = request.json()
+        try:
+            user = await self.run(self.auth.authenticate, body.get("username", ""), body.get("password", ""))
+        except LoginThrottled as e:
+            raise HttpError(429, str(e))
+        if user is None:
+            raise HttpError(401, "Invalid username or password.")
+        logging.info(f"User '{user.username}' logged in via the API.",
+                     extra={"operation": "login", "username": user.username, "user_id": user.user_id})
+        return 200, {"token": self.sessions.create(user), "user": _user_json(user)}
+
+    async def register(self, request):
+        body = request.json()
+        username, password = (body.get("username") or "").strip(), body.get("password") or ""
+        if not username or not password:
+            raise HttpError(400, "Username and password are required.")
+        user = await self.run(self.auth.create_user, username, password)
+        return 201, _user_json(user)
+
+    async def logout(self, request):
+        self.sessions.end(request.token())
+        return 200, {"ok": True}
+
+    # --- Expenses and budgets (blocking reads on the storage thread, writes through the coalescer) ---
+
+    async def list_expenses(self, request):
+        start, end = request.query.get("start"), request.query.get("end")
+        for date in (start, end):
+            if date:
+                validate_date(date)
+        tracker = await self.tracker(request.user)
+        query = request.query
+        if "limit" in query or "cursor" in query or "search" in query:
+            filters = {"start_date": start, "end_date": end, "category": query.get("category"),
+                       "min_amount": query.get("min_amount"), "max_amount": query.get("max_amount"),
+                       "text": query.get("q"), "search": query.get("search")}
+
+            def read_page():
+                page = tracker.page(query.get("limit", PAGE_SIZE), query.get("cursor"), query.get("sort", "date"),
+                                    **filters)
+                return {"expenses": [dict(exp) for exp in page["expenses"]], "next_cursor": page["next_cursor"]}
+            return 200, await self.run(read_page)
+        return 200, await self.run(
+            lambda: [dict(exp) for exp in tracker.query(start, end, query.get("category"))])
+
+    async def get_expense(self, request, expense_id):
+        tracker = await self.tracker(request.user)
+        expense = await self.run(lambda: _copy(tracker.get(int(expense_id))))
+        if expense is None:
+            raise HttpError(404, f"Expense ID {expense_id} not found.")
+        return 200, expense
+
+    async def add_expense(self, request):
+        body = _expense_fields(request.json())
+        tracker = await self.tracker(request.user)
+        expense = await self.writes.submit(tracker, lambda: dict(tracker.add(
+            body.get("amount"), body.get("category"), body.get("description"), body.get("date"))))
+        return 201, expense
+
+    async def update_expense(self, request, expense_id):
+        body = _expense_fields(request.json())
+        tracker = await self.tracker(request.user)
+        await self._require_expense(tracker, expense_id)
+        return 200, await self.writes.submit(tracker, lambda: dict(tracker.update(int(expense_id), **body)))
+
+    async def delete_expense(self, request, expense_id):
+        tracker = await self.tracker(request.user)
+        await self._require_expense(tracker, expense_id)
+        return 200, await self.writes.submit(tracker, lambda: dict(tracker.delete(int(expense_id))))
+
+    async def _require_expense(self, tracker, expense_id):
+        if await self.run(tracker.get, int(expense_id)) is None:
+            raise HttpError(404, f"Expense ID {expense_id} not found.")
+
+    async def list_budgets(self, request):
+        tracker = await self.tracker(request.user)
+        return 200, await self.run(lambda: dict(tracker.store.budgets()))
+
+    async def set_budget(self, request, period):
+        body = request.json()
+        amount, category = body.get("amount"), body.get("category")
+        tracker = await self.tracker(request.user)
+        amount = await self.writes.submit(tracker, lambda: tracker.set_budget(period, amount, category))
+        return 200, {"period": period, "amount": amount, "category": category}
+
+    async def budget_status(self, request):
+        tracker = await self.tracker(request.user)
+        return 200, await self.run(tracker.budget_status, request.query.get("date"))
+
+    async def summary(self, request):
+        tracker = await self.tracker(request.user)
+        return 200, await self.run(tracker.summary, request.query.get("start"), request.query.get("end"))
+
+    # --- Admin category management ---
+
+    async def list_categories(self, request):
+        return 200, await self.run(lambda: [dict(cat) for cat in get_storage().categories().values()])
+
+    async def create_category(self, request):
+        name = (request.json().get("name") or "").strip()
+        return 201, await self.run(_create_category, name, request.user.user_id)
+
+    async def rename_category(self, request, category_id):
+        name = (request.json().get("name") or "").strip()
+        return 200, await self.run(_rename_category, category_id, name)
+
+    async def merge_category(self, request, category_id):
+        return 200, await self.run(_merge_category, category_id, _category_id(request.json().get("into")))
+
+    async def delete_category(self, request, category_id):
+        reassign_to = request.query.get("reassign_to")
+        return 200, await self.run(_delete_category, category_id,
+                                   _category_id(reassign_to) if reassign_to else None)
+
+
+def _user_json(user):
+    return {"user_id": user.user_id, "username": user.username, "role": user.role}
+
+
+def _expense_fields(body):
+    """Returns an expense request body, raising HttpError 400 unless it only holds editable fields: amount as a
+    number or string, category, description and date as strings."""
+    unknown = set(body) - set(EDITABLE_FIELDS)
+    if unknown:
+        raise HttpError(400, f"Unknown expense field(s): {', '.join(sorted(unknown))}.")
+    for field, value in body.items():
+        allowed = (int, float, str) if field == "amount" else (str,)
+        if value is not None and (not isinstance(value, allowed) or isinstance(value, bool)):
+            raise HttpError(400, f"Expense field '{field}' must be {'a number' if field == 'amount' else 'a string'}.")
+    return body
+
+
+def _copy(record):
+    return dict(record) if record is not None else None
+
+
+def _category_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid category ID '{value}'.")
+
+
+def _existing_category(category_id):
+    category = get_storage().categories().get(category_id)
+    if category is None:
+        raise HttpError(404, f"Category ID {category_id} not found.")
+    return dict(category)
+
+
+def _create_category(name, user_id):
+    record = get_storage().add_category(name, user_id)
+    logging.info(f"Category '{record['name']}' created via the API.")
+    return record
+
+
+def _rename_category(category_id, name):
+    _existing_category(category_id)
+    record = get_storage().rename_category(category_id, name)
+    logging.info(f"Category {category_id} renamed to '{name}' via the API.")
+    return record
+
+
+def _merge_category(category_id, target_id):
+    category = _existing_category(category_id)
+    moved = get_storage().merge_categories(category_id, target_id)
+    logging.info(f"Category {category_id} merged into {target_id} via the API; {moved} expenses moved.")
+    return dict(category, merged_into=target_id, moved=moved)
+
+
+def _delete_category(category_id, reassign_to=None):
+    category = _existing_category(category_id)
+    moved = get_storage().delete_category(category_id, reassign_to)
+    logging.info(f"Category {category_id} deleted via the API; {moved} expenses reassigned.")
+    return dict(category, moved=moved)
+
+
+async def serve(host, port):
+    """Starts the API server and runs until cancelled."""
+    app = ExpenseServer()
+    await app.start()
+    server = await asyncio.start_server(app.handle_connection, host, port, backlog=1024)
+    print(f"[+] Cha-Ching API listening on http://{host}:{port}")
+    logging.info(f"API server started on {host}:{port}.")
+    async with server:
+        await server.serve_forever()
+
+
+def run_server(host="127.0.0.1", port=8080):
+    """Blocking entry point used by app.py --serve."""
+    try:
+        asyncio.run(serve(host, port))
+    except KeyboardInterrupt:
+        print("\n[-] Server stopped.")
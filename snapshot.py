@@ -0,0 +1,238 @@
+# snapshot.py - Compact Binary Snapshot Format Read Through mmap
+#
+# Layout (little-endian):
+#   header        HEADER: magic, version, user count, string count, section offsets
+#   global        data.json (users, categories) as compact JSON
+#   per user      fixed-width EXPENSE records, then fixed-width BUDGET records (overall and per category)
+#   user table    one USER_ENTRY per user, sorted by user_id (binary searched in place)
+#   string table  u32 offsets[string_count + 1] followed by the UTF-8 bytes of every interned string
+#
+# Descriptions and budget periods are stored once in the string table and referenced by index, categories are
+# their category_id and dates are day ordinals (legacy dates that do not parse are kept as flagged string
+# references), so a user's expenses are a contiguous array sliced straight out of the mapped file without
+# touching anyone else's pages.
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+from rollups import build_rollups
+
+MAGIC = b"CHCHSNAP"
+VERSION = 3                            # 2: expenses hold category ids instead of name strings; 3: category budgets
+HEADER = struct.Struct("<8sHHIIQQQQ")  # magic, version, flags, users, strings, user table, strings, global off/len
+USER_ENTRY = struct.Struct("<IIQIIQ")  # user_id, expense count, expenses offset, budget count, next id, budgets offset
+EXPENSE = struct.Struct("<IIIId")      # expense_id, date ordinal, category_id, description string, amount
+BUDGET = struct.Struct("<IId")         # period string, category_id (0 for an overall budget), amount
+OFFSET = struct.Struct("<I")
+DATE_STRING = 0x80000000               # Date field flag: the low bits index a raw date string instead of an ordinal
+
+
+def write_snapshot(path, global_data, shards):
+    """Writes global data plus an iterable of (user_id, shard) pairs to a binary snapshot, atomically."""
+    strings = {}
+    dates = {}  # Dates repeat across thousands of expenses, so each distinct one is parsed once
+
+    def intern(value):
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    def encode_date(date):
+        if date not in dates:
+            dates[date] = _encode_date(date, intern)
+        return dates[date]
+
+    entries = []
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(b"\0" * HEADER.size)
+        global_bytes = json.dumps(global_data, separators=(",", ":")).encode()
+        global_offset = f.tell()
+        f.write(global_bytes)
+
+        for user_id, shard in sorted(shards, key=lambda pair: int(pair[0])):
+            expenses = sorted(shard.get("expenses", {}).values(), key=lambda exp: exp["expense_id"])
+            expenses_offset = f.tell()
+            f.write(b"".join(EXPENSE.pack(exp["expense_id"], encode_date(exp["date"]),
+                                          exp["category_id"], intern(exp["description"]), exp["amount"])
+                             for exp in expenses))
+            budgets_offset = f.tell()
+            budgets = [(period, 0, amount) for period, amount in shard.get("budgets", {}).items()]
+            budgets += [(period, int(category_id), amount)
+                        for period, limits in shard.get("category_budgets", {}).items()
+                        for category_id, amount in limits.items()]
+            f.write(b"".join(BUDGET.pack(intern(period), category_id, amount)
+                             for period, category_id, amount in budgets))
+            next_id = shard.get("meta", {}).get("next_expense_id") or (
+                expenses[-1]["expense_id"] + 1 if expenses else 1)
+            entries.append(USER_ENTRY.pack(int(user_id), len(expenses), expenses_offset, len(budgets),
+                                           next_id, budgets_offset))
+
+        user_table_offset = f.tell()
+        f.write(b"".join(entries))
+
+        strings_offset = f.tell()
+        encoded = [value.encode() for value in strings]  # dicts keep insertion order, i.e. string index order
+        position = 0
+        offsets = [OFFSET.pack(0)]
+        for value in encoded:
+            position += len(value)
+            offsets.append(OFFSET.pack(position))
+        f.write(b"".join(offsets))
+        f.write(b"".join(encoded))
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(entries), len(strings), user_table_offset, strings_offset,
+                            global_offset, len(global_bytes)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    return len(entries)
+
+
+class Snapshot:
+    """Read-only view of a binary snapshot; only the pages of the users actually read are touched."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.user_count, self.string_count, self._user_table, self._strings,
+         self._global_offset, self._global_length) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} Cha-Ching snapshot.")
+        self._blob = self._strings + OFFSET.size * (self.string_count + 1)
+        self._string_cache = {}
+        self._date_cache = {}
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, index):
+        """Returns interned string number index, decoding it once."""
+        value = self._string_cache.get(index)
+        if value is None:
+            start, = OFFSET.unpack_from(self._map, self._strings + OFFSET.size * index)
+            end, = OFFSET.unpack_from(self._map, self._strings + OFFSET.size * (index + 1))
+            value = self._string_cache[index] = self._map[self._blob + start:self._blob + end].decode()
+        return value
+
+    def _decode_date(self, value):
+        date = self._date_cache.get(value)
+        if date is None:
+            if value & DATE_STRING:
+                date = self.string(value & ~DATE_STRING)
+            else:
+                date = datetime.date.fromordinal(value).isoformat()
+            self._date_cache[value] = date
+        return date
+
+    def global_data(self):
+        """Returns the users and categories stored alongside the shards."""
+        return json.loads(self._map[self._global_offset:self._global_offset + self._global_length])
+
+    def user_ids(self):
+        return [USER_ENTRY.unpack_from(self._map, self._user_table + USER_ENTRY.size * n)[0]
+                for n in range(self.user_count)]
+
+    def _entry(self, user_id):
+        """Binary-searches the user table in the mapped file; returns the user's entry or None."""
+        low, high = 0, self.user_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = USER_ENTRY.unpack_from(self._map, self._user_table + USER_ENTRY.size * middle)
+            if entry[0] == user_id:
+                return entry
+            if entry[0] < user_id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def expenses(self, user_id):
+        """Yields one user's expense records, oldest ID first."""
+        entry = self._entry(int(user_id))
+        if entry is None:
+            return
+        _, count, offset, _, _, _ = entry
+        user_id = int(user_id)
+        string, strings, decode_date, dates = self.string, self._string_cache, self._decode_date, self._date_cache
+        block = memoryview(self._map)[offset:offset + EXPENSE.size * count]
+        try:
+            for expense_id, date, category_id, description, amount in EXPENSE.iter_unpack(block):
+                yield {"expense_id": expense_id, "amount": amount, "category_id": category_id,
+                       "description": strings.get(description) or string(description), "user_id": user_id,
+                       "date": dates.get(date) or decode_date(date)}
+        finally:
+            block.release()
+
+    def budgets(self, user_id):
+        """Returns ({period: amount}, {period: {category key: amount}}) for one user's overall and per-category
+        budgets."""
+        entry = self._entry(int(user_id))
+        overall, by_category = {}, {}
+        if entry is None:
+            return overall, by_category
+        _, _, _, count, _, offset = entry
+        for n in range(count):
+            period, category_id, amount = BUDGET.unpack_from(self._map, offset + BUDGET.size * n)
+            if category_id:
+                by_category.setdefault(self.string(period), {})[str(category_id)] = amount
+            else:
+                overall[self.string(period)] = amount
+        return overall, by_category
+
+    def shard(self, user_id):
+        """Rebuilds the JSON shard for one user (expenses, budgets, rollups and ID counter)."""
+        entry = self._entry(int(user_id))
+        expenses = {str(exp["expense_id"]): exp for exp in self.expenses(user_id)}
+        budgets, category_budgets = self.budgets(user_id)
+        shard = {"expenses": expenses, "budgets": budgets, "rollups": build_rollups(expenses.values()),
+                 "meta": {"next_expense_id": entry[4] if entry else 1}}
+        if category_budgets:
+            shard["category_budgets"] = category_budgets
+        return shard
+
+
+def _encode_date(date, intern):
+    """Packs a YYYY-MM-DD date as its day ordinal; anything else is interned so it round-trips unchanged."""
+    try:
+        return datetime.datetime.strptime(date, "%Y-%m-%d").toordinal()
+    except (TypeError, ValueError):
+        return DATE_STRING | intern(str(date))
+
+
+def json_to_snapshot(path):
+    """Exports the JSON backend (data.json plus every shard) to a binary snapshot."""
+    from storage import JsonStorage
+    from file_manager import load_data, load_user_data
+    storage = JsonStorage()
+    global_data = dict(load_data())
+    # ID counters and format flags travel with the data; the journal position belongs to this copy only
+    global_data["meta"] = {key: value for key, value in global_data.get("meta", {}).items() if key != "journal_seq"}
+    user_ids = {user["user_id"] for user in storage.users()} | set(storage.shard_user_ids())
+    count = write_snapshot(path, global_data, ((user_id, load_user_data(user_id)) for user_id in user_ids))
+    logging.info(f"Exported {count} users to binary snapshot {path}.")
+    return count
+
+
+def snapshot_to_json(path):
+    """Restores data.json and every user shard from a binary snapshot."""
+    from file_manager import store, user_store
+    with Snapshot(path) as snapshot:
+        for user_id in snapshot.user_ids():
+            user_store(user_id).save(snapshot.shard(user_id))
+        store.save(snapshot.global_data())
+        count = snapshot.user_count
+    logging.info(f"Restored {count} users from binary snapshot {path}.")
+    return count
@@ -0,0 +1,521 @@
+# sqlite_storage.py - SQLite Storage Backend (WAL mode, indexed per-user queries)
+import logging
+import sqlite3
+from contextlib import contextmanager
+from search import LAST_CHAR, search_terms, tokenize
+from storage import Storage, UserStorage, clean_category_name
+
+EXPENSES_TABLE = """(
+    user_id INTEGER NOT NULL,
+    expense_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category_id INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (user_id, expense_id)
+)"""
+DAILY_TOTALS_TABLE = """(
+    user_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (user_id, date, category_id)
+) WITHOUT ROWID"""
+# Adds to one (user, day, category) total; writes aggregate their rows first, so a bulk add is one upsert per day
+ADD_DAILY_TOTAL = ("INSERT INTO daily_totals (user_id, date, category_id, total) VALUES (?, ?, ?, ?) "
+                   "ON CONFLICT (user_id, date, category_id) DO UPDATE SET total = round(total + excluded.total, 2)")
+# Recomputes daily_totals from scratch, for databases written before it existed and after bulk copies
+FILL_DAILY_TOTALS = ("INSERT INTO daily_totals (user_id, date, category_id, total) "
+                     "SELECT user_id, date, category_id, round(SUM(amount), 2) FROM expenses "
+                     "GROUP BY user_id, date, category_id HAVING round(SUM(amount), 2) != 0")
+# The search index: one row per distinct word of each expense's description, so the words starting with a prefix
+# are one range of the primary key
+SEARCH_WORDS_TABLE = """(
+    user_id INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    expense_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, word, expense_id)
+) WITHOUT ROWID"""
+ADD_SEARCH_WORD = "INSERT OR IGNORE INTO search_words (user_id, word, expense_id) VALUES (?, ?, ?)"
+# A user's next expense ID: the stored counter, so a deleted newest expense's ID is never handed out again, but
+# never below MAX + 1, for users written before the counter existed or copied in by import_from_json
+NEXT_EXPENSE_ID = ("SELECT MAX(COALESCE((SELECT next_expense_id FROM user_meta WHERE user_id = ?), 1), "
+                   "COALESCE((SELECT MAX(expense_id) FROM expenses WHERE user_id = ?), 0) + 1)")
+SET_NEXT_EXPENSE_ID = "INSERT OR REPLACE INTO user_meta (user_id, next_expense_id) VALUES (?, ?)"
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'user'
+);
+CREATE TABLE IF NOT EXISTS categories (
+    category_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    user_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS expenses {EXPENSES_TABLE};
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_category_id ON expenses (user_id, category_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_category_id ON expenses (category_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON expenses (user_id, amount);
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (user_id, period)
+);
+CREATE TABLE IF NOT EXISTS category_budgets (
+    user_id INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (user_id, period, category_id)
+);
+-- Per (user, day, category) totals, updated by every write so summaries and budget windows read a row per day
+CREATE TABLE IF NOT EXISTS daily_totals {DAILY_TOTALS_TABLE};
+CREATE TABLE IF NOT EXISTS search_words {SEARCH_WORDS_TABLE};
+-- Per-user counters, as kept in each JSON shard's meta header
+CREATE TABLE IF NOT EXISTS user_meta (
+    user_id INTEGER PRIMARY KEY,
+    next_expense_id INTEGER NOT NULL
+);
+"""
+
+# Expenses hold category ids; the name is joined in from categories, so a rename is one row
+SELECT_EXPENSES = ("SELECT e.expense_id, e.date, e.amount, e.category_id, c.name AS category, e.description, "
+                   "e.user_id FROM expenses e LEFT JOIN categories c ON c.category_id = e.category_id")
+SORT_COLUMNS = {"date": "e.date", "amount": "e.amount", "id": "e.expense_id"}
+FILTER_SQL = {"start_date": "e.date >= ?", "end_date": "e.date <= ?", "min_amount": "e.amount >= ?",
+              "max_amount": "e.amount <= ?", "category_id": "e.category_id = ?",
+              "text": "instr(lower(e.description), ?) > 0"}
+# One search word: a description word in the prefix's range of search_words, or (appended when there are any) one
+# of the categories whose name has a word starting with it
+SEARCH_SQL = "e.expense_id IN (SELECT expense_id FROM search_words WHERE user_id = ? AND word >= ? AND word < ?)"
+BUSY_TIMEOUT = 30  # Seconds a writer waits for another process's transaction before giving up
+
+
+class SqliteStorage(Storage):
+    """All data in one SQLite database; every tracker operation is a single-row statement or an aggregate."""
+
+    def __init__(self, path):
+        self.path = path
+        # Autocommit mode: batch() opens its own BEGIN IMMEDIATE transactions so read-then-write steps
+        # (like allocating the next expense ID) hold the write lock from the start
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._batch_depth = 0
+        self._migrate_category_ids()
+        self._add_daily_totals()
+        self._add_search_words()
+        self.conn.executescript(SCHEMA)
+        self._users = {}
+
+    def execute(self, sql, params=()):
+        """Runs one statement; outside a batch it commits on its own."""
+        return self.conn.execute(sql, params)
+
+    @contextmanager
+    def batch(self):
+        """Groups every statement run inside the block into one write transaction."""
+        if self._batch_depth == 0:
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.conn.execute("ROLLBACK")
+            raise
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self.conn.execute("COMMIT")
+
+    def users(self):
+        return [dict(row) for row in self.conn.execute("SELECT user_id, username, password, role FROM users")]
+
+    def user_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def add_user(self, record):
+        with self.batch():
+            if self.conn.execute("SELECT 1 FROM users WHERE username = ?", (record["username"],)).fetchone():
+                raise ValueError(f"Username '{record['username']}' already exists.")
+            taken = self.conn.execute("SELECT 1 FROM users WHERE user_id = ?", (record["user_id"],)).fetchone()
+            cursor = self.conn.execute("INSERT INTO users (user_id, username, password, role) VALUES (?, ?, ?, ?)",
+                                       (None if taken else record["user_id"], record["username"],
+                                        record["password"], record["role"]))
+        return dict(record, user_id=cursor.lastrowid)
+
+    def update_user(self, user_id, fields):
+        for field, value in fields.items():
+            if field not in ("username", "password", "role"):
+                raise ValueError(f"Unknown user field '{field}'.")
+            self.execute(f"UPDATE users SET {field} = ? WHERE user_id = ?", (value, user_id))
+
+    def _migrate_category_ids(self):
+        """One-shot rebuild of a pre-category_id expenses table: names become ids, unknown names are added to
+        categories, all in one transaction. Runs before SCHEMA, whose indexes need the new column."""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(expenses)")}
+        if "category" not in columns:
+            return
+        with self.batch():
+            self.conn.execute("INSERT INTO categories (name) SELECT DISTINCT category FROM expenses "
+                              "WHERE category NOT IN (SELECT name FROM categories)")
+            self.conn.execute(f"CREATE TABLE expenses_by_id {EXPENSES_TABLE}")
+            self.conn.execute("INSERT INTO expenses_by_id (user_id, expense_id, date, amount, category_id, "
+                              "description) SELECT e.user_id, e.expense_id, e.date, e.amount, "
+                              "(SELECT MIN(c.category_id) FROM categories c WHERE c.name = e.category), "
+                              "e.description FROM expenses e")
+            self.conn.execute("DROP TABLE expenses")  # Drops its indexes too; SCHEMA recreates them
+            self.conn.execute("ALTER TABLE expenses_by_id RENAME TO expenses")
+        logging.info(f"Migrated {self.path} expenses to category ids.")
+
+    def _add_daily_totals(self):
+        """Creates and fills daily_totals for a database written before it existed; every write keeps it current
+        from then on."""
+        def missing():
+            tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            return "expenses" in tables and "daily_totals" not in tables
+
+        if not missing():
+            return
+        with self.batch():
+            if missing():  # Another process may have added it while this one waited for the lock
+                self.conn.execute(f"CREATE TABLE daily_totals {DAILY_TOTALS_TABLE}")
+                self.conn.execute(FILL_DAILY_TOTALS)
+                logging.info(f"Added daily totals to {self.path}.")
+
+    def _add_search_words(self):
+        """Creates and fills the search index for a database written before it existed."""
+        def missing():
+            tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            return "expenses" in tables and "search_words" not in tables
+
+        if not missing():
+            return
+        with self.batch():
+            if missing():
+                self.conn.execute(f"CREATE TABLE search_words {SEARCH_WORDS_TABLE}")
+                fill_search_words(self.conn)
+                logging.info(f"Added the search index to {self.path}.")
+
+    def categories(self):
+        rows = self.conn.execute("SELECT category_id, name, user_id FROM categories ORDER BY category_id")
+        return {str(row["category_id"]): dict(row) for row in rows}
+
+    def category_id(self, name):
+        row = self.conn.execute("SELECT MIN(category_id) FROM categories WHERE name = ?", (name,)).fetchone()
+        if row[0] is None:
+            raise ValueError(f"Unknown category '{name}'.")
+        return row[0]
+
+    def save_category(self, record):
+        self.execute("INSERT OR REPLACE INTO categories (category_id, name, user_id) VALUES (?, ?, ?)",
+                     (record["category_id"], record["name"], record.get("user_id")))
+
+    def _category(self, category_id):
+        row = self.conn.execute("SELECT category_id, name, user_id FROM categories WHERE category_id = ?",
+                                (category_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Category ID {category_id} not found.")
+        return dict(row)
+
+    def _check_unique(self, name, category_id=None):
+        if self.conn.execute("SELECT 1 FROM categories WHERE name = ? AND category_id IS NOT ?",
+                             (name, category_id)).fetchone():
+            raise ValueError(f"Category '{name}' already exists.")
+
+    def add_category(self, name, user_id=None):
+        name = clean_category_name(name)
+        with self.batch():
+            self._check_unique(name)
+            cursor = self.conn.execute("INSERT INTO categories (name, user_id) VALUES (?, ?)", (name, user_id))
+        return {"category_id": cursor.lastrowid, "name": name, "user_id": user_id}
+
+    def rename_category(self, category_id, name):
+        category_id, name = int(category_id), clean_category_name(name)
+        with self.batch():
+            category = self._category(category_id)
+            self._check_unique(name, category_id)
+            self.conn.execute("UPDATE categories SET name = ? WHERE category_id = ?", (name, category_id))
+        return dict(category, name=name)
+
+    def merge_categories(self, source_id, target_id):
+        source_id, target_id = int(source_id), int(target_id)
+        if source_id == target_id:
+            raise ValueError("Cannot merge a category into itself.")
+        with self.batch():
+            self._category(source_id)
+            self._category(target_id)
+            moved = self.conn.execute("UPDATE expenses SET category_id = ? WHERE category_id = ?",
+                                      (target_id, source_id)).rowcount
+            self.conn.execute("INSERT INTO daily_totals (user_id, date, category_id, total) "
+                              "SELECT user_id, date, ?, total FROM daily_totals WHERE category_id = ? "
+                              "ON CONFLICT (user_id, date, category_id) DO UPDATE SET "
+                              "total = round(total + excluded.total, 2)", (target_id, source_id))
+            self.conn.execute("DELETE FROM daily_totals WHERE category_id = ?", (source_id,))
+            # A user's budget for source moves to target unless they already budget target for that period
+            self.conn.execute("UPDATE OR IGNORE category_budgets SET category_id = ? WHERE category_id = ?",
+                              (target_id, source_id))
+            self.conn.execute("DELETE FROM category_budgets WHERE category_id = ?", (source_id,))
+            self.conn.execute("DELETE FROM categories WHERE category_id = ?", (source_id,))
+        return moved
+
+    def delete_category(self, category_id, reassign_to=None):
+        if reassign_to is not None:
+            return self.merge_categories(category_id, reassign_to)
+        category_id = int(category_id)
+        with self.batch():
+            self._category(category_id)
+            if self.conn.execute("SELECT 1 FROM expenses WHERE category_id = ? LIMIT 1", (category_id,)).fetchone():
+                raise ValueError(f"Category ID {category_id} is still used by expenses; "
+                                 "choose a category to reassign them to.")
+            self.conn.execute("DELETE FROM category_budgets WHERE category_id = ?", (category_id,))
+            self.conn.execute("DELETE FROM categories WHERE category_id = ?", (category_id,))
+        return 0
+
+    def user(self, user_id):
+        if user_id not in self._users:
+            self._users[user_id] = SqliteUserStorage(self, int(user_id))
+        return self._users[user_id]
+
+
+class SqliteUserStorage(UserStorage):
+    """One user's rows in the expenses, budgets, daily_totals, search_words and user_meta tables."""
+
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id
+
+    def get(self, expense_id):
+        row = self.db.conn.execute(f"{SELECT_EXPENSES} WHERE e.user_id = ? AND e.expense_id = ?",
+                                   (self.user_id, expense_id)).fetchone()
+        return dict(row) if row else None
+
+    def all(self):
+        rows = self.db.conn.execute(f"{SELECT_EXPENSES} WHERE e.user_id = ? ORDER BY e.expense_id", (self.user_id,))
+        return [dict(row) for row in rows]
+
+    def between(self, start_date, end_date):
+        rows = self.db.conn.execute(
+            f"{SELECT_EXPENSES} WHERE e.user_id = ? AND e.date BETWEEN ? AND ? "
+            "ORDER BY e.date, e.expense_id", (self.user_id, start_date, end_date))
+        return [dict(row) for row in rows]
+
+    def scan(self, sort="date", descending=False, after=None, filters=None):
+        column = SORT_COLUMNS[sort]
+        conditions, params = ["e.user_id = ?"], [self.user_id]
+        for name, value in (filters or {}).items():
+            if value is None:
+                continue
+            if name == "search":
+                names = {int(key): category["name"] for key, category in self.db.categories().items()}
+                for word, category_ids in search_terms(value, names):
+                    condition, params = SEARCH_SQL, params + [self.user_id, word, word + LAST_CHAR]
+                    if category_ids:
+                        condition = f"({condition} OR e.category_id IN ({', '.join('?' * len(category_ids))}))"
+                        params.extend(sorted(category_ids))
+                    conditions.append(condition)
+                continue
+            conditions.append(FILTER_SQL[name])
+            params.append(value.lower() if name == "text" else value)
+        if after is not None:
+            # Keyset pagination: continue from the last row's (sort value, expense_id) instead of an OFFSET
+            conditions.append(f"({column}, e.expense_id) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        rows = self.db.conn.execute(f"{SELECT_EXPENSES} WHERE {' AND '.join(conditions)} "
+                                    f"ORDER BY {column} {direction}, e.expense_id {direction}", params)
+        return (dict(row) for row in rows)
+
+    def add(self, records):
+        if not records:
+            return []
+        with self.db.batch():
+            names = self._category_names(records)
+            next_id = self.db.conn.execute(NEXT_EXPENSE_ID, (self.user_id, self.user_id)).fetchone()[0]
+            expenses = [{"expense_id": next_id + offset, **record} for offset, record in enumerate(records)]
+            self.db.conn.executemany(
+                "INSERT INTO expenses (user_id, expense_id, date, amount, category_id, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.user_id, exp["expense_id"], exp["date"], exp["amount"], exp["category_id"],
+                  exp["description"]) for exp in expenses])
+            self.db.conn.execute(SET_NEXT_EXPENSE_ID, (self.user_id, next_id + len(expenses)))
+            self._count_days([(exp["date"], exp["category_id"], exp["amount"]) for exp in expenses])
+            self.db.conn.executemany(ADD_SEARCH_WORD, [(self.user_id, word, exp["expense_id"]) for exp in expenses
+                                                       for word in tokenize(exp["description"])])
+        return [dict(exp, category=names[exp["category_id"]]) for exp in expenses]
+
+    def _count_days(self, deltas):
+        """Applies (date, category_id, amount) deltas to daily_totals with one statement per day and category,
+        dropping totals that reach zero."""
+        totals = {}
+        for date, category_id, amount in deltas:
+            totals[(date, category_id)] = totals.get((date, category_id), 0) + amount
+        rows = [(self.user_id, date, category_id, round(total, 2))
+                for (date, category_id), total in totals.items() if round(total, 2)]
+        self.db.conn.executemany(ADD_DAILY_TOTAL, rows)
+        self.db.conn.executemany("DELETE FROM daily_totals WHERE user_id = ? AND date = ? AND category_id = ? "
+                                 "AND total = 0", [row[:3] for row in rows if row[3] < 0])
+
+    def _category_names(self, records):
+        """Returns {category_id: name} for the records' categories, raising ValueError if one does not exist."""
+        names = {}
+        for category_id in {record["category_id"] for record in records}:
+            row = self.db.conn.execute("SELECT name FROM categories WHERE category_id = ?", (category_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"Unknown category ID {category_id}.")
+            names[category_id] = row[0]
+        return names
+
+    def update(self, expense_id, fields):
+        for field in fields:
+            if field not in ("amount", "category_id", "description", "date"):
+                raise ValueError(f"Unknown expense field '{field}'.")
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        with self.db.batch():
+            if "category_id" in fields:
+                self._category_names([fields])
+            before = self.get(expense_id)
+            self.db.execute(f"UPDATE expenses SET {assignments} WHERE user_id = ? AND expense_id = ?",
+                            (*fields.values(), self.user_id, expense_id))
+            if before is not None and {"amount", "date", "category_id"} & set(fields):
+                after = dict(before, **fields)
+                self._count_days([(before["date"], before["category_id"], -before["amount"]),
+                                  (after["date"], after["category_id"], after["amount"])])
+            if before is not None and "description" in fields:
+                self._unindex(before)
+                self.db.conn.executemany(ADD_SEARCH_WORD, [(self.user_id, word, expense_id)
+                                                           for word in tokenize(fields["description"])])
+        return self.get(expense_id)
+
+    def _unindex(self, expense):
+        """Removes an expense's words from search_words, found by the description it was stored with."""
+        self.db.conn.executemany("DELETE FROM search_words WHERE user_id = ? AND word = ? AND expense_id = ?",
+                                 [(self.user_id, word, expense["expense_id"])
+                                  for word in tokenize(expense["description"])])
+
+    def delete(self, expense_id):
+        with self.db.batch():
+            expense = self.get(expense_id)
+            self.db.execute("DELETE FROM expenses WHERE user_id = ? AND expense_id = ?", (self.user_id, expense_id))
+            if expense is not None:
+                self._count_days([(expense["date"], expense["category_id"], -expense["amount"])])
+                self._unindex(expense)
+        return expense
+
+    def summary(self, start_month, end_month):
+        rows = self.db.conn.execute(
+            "SELECT COALESCE(c.name, d.category_id) AS category, SUM(d.total) AS total FROM daily_totals d "
+            "LEFT JOIN categories c ON c.category_id = d.category_id "
+            "WHERE d.user_id = ? AND d.date >= ? AND d.date < ? GROUP BY d.category_id",
+            (self.user_id, start_month, end_month + "~"))  # '~' sorts after every day of end_month
+        by_category = {row["category"]: round(row["total"], 2) for row in rows}
+        return round(sum(by_category.values()), 2), by_category
+
+    def budget(self, period, category_id=None):
+        if category_id is None:
+            row = self.db.conn.execute("SELECT amount FROM budgets WHERE user_id = ? AND period = ?",
+                                       (self.user_id, period)).fetchone()
+        else:
+            row = self.db.conn.execute("SELECT amount FROM category_budgets WHERE user_id = ? AND period = ? "
+                                       "AND category_id = ?", (self.user_id, period, category_id)).fetchone()
+        return row[0] if row else None
+
+    def set_budget(self, period, amount, category_id=None):
+        if category_id is None:
+            self.db.execute("INSERT OR REPLACE INTO budgets (user_id, period, amount) VALUES (?, ?, ?)",
+                            (self.user_id, period, amount))
+            return
+        with self.db.batch():
+            self._category_names([{"category_id": category_id}])
+            self.db.execute("INSERT OR REPLACE INTO category_budgets (user_id, period, category_id, amount) "
+                            "VALUES (?, ?, ?, ?)", (self.user_id, period, category_id, amount))
+
+    def budgets(self):
+        rows = self.db.conn.execute("SELECT period, amount FROM budgets WHERE user_id = ?", (self.user_id,))
+        return {row["period"]: row["amount"] for row in rows}
+
+    def category_budgets(self):
+        rows = self.db.conn.execute("SELECT period, category_id, amount FROM category_budgets WHERE user_id = ?",
+                                    (self.user_id,))
+        budgets = {}
+        for row in rows:
+            budgets.setdefault(row["period"], {})[row["category_id"]] = row["amount"]
+        return budgets
+
+    def rolling_budgets(self):
+        rows = self.db.conn.execute(
+            "SELECT period, NULL AS category_id, amount FROM budgets WHERE user_id = ? AND period LIKE '%d' "
+            "UNION ALL SELECT period, category_id, amount FROM category_budgets WHERE user_id = ? AND period LIKE '%d'",
+            (self.user_id, self.user_id))
+        return {(row["period"], row["category_id"]): row["amount"] for row in rows}
+
+    def spent(self, start_date, end_date, category_id=None):
+        sql = "SELECT SUM(total) FROM daily_totals WHERE user_id = ? AND date BETWEEN ? AND ?"
+        params = [self.user_id, start_date, end_date]
+        if category_id is not None:
+            sql += " AND category_id = ?"
+            params.append(category_id)
+        return round(self.db.conn.execute(sql, params).fetchone()[0] or 0, 2)
+
+    def batch(self):
+        return self.db.batch()
+
+
+def fill_search_words(conn):
+    """Indexes the description of every expense, for databases written before search_words and bulk copies."""
+    rows = conn.execute("SELECT user_id, expense_id, description FROM expenses")
+    conn.executemany(ADD_SEARCH_WORD, ((user_id, word, expense_id) for user_id, expense_id, description in rows
+                                       for word in tokenize(description)))
+
+
+def import_from_json(db_path):
+    """Copies users, categories and every user's shard from the JSON backend into a SQLite database."""
+    from file_manager import load_user_data
+    from storage import JsonStorage
+    source = JsonStorage()
+    target = SqliteStorage(db_path)
+    counts = {"users": 0, "categories": 0, "expenses": 0, "budgets": 0, "category budgets": 0}
+    with target.batch():
+        for user in source.users():
+            target.conn.execute("INSERT OR REPLACE INTO users (user_id, username, password, role) VALUES (?, ?, ?, ?)",
+                                (user["user_id"], user["username"], user["password"], user.get("role", "user")))
+            counts["users"] += 1
+        for category in source.categories().values():
+            target.save_category(dict(category, category_id=int(category["category_id"])))
+            counts["categories"] += 1
+
+        user_ids = {user["user_id"] for user in source.users()} | set(source.shard_user_ids())
+        for user_id in sorted(user_ids):
+            shard = source.user(user_id)
+            expenses = shard.all()
+            target.conn.executemany(
+                "INSERT OR REPLACE INTO expenses (user_id, expense_id, date, amount, category_id, description) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(user_id, exp["expense_id"], exp["date"], exp["amount"], exp["category_id"], exp["description"])
+                 for exp in expenses])
+            counts["expenses"] += len(expenses)
+            next_id = load_user_data(user_id).get("meta", {}).get("next_expense_id")
+            if next_id:
+                target.conn.execute(SET_NEXT_EXPENSE_ID, (user_id, next_id))
+            for period, amount in shard.budgets().items():
+                target.conn.execute("INSERT OR REPLACE INTO budgets (user_id, period, amount) VALUES (?, ?, ?)",
+                                    (user_id, period, amount))
+                counts["budgets"] += 1
+            for period, limits in shard.category_budgets().items():
+                for category_id, amount in limits.items():
+                    target.conn.execute("INSERT OR REPLACE INTO category_budgets (user_id, period, category_id, "
+                                        "amount) VALUES (?, ?, ?, ?)", (user_id, period, category_id, amount))
+                    counts["category budgets"] += 1
+        # Rows were copied straight into expenses, so the totals and the search index are built once at the end
+        target.conn.execute("DELETE FROM daily_totals")
+        target.conn.execute(FILL_DAILY_TOTALS)
+        target.conn.execute("DELETE FROM search_words")
+        fill_search_words(target.conn)
+    logging.info(f"Imported JSON data into {db_path}: {counts}")
+    return counts
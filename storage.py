@@ -0,0 +1,552 @@
+# storage.py - Pluggable Storage Backends (JSON shards or SQLite) behind one interface
+import os
+from contextlib import contextmanager
+from file_manager import (store, load_data, commit, transact, load_user_data, commit_user, transact_user, user_store,
+                          release_user, shard_user_ids, search_file, migrate_to_shards, migrate_category_ids,
+                          set_change, delete_change, append_change, update_change)
+from rollups import rollup_changes, batch_rollup_changes, merge_rollup_categories, rollup_drift, summarize
+from budgets import merge_budget_categories, month_window, rolling_days
+from search import open_index, save_index, search_terms
+
+BACKENDS = ("json", "sqlite")
+BACKEND = os.environ.get("CHACHING_BACKEND", "json")   # Overridden by app.py --backend
+SQLITE_FILE = os.environ.get("CHACHING_DB", "data.db")
+
+_storage = None
+
+
+def get_storage():
+    """Returns the process-wide storage backend selected by BACKEND, opening it on first use."""
+    global _storage
+    if _storage is None:
+        if BACKEND == "sqlite":
+            from sqlite_storage import SqliteStorage
+            _storage = SqliteStorage(SQLITE_FILE)
+        elif BACKEND == "json":
+            _storage = JsonStorage()
+        else:
+            raise ValueError(f"Unknown storage backend '{BACKEND}'. Choose one of: {', '.join(BACKENDS)}.")
+    return _storage
+
+
+def use_backend(name):
+    """Switches the backend used by the next get_storage() call."""
+    global BACKEND, _storage
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}'. Choose one of: {', '.join(BACKENDS)}.")
+    BACKEND = name
+    _storage = None
+
+
+class Storage:
+    """Global data every backend stores: users and categories, plus access to each user's expenses."""
+
+    def users(self):
+        """Returns every user record."""
+        raise NotImplementedError
+
+    def user_count(self):
+        """Returns how many users are registered, without materializing them where the backend allows."""
+        return len(self.users())
+
+    def add_user(self, record):
+        """Stores a new user record and returns it. A user_id of None, or one another process has taken, is
+        replaced by the next free ID, so use the one returned. Raises ValueError if the username is registered."""
+        raise NotImplementedError
+
+    def update_user(self, user_id, fields):
+        """Changes fields on an existing user."""
+        raise NotImplementedError
+
+    def categories(self):
+        """Returns {category_id (str): category record}."""
+        raise NotImplementedError
+
+    def category_id(self, name):
+        """Returns the id of the category with this name; raises ValueError if there is none."""
+        for category in self.categories().values():
+            if category["name"] == name:
+                return int(category["category_id"])
+        raise ValueError(f"Unknown category '{name}'.")
+
+    def save_category(self, record):
+        """Creates or replaces a category record as given (no id allocation or name checks)."""
+        raise NotImplementedError
+
+    def add_category(self, name, user_id=None):
+        """Creates a category under the next free id and returns its record; names must be unique."""
+        raise NotImplementedError
+
+    def rename_category(self, category_id, name):
+        """Renames a category and returns its record. Expenses hold the id, so none of them is touched."""
+        raise NotImplementedError
+
+    def merge_categories(self, source_id, target_id):
+        """Moves every expense of category source_id to target_id, removes source_id and returns how many
+        expenses moved."""
+        raise NotImplementedError
+
+    def delete_category(self, category_id, reassign_to=None):
+        """Removes a category, first moving its expenses to reassign_to (a merge). Raises ValueError if
+        expenses still use it and no reassign_to is given. Returns how many expenses were moved."""
+        raise NotImplementedError
+
+    def user(self, user_id):
+        """Returns the UserStorage holding one user's expenses and budgets."""
+        raise NotImplementedError
+
+
+class UserStorage:
+    """One user's expenses and budgets."""
+
+    def get(self, expense_id):
+        """Returns one expense record, or None. Records hold category_id plus the category's current name."""
+        raise NotImplementedError
+
+    def all(self):
+        """Returns every expense in insertion order."""
+        raise NotImplementedError
+
+    def between(self, start_date, end_date):
+        """Returns expenses dated start_date..end_date inclusive, oldest first."""
+        raise NotImplementedError
+
+    def scan(self, sort="date", descending=False, after=None, filters=None):
+        """Yields expenses lazily in sort order ("date", "amount" or "id", ties broken by expense_id), starting
+        just past the after key (sort value, expense_id). filters may hold start_date/end_date, min_amount/
+        max_amount (all inclusive), category_id, text (case-insensitive description substring) and search (words
+        that must each start a word of the description or category name; raises ValueError if it has none)."""
+        raise NotImplementedError
+
+    def add(self, records):
+        """Stores new expenses (without IDs), returning them with their assigned expense_id. Raises ValueError
+        if a category_id is not in the category table."""
+        raise NotImplementedError
+
+    def update(self, expense_id, fields):
+        """Changes fields on an expense, returning the updated record."""
+        raise NotImplementedError
+
+    def delete(self, expense_id):
+        """Removes an expense, returning the deleted record."""
+        raise NotImplementedError
+
+    def summary(self, start_month, end_month):
+        """Returns (total, {category name: total}) for months start_month..end_month inclusive."""
+        raise NotImplementedError
+
+    def budget(self, period, category_id=None):
+        """Returns the budget for a period (a YYYY-MM month or an 'Nd' rolling window), overall or for one
+        category, or None."""
+        raise NotImplementedError
+
+    def set_budget(self, period, amount, category_id=None):
+        """Stores the budget for a period, overall or for one category (raising ValueError if it does not exist)."""
+        raise NotImplementedError
+
+    def budgets(self):
+        """Returns {period: amount} for every overall budget the user set."""
+        raise NotImplementedError
+
+    def category_budgets(self):
+        """Returns {period: {category_id: amount}} for every per-category budget the user set."""
+        raise NotImplementedError
+
+    def rolling_budgets(self):
+        """Returns {(period, category_id or None): amount} for the user's 'Nd' rolling budgets only."""
+        raise NotImplementedError
+
+    def spent(self, start_date, end_date, category_id=None):
+        """Returns the total dated start_date..end_date inclusive, optionally in one category, read from totals
+        every write keeps current instead of from the expenses themselves."""
+        raise NotImplementedError
+
+    def verify_rollups(self, rebuild=False):
+        """Returns drifted precomputed totals, optionally repairing them; backends without any return []."""
+        return []
+
+    @contextmanager
+    def batch(self):
+        """Groups every write made inside the block into a single commit."""
+        yield self
+
+
+class JsonStorage(Storage):
+    """data.json for users and categories, plus one journaled JSON shard per user.
+
+    Expenses reference categories by id. A category is flagged used when its first expense is stored, so one
+    that never had any is deleted without looking at a shard. Otherwise a merge or delete first marks the
+    category with merged_into in the table, which hides it from new expenses and shows its expenses under the
+    target's name at once, then visits each shard under its lock and finally drops the marked record. A merge
+    or delete cut short by a crash or a failed shard write leaves the mark behind; running it again resumes it.
+    """
+
+    def __init__(self):
+        migrate_to_shards()
+        migrate_category_ids()
+        self._users = {}
+        self._category_cache = None
+
+    def users(self):
+        return load_data()["users"]
+
+    def add_user(self, record):
+        def build(data):
+            users = data["users"]
+            if any(user["username"] == record["username"] for user in users):
+                raise ValueError(f"Username '{record['username']}' already exists.")
+            # meta.next_user_id is kept with the data, so a new ID never needs a scan of every user; files
+            # written before it existed get it from one scan here
+            next_id = data.get("meta", {}).get("next_user_id") or max(
+                (user["user_id"] for user in users), default=0) + 1
+            user_id = record.get("user_id")
+            if user_id is None or user_id < next_id and any(user["user_id"] == user_id for user in users):
+                user_id = next_id
+            return [append_change(["users"], dict(record, user_id=user_id)),
+                    set_change(["meta", "next_user_id"], max(next_id, user_id + 1))]
+        return transact(build)[0]["value"]
+
+    def update_user(self, user_id, fields):
+        commit([update_change(["users"], "user_id", user_id, fields)])
+
+    def _category_tables(self):
+        """Returns (live categories, {id: display name}, {name: id}), rebuilt only after the table changed."""
+        data = load_data()
+        key = (id(data), store.version, store.generation)
+        if self._category_cache is None or self._category_cache[0] != key:
+            table = data.get("categories", {})
+            live = {key: category for key, category in table.items() if "merged_into" not in category}
+            names = {int(category["category_id"]): category["name"] for category in live.values()}
+            for category in table.values():
+                if "merged_into" in category:
+                    names[int(category["category_id"])] = names.get(category["merged_into"], category["name"])
+            ids = {}
+            for category_id, category in sorted(live.items(), key=lambda item: int(item[0]), reverse=True):
+                ids[category["name"]] = int(category_id)
+            self._category_cache = (key, live, names, ids)
+        return self._category_cache[1:]
+
+    def categories(self):
+        return self._category_tables()[0]
+
+    def category_id(self, name):
+        category_id = self._category_tables()[2].get(name)
+        if category_id is None:
+            raise ValueError(f"Unknown category '{name}'.")
+        return category_id
+
+    def category_names(self):
+        """Returns {category_id (int): name}; a category being merged away already shows its target's name."""
+        return self._category_tables()[1]
+
+    def save_category(self, record):
+        commit([set_change(["categories", str(record["category_id"])], record)])
+
+    def add_category(self, name, user_id=None):
+        name = clean_category_name(name)
+
+        def build(data):
+            categories = data.get("categories", {})
+            _check_unique(categories, name)
+            meta = data.get("meta", {})
+            next_id = meta.get("next_category_id") or max((int(key) for key in categories), default=0) + 1
+            record = {"category_id": next_id, "name": name, "user_id": user_id}
+            return [set_change(["categories", str(next_id)], record),
+                    set_change(["meta", "next_category_id"], next_id + 1)]
+        return transact(build)[0]["value"]
+
+    def rename_category(self, category_id, name):
+        category_id, name = int(category_id), clean_category_name(name)
+
+        def build(data):
+            categories = data.get("categories", {})
+            _live_category(categories, category_id)
+            _check_unique(categories, name, category_id)
+            return [set_change(["categories", str(category_id), "name"], name)]
+        transact(build)
+        return dict(self.categories()[str(category_id)])
+
+    def merge_categories(self, source_id, target_id):
+        source_id, target_id = int(source_id), int(target_id)
+        if source_id == target_id:
+            raise ValueError("Cannot merge a category into itself.")
+
+        def build(data):
+            categories = data.get("categories", {})
+            _live_category(categories, target_id)
+            source = categories.get(str(source_id))
+            if source is None:
+                raise ValueError(f"Category ID {source_id} not found.")
+            if source.get("merged_into") not in (None, target_id):  # None: a delete that was cut short
+                raise ValueError(f"Category ID {source_id} is already being merged into {source['merged_into']}.")
+            return [set_change(["categories", str(source_id), "merged_into"], target_id),
+                    set_change(["categories", str(target_id), "used"], True)]
+        transact(build)
+
+        def recategorize(shard):
+            merge_rollup_categories(shard["rollups"], source_id, target_id)
+            merge_budget_categories(shard.get("category_budgets", {}), source_id, target_id)
+            return shard["expenses"].recategorize(source_id, target_id)
+
+        moved, failed = 0, []
+        for user_id in shard_user_ids():
+            # Checked under the user's lock: an add that validated its category before the mark above has
+            # either committed by now, and is rewritten here, or re-validates after this and is refused
+            shard_store = user_store(user_id)
+            with shard_store.lock():
+                shard = shard_store.get()
+                if _uses_category(shard, source_id) or any(
+                        str(source_id) in limits for limits in shard.get("category_budgets", {}).values()):
+                    try:
+                        moved += shard_store.rewrite(recategorize)
+                    except OSError:
+                        failed.append(user_id)  # Logged by the store; its shard still holds source_id
+            if user_id not in self._users:
+                release_user(user_id)
+        if failed:
+            # The source stays marked, so its expenses keep showing under the target and a retry resumes here
+            raise OSError(f"Could not move the expenses of user(s) {', '.join(map(str, failed))} to category ID "
+                          f"{target_id}; run the merge again to finish it.")
+        commit([delete_change(["categories", str(source_id)])])
+        return moved
+
+    def delete_category(self, category_id, reassign_to=None):
+        if reassign_to is not None:
+            return self.merge_categories(category_id, reassign_to)
+        category_id = int(category_id)
+
+        def build(data):
+            categories = data.get("categories", {})
+            category = categories.get(str(category_id))
+            resuming = category is not None and "merged_into" in category and category["merged_into"] is None
+            if not resuming and not _live_category(categories, category_id).get("used"):
+                return [delete_change(["categories", str(category_id)])]
+            return [set_change(["categories", str(category_id), "merged_into"], None)]
+        if transact(build)[0]["op"] == "delete":
+            return 0  # Never had an expense
+        # No new expense can pick it while the shards are checked
+
+        for user_id in shard_user_ids():
+            shard_store = user_store(user_id)
+            with shard_store.lock():
+                used = _uses_category(shard_store.get(), category_id)
+            if user_id not in self._users:
+                release_user(user_id)
+            if used:
+                commit([delete_change(["categories", str(category_id), "merged_into"])])
+                raise ValueError(f"Category ID {category_id} is still used by expenses; "
+                                 "choose a category to reassign them to.")
+        commit([delete_change(["categories", str(category_id)])])
+        return 0
+
+    def mark_used(self, category_id):
+        """Flags a live category as having expenses (once per category); raises ValueError if it is not live."""
+        def build(data):
+            if _live_category(data.get("categories", {}), category_id).get("used"):
+                return []
+            return [set_change(["categories", str(category_id), "used"], True)]
+        transact(build)
+
+    def user(self, user_id):
+        if user_id not in self._users:
+            self._users[user_id] = JsonUserStorage(self, user_id)
+        return self._users[user_id]
+
+    def shard_user_ids(self):
+        """Returns the IDs of every user that has a shard on disk, including ones no longer in data.json."""
+        return shard_user_ids()
+
+
+def clean_category_name(name):
+    """Returns the name stripped, raising ValueError if nothing is left."""
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Category name cannot be empty.")
+    return name
+
+def _live_category(categories, category_id):
+    """Returns a category record from the table, raising ValueError if it is missing or being merged away."""
+    category = categories.get(str(category_id))
+    if category is None or "merged_into" in category:
+        raise ValueError(f"Category ID {category_id} not found.")
+    return category
+
+def _check_unique(categories, name, category_id=None):
+    for key, category in categories.items():
+        if category["name"] == name and "merged_into" not in category and int(key) != category_id:
+            raise ValueError(f"Category '{name}' already exists.")
+
+def _uses_category(shard, category_id):
+    key = str(category_id)
+    return category_id in shard["expenses"].categories or any(key in totals for totals in shard["rollups"].values())
+
+
+class JsonUserStorage(UserStorage):
+    """A user's shard, held in memory as ExpenseColumns (typed arrays plus a date index), with incrementally
+    maintained monthly rollups.
+
+    Every write computes its changes inside transact_user(), so IDs and rollup totals are recomputed from the
+    latest shard if another process committed to the same user first. The columns are the shard itself, so
+    they never need rebuilding or patching after a write. They hold category ids; names are filled in from the
+    global table as records are read.
+    """
+
+    def __init__(self, db, user_id):
+        self.db = db
+        self.user_id = user_id  # The shard itself is only read on first use
+
+    def columns(self):
+        """Returns the user's ExpenseColumns, caught up with any other process's writes."""
+        return load_user_data(self.user_id)["expenses"]
+
+    def _named(self, records):
+        names = self.db.category_names()
+        for record in records:
+            record["category"] = names.get(record["category_id"])
+            yield record
+
+    def get(self, expense_id):
+        record = self.columns().record(expense_id)
+        return next(self._named([record])) if record is not None else None
+
+    def all(self):
+        return list(self._named(self.columns().values()))
+
+    def between(self, start_date, end_date):
+        return list(self.scan("date", filters={"start_date": start_date, "end_date": end_date}))
+
+    def scan(self, sort="date", descending=False, after=None, filters=None):
+        if filters and filters.get("search"):
+            filters = dict(filters, search=search_terms(filters["search"], self.db.category_names()))
+            return self._named(self._searchable().scan(sort, descending, after, filters))
+        return self._named(self.columns().scan(sort, descending, after, filters))
+
+    def _searchable(self):
+        """Returns the user's ExpenseColumns with their search index open. It is read from the user's .search
+        file when that matches the shard, kept current by every write from then on and saved again with each
+        snapshot of the shard (see search.py)."""
+        columns = self.columns()
+        if columns.search is None:
+            path, shard_store = search_file(self.user_id), user_store(self.user_id)
+            with shard_store.lock(shared=True):
+                columns = shard_store.get()["expenses"]
+                if columns.search is None:
+                    columns.search = open_index(path, shard_store, columns)
+                    shard_store.after_save = lambda saved: save_index(path, saved)
+        return columns
+
+    def _check_categories(self, records):
+        """Raises ValueError unless every record's category_id is a live category, flagging new ones used."""
+        live = self.db.categories()
+        for category_id in {record.get("category_id") for record in records}:
+            category = live.get(str(category_id))
+            if category is None:
+                raise ValueError(f"Unknown category ID {category_id}.")
+            if not category.get("used"):
+                self.db.mark_used(category_id)
+
+    def _transact(self, build):
+        # Built under the user's lock, so the category check cannot race a merge or delete (see JsonStorage)
+        with user_store(self.user_id).lock():
+            return transact_user(self.user_id, build)
+
+    def add(self, records):
+        if not records:
+            return []
+
+        def build(data):
+            self._check_categories(records)
+            meta = data.get("meta", {})
+            next_id = meta.get("next_expense_id") or data["expenses"].last_id() + 1
+            expenses = [{"expense_id": next_id + offset, **record} for offset, record in enumerate(records)]
+            changes = [set_change(["expenses", str(exp["expense_id"])], exp) for exp in expenses]
+            changes.append(set_change(["meta", "next_expense_id"], next_id + len(expenses)))
+            return changes + batch_rollup_changes(data["rollups"], expenses)
+
+        changes = self._transact(build)
+        return list(self._named(dict(change["value"]) for change in changes[:len(records)]))
+
+    def update(self, expense_id, fields):
+        def build(data):
+            expense = data["expenses"].record(expense_id)
+            if expense is None:
+                raise ValueError(f"Expense ID {expense_id} not found.")
+            if "category_id" in fields:
+                self._check_categories([fields])
+            changes = [set_change(["expenses", str(expense_id), field], value) for field, value in fields.items()]
+            return changes + rollup_changes(data["rollups"], removed=expense, added=dict(expense, **fields))
+
+        self._transact(build)
+        return self.get(expense_id)
+
+    def delete(self, expense_id):
+        removed = []
+
+        def build(data):
+            expense = data["expenses"].record(expense_id)
+            if expense is None:
+                raise ValueError(f"Expense ID {expense_id} not found.")
+            removed[:] = [expense]
+            return [delete_change(["expenses", str(expense_id)])] + rollup_changes(data["rollups"], removed=expense)
+
+        transact_user(self.user_id, build)
+        return next(self._named(removed))
+
+    def summary(self, start_month, end_month):
+        total, by_id = summarize(load_user_data(self.user_id)["rollups"], start_month, end_month)
+        names = self.db.category_names()
+        by_category = {}
+        for key, amount in by_id.items():
+            name = names.get(int(key), key) if key.isdigit() else key
+            by_category[name] = round(by_category.get(name, 0) + amount, 2)
+        return total, by_category
+
+    def budget(self, period, category_id=None):
+        data = load_user_data(self.user_id)
+        if category_id is None:
+            return data["budgets"].get(period)
+        return data.get("category_budgets", {}).get(period, {}).get(str(category_id))
+
+    def set_budget(self, period, amount, category_id=None):
+        if category_id is None:
+            commit_user(self.user_id, [set_change(["budgets", period], amount)])
+            return
+
+        def build(data):
+            if str(category_id) not in self.db.categories():
+                raise ValueError(f"Unknown category ID {category_id}.")
+            return [set_change(["category_budgets", period, str(category_id)], amount)]
+        self._transact(build)
+
+    def budgets(self):
+        return load_user_data(self.user_id)["budgets"]
+
+    def category_budgets(self):
+        return {period: {int(key): amount for key, amount in limits.items()}
+                for period, limits in load_user_data(self.user_id).get("category_budgets", {}).items()}
+
+    def rolling_budgets(self):
+        data = load_user_data(self.user_id)
+        budgets = {(period, None): amount for period, amount in data["budgets"].items() if rolling_days(period)}
+        for period, limits in data.get("category_budgets", {}).items():
+            if rolling_days(period):
+                budgets.update({(period, int(key)): amount for key, amount in limits.items()})
+        return budgets
+
+    def spent(self, start_date, end_date, category_id=None):
+        data = load_user_data(self.user_id)
+        month = start_date[:7]
+        if (start_date, end_date) == month_window(month):  # A calendar month is one row of the monthly rollups
+            totals = data["rollups"].get(month, {})
+            return round(sum(totals.values()) if category_id is None else totals.get(str(category_id), 0), 2)
+        return data["expenses"].window_total(start_date, end_date, category_id)
+
+    def verify_rollups(self, rebuild=False):
+        data = load_user_data(self.user_id)
+        drift = rollup_drift(data.get("rollups", {}), data["expenses"].rollups())
+        if drift and rebuild:
+            transact_user(self.user_id, lambda data: [set_change(["rollups"], data["expenses"].rollups())])
+        return drift
+
+    def batch(self):
+        return user_store(self.user_id).batch()
@@ -0,0 +1,37 @@
+# conftest.py - Shared Fixtures: every test runs against an empty data directory of its own
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import applog  # noqa: E402
+
+applog.configure(os.path.join(tempfile.mkdtemp(prefix="chaching-tests-"), "app.log"))  # Before file_manager logs
+
+import file_manager  # noqa: E402
+import storage  # noqa: E402
+
+
+def _drop_caches():
+    file_manager.store.invalidate()
+    file_manager._user_stores.clear()
+    storage.use_backend(storage.BACKEND)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Runs the test in tmp_path with the JSON backend and nothing cached from earlier tests."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage, "BACKEND", "json")
+    _drop_caches()
+    yield tmp_path
+    _drop_caches()
+
+
+@pytest.fixture
+def reopen():
+    """Returns a function that drops every cached file and handle, as a fresh process would start."""
+    return _drop_caches
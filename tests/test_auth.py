@@ -0,0 +1,108 @@
+# test_auth.py - Username lookups and failed-login throttling, on a fake clock
+import pytest
+
+import auth
+from auth import (BASE_DELAY, FORGET_AFTER, FREE_ATTEMPTS, GLOBAL_LIMIT, Authentication, LoginThrottle,
+                  LoginThrottled)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def authentication(clock):
+    authentication = Authentication()
+    authentication.throttle = LoginThrottle(clock)
+    authentication.create_user("alice", "secret")
+    return authentication
+
+
+def fail(throttle, username, times):
+    for _ in range(times):
+        throttle.check(username)
+        throttle.failed(username)
+
+
+def test_backoff_starts_after_the_free_attempts_and_doubles(clock):
+    throttle = LoginThrottle(clock)
+    fail(throttle, "alice", FREE_ATTEMPTS - 1)
+    throttle.check("alice")  # Still free
+    throttle.failed("alice")
+    with pytest.raises(LoginThrottled) as throttled:
+        throttle.check("alice")
+    assert throttled.value.retry_after == BASE_DELAY
+    throttle.check("bob")  # Other usernames are not affected
+
+    clock.now += BASE_DELAY
+    fail(throttle, "alice", 1)
+    with pytest.raises(LoginThrottled) as throttled:
+        throttle.check("alice")
+    assert throttled.value.retry_after == 2 * BASE_DELAY
+
+    throttle.succeeded("alice")
+    throttle.check("alice")
+
+
+def test_failures_are_forgotten_after_a_quiet_spell(clock):
+    throttle = LoginThrottle(clock)
+    fail(throttle, "alice", FREE_ATTEMPTS - 1)
+    clock.now += FORGET_AFTER + 1
+    fail(throttle, "alice", FREE_ATTEMPTS - 1)  # Counted from one again, so still within the free attempts
+    throttle.check("alice")
+
+
+def test_too_many_failures_across_usernames_pause_every_login(clock):
+    throttle = LoginThrottle(clock)
+    for n in range(GLOBAL_LIMIT):
+        throttle.failed(f"spray{n}")
+        clock.now += 0.001
+    with pytest.raises(LoginThrottled):
+        throttle.check("someone-else")
+    clock.now += BASE_DELAY
+    throttle.check("someone-else")
+
+
+def test_throttled_login_is_rejected_without_hashing(authentication, monkeypatch):
+    for _ in range(FREE_ATTEMPTS):
+        assert authentication.authenticate("alice", "wrong") is None
+    hashed = []
+    monkeypatch.setattr(auth, "verify_password", lambda stored, password: hashed.append(password))
+    with pytest.raises(LoginThrottled):
+        authentication.authenticate("alice", "secret")
+    assert hashed == []
+
+
+def test_correct_password_logs_in_and_resets_the_count(authentication, clock):
+    for _ in range(FREE_ATTEMPTS - 1):
+        authentication.authenticate("alice", "wrong")
+    assert authentication.authenticate("alice", "secret").username == "alice"
+    for _ in range(FREE_ATTEMPTS - 1):
+        assert authentication.authenticate("alice", "wrong") is None
+    assert authentication.authenticate("alice", "secret") is not None
+
+
+def test_users_registered_by_another_process_are_found(authentication):
+    assert authentication.find_user("bob") is None
+    Authentication().create_user("bob", "pw")  # Another process with its own index
+    assert authentication.find_user("bob").username == "bob"
+    assert authentication.find_user("nobody") is None
+
+
+def test_app_find_user_goes_through_the_index(authentication, monkeypatch, capsys):
+    import app
+    assert app.find_user("alice", authentication).username == "alice"
+    with monkeypatch.context() as patch:
+        patch.setattr(authentication, "_sync_users", lambda: pytest.fail("known user looked up by a scan"))
+        assert app.find_user("alice", authentication).user_id == authentication.find_user("alice").user_id
+    assert app.find_user("nobody") is None
+    assert "Unknown user 'nobody'" in capsys.readouterr().out
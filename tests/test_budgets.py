@@ -0,0 +1,86 @@
+# test_budgets.py - Threshold alerts on add and spent-so-far after edits, on both backends
+import pytest
+
+import budgets
+import storage
+from expenses import ExpenseTracker
+from models import User
+
+THRESHOLDS = (50, 80, 100)
+
+
+@pytest.fixture(params=storage.BACKENDS)
+def tracker(request, reopen, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", request.param)
+    monkeypatch.setattr(budgets, "THRESHOLDS", THRESHOLDS)
+    reopen()
+    for name in ("Food", "Fun"):
+        storage.get_storage().add_category(name)
+    return ExpenseTracker(User("alice", "x", user_id=1))
+
+
+def fired(expense):
+    return [(alert["period"], alert["category"], alert["threshold"]) for alert in expense["alerts"]]
+
+
+def spent(tracker, date, period, category=None):
+    return next(entry["spent"] for entry in tracker.budget_status(date)
+                if entry["period"] == period and entry["category"] == category)
+
+
+def test_monthly_budget_alerts_once_per_threshold(tracker):
+    tracker.set_budget("2024-01", 100)
+    assert fired(tracker.add(40, "Food", "Shop", "2024-01-02")) == []
+    assert fired(tracker.add(20, "Fun", "Film", "2024-01-03")) == [("2024-01", None, 50)]
+    assert fired(tracker.add(15, "Food", "Shop", "2024-02-03")) == []  # Another month
+    assert fired(tracker.add(40, "Food", "Shop", "2024-01-31")) == [("2024-01", None, 80), ("2024-01", None, 100)]
+    assert fired(tracker.add(5, "Food", "Shop", "2024-01-31")) == []
+
+
+def test_category_budget_only_counts_its_category(tracker):
+    tracker.set_budget("2024-01", 50, "Food")
+    assert fired(tracker.add(100, "Fun", "Concert", "2024-01-02")) == []
+    assert fired(tracker.add(30, "Food", "Shop", "2024-01-03")) == [("2024-01", "Food", 50)]
+    assert spent(tracker, "2024-01-03", "2024-01", "Food") == 30
+
+
+def test_rolling_budget_counts_the_days_up_to_each_expense(tracker):
+    tracker.set_budget("7d", 100)
+    assert fired(tracker.add(60, "Food", "Shop", "2024-01-01")) == [("7d", None, 50)]
+    assert fired(tracker.add(30, "Food", "Shop", "2024-01-10")) == []  # The first one is out of the window
+    assert fired(tracker.add(30, "Fun", "Film", "2024-01-11")) == [("7d", None, 50)]
+    assert spent(tracker, "2024-01-11", "7d") == 60
+    assert spent(tracker, "2024-01-20", "7d") == 0
+
+
+def test_batch_reports_each_threshold_once(tracker):
+    tracker.set_budget("2024-01", 100)
+    tracker.set_budget("7d", 100)
+    expenses = tracker.store.add([{"amount": 40, "category_id": storage.get_storage().category_id("Food"),
+                                   "description": "Shop", "user_id": 1, "date": f"2024-01-0{day}"}
+                                  for day in (1, 2, 3)])
+    alerts = sorted((alert["period"], alert["threshold"]) for alert in budgets.check_budgets(tracker.store, expenses))
+    assert alerts == [("2024-01", 50), ("2024-01", 80), ("2024-01", 100), ("7d", 50), ("7d", 80), ("7d", 100)]
+
+
+def test_edits_and_deletes_move_spending_back_down(tracker):
+    tracker.set_budget("2024-01", 100)
+    tracker.set_budget("2024-01", 100, "Food")
+    big = tracker.add(90, "Food", "Shop", "2024-01-05")
+    assert fired(big) == [("2024-01", None, 50), ("2024-01", None, 80),
+                          ("2024-01", "Food", 50), ("2024-01", "Food", 80)]
+
+    tracker.update(big["expense_id"], amount=10)
+    assert spent(tracker, "2024-01-05", "2024-01") == 10
+    assert fired(tracker.add(45, "Fun", "Film", "2024-01-06")) == [("2024-01", None, 50)]  # Fires again
+
+    tracker.update(big["expense_id"], category="Fun")
+    assert spent(tracker, "2024-01-06", "2024-01", "Food") == 0
+    tracker.update(big["expense_id"], date="2024-02-01")
+    assert spent(tracker, "2024-01-06", "2024-01") == 45
+
+    other = tracker.add(10, "Food", "Shop", "2024-01-07")
+    tracker.delete(other["expense_id"])
+    assert spent(tracker, "2024-01-07", "2024-01") == 45
+    assert spent(tracker, "2024-01-07", "2024-01", "Food") == 0
+    assert fired(tracker.add(40, "Food", "Shop", "2024-01-08")) == [("2024-01", None, 50), ("2024-01", None, 80)]
@@ -0,0 +1,125 @@
+# test_categories.py - Renaming, merging and deleting categories on both backends
+import pytest
+
+import file_manager
+import storage
+from expenses import ExpenseTracker
+from file_manager import set_change
+from models import User
+
+
+@pytest.fixture(params=storage.BACKENDS)
+def db(request, reopen, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", request.param)
+    reopen()
+    db = storage.get_storage()
+    for name in ("Food", "Groceries", "Fun", "Spare"):
+        db.add_category(name)
+    return db
+
+
+def tracker(user_id):
+    return ExpenseTracker(User(f"user{user_id}", "x", user_id=user_id))
+
+
+def category_ids(db):
+    return {category["name"]: int(category["category_id"]) for category in db.categories().values()}
+
+
+def spend(users=(1, 2, 3)):
+    """Gives each user a Food and a Groceries expense in January, and a Groceries budget."""
+    for user_id in users:
+        tracker(user_id).add(10 * user_id, "Food", f"Lunch {user_id}", "2024-01-05")
+        tracker(user_id).add(user_id, "Groceries", f"Milk {user_id}", "2024-01-06")
+        tracker(user_id).set_budget("2024-01", 50, "Groceries")
+
+
+def test_rename_shows_the_new_name_everywhere(db):
+    spend()
+    db.rename_category(category_ids(db)["Food"], "Eating out")
+    assert [exp["category"] for exp in tracker(2).query(category="Eating out")] == ["Eating out"]
+    assert tracker(2).summary("2024-01")["by_category"]["Eating out"] == 20
+    with pytest.raises(ValueError, match="already exists"):
+        db.rename_category(category_ids(db)["Fun"], "Groceries")
+    with pytest.raises(ValueError, match="not found"):
+        db.rename_category(999, "Nothing")
+
+
+def test_merge_moves_expenses_totals_and_budgets_in_every_shard(db):
+    spend()
+    ids = category_ids(db)
+    assert db.merge_categories(ids["Groceries"], ids["Food"]) == 3
+    assert "Groceries" not in category_ids(db)
+    for user_id in (1, 2, 3):
+        assert {exp["category"] for exp in tracker(user_id).query()} == {"Food"}
+        assert tracker(user_id).summary("2024-01")["by_category"] == {"Food": 11 * user_id}
+        assert {entry["category"] for entry in tracker(user_id).budget_status("2024-01-06")
+                if entry["category"]} == {"Food"}
+    with pytest.raises(ValueError):
+        tracker(1).add(1, "Groceries", "Eggs", "2024-01-07")
+    with pytest.raises(ValueError):
+        db.merge_categories(ids["Food"], ids["Food"])
+
+
+def test_delete_with_reassignment_moves_every_users_expenses(db):
+    spend()
+    ids = category_ids(db)
+    assert db.delete_category(ids["Food"], ids["Fun"]) == 3
+    assert "Food" not in category_ids(db)
+    assert sorted(exp["amount"] for user_id in (1, 2, 3) for exp in tracker(user_id).query(category="Fun")) == [
+        10, 20, 30]
+
+
+def test_delete_is_refused_while_expenses_use_the_category(db):
+    spend(users=(1, 2))
+    ids = category_ids(db)
+    with pytest.raises(ValueError, match="still used by expenses"):
+        db.delete_category(ids["Groceries"])
+    assert category_ids(db)["Groceries"] == ids["Groceries"]
+    tracker(2).add(4, "Groceries", "Bread", "2024-01-08")  # Still live for new expenses
+
+    assert db.delete_category(ids["Spare"]) == 0  # Never used
+    assert "Spare" not in category_ids(db)
+
+
+def test_failed_shard_rewrite_keeps_the_merge_resumable(reopen, monkeypatch):
+    storage.get_storage().add_category("Food")
+    storage.get_storage().add_category("Groceries")
+    spend()
+    db = storage.get_storage()
+    ids = category_ids(db)
+
+    def full_disk(shard, f):
+        raise OSError("no space left on device")
+    with monkeypatch.context() as patch, pytest.raises(OSError, match="run the merge again"):
+        patch.setattr(file_manager.user_store(2), "dump", full_disk)
+        db.merge_categories(ids["Groceries"], ids["Food"])
+
+    reopen()
+    db = storage.get_storage()
+    assert "Groceries" not in category_ids(db)  # Still marked, so not offered for new expenses ...
+    assert {exp["category"] for exp in tracker(2).query()} == {"Food"}  # ... and shown under the target
+    assert db.merge_categories(ids["Groceries"], ids["Food"]) == 1  # User 2's expense; the others already moved
+    assert str(ids["Groceries"]) not in file_manager.load_data()["categories"]
+
+
+def test_delete_cut_short_by_a_crash_can_be_retried(reopen):
+    db = storage.get_storage()
+    for name in ("Food", "Groceries", "Fun"):
+        db.add_category(name)
+    spend(users=(1,))
+    ids = category_ids(db)
+    for name in ("Fun", "Groceries"):  # Marked as being deleted, as delete_category does before the shard checks
+        file_manager.commit([set_change(["categories", str(ids[name]), "used"], True),
+                             set_change(["categories", str(ids[name]), "merged_into"], None)])
+
+    reopen()
+    db = storage.get_storage()
+    assert db.delete_category(ids["Fun"]) == 0
+    assert str(ids["Fun"]) not in file_manager.load_data()["categories"]
+    with pytest.raises(ValueError, match="still used by expenses"):
+        db.delete_category(ids["Groceries"])  # Resumed, found in use and left live again
+    assert category_ids(db)["Groceries"] == ids["Groceries"]
+
+    file_manager.commit([set_change(["categories", str(ids["Groceries"]), "merged_into"], None)])
+    assert db.merge_categories(ids["Groceries"], ids["Food"]) == 1
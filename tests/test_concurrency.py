@@ -0,0 +1,42 @@
+# test_concurrency.py - Optimistic commits between processes sharing one data directory
+import pytest
+
+import benchmark
+import file_manager
+from file_manager import DataStore, append_change, set_change
+
+EMPTY = {"items": [], "meta": {}}
+
+
+def open_store():
+    return DataStore("data.json", "data.journal", empty=EMPTY)
+
+
+@pytest.mark.parametrize("journal", [True, False])
+def test_commit_recomputed_when_another_process_wrote_first(journal, monkeypatch):
+    monkeypatch.setattr(file_manager, "JOURNAL_ENABLED", journal)  # Off: every commit is a snapshot of its own
+    ours, theirs = open_store(), open_store()
+
+    def next_item(data):
+        number = data["meta"].get("next_id", 1)
+        return [set_change(["meta", "next_id"], number + 1), append_change(["items"], number)]
+
+    raced = []
+
+    def racing(data):
+        if not raced:  # Another process commits after we read but before we take the lock
+            raced.append(True)
+            theirs.transact(next_item)
+        return next_item(data)
+
+    ours.get()
+    ours.transact(racing)
+    assert ours.conflicts == 1
+    reopened = open_store()
+    assert reopened.get()["items"] == [1, 2]
+    assert reopened.generation == 2
+
+
+def test_concurrent_writer_processes_lose_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    assert benchmark.bench_stress(processes=4, adds=15) == 0
@@ -0,0 +1,64 @@
+# test_importer.py - Amount parsing and skipping credits in CSV/OFX statement imports
+import pytest
+
+import storage
+from expenses import ExpenseTracker
+from importer import _parse_amount, import_file
+from models import User
+
+OFX = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240105<TRNAMT>-12.50<NAME>Grocer
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240106<TRNAMT>-3.00<NAME>Refund
+</STMTTRN>
+<STMTTRN><TRNTYPE>DEP<DTPOSTED>20240107<TRNAMT>1500.00<NAME>Salary
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+@pytest.fixture
+def tracker():
+    storage.get_storage().add_category("Food")
+    return ExpenseTracker(User("alice", "x", user_id=1))
+
+
+def write(name, text):
+    with open(name, "w", encoding="utf-8") as f:
+        f.write(text)
+    return name
+
+
+@pytest.mark.parametrize("value, amount", [
+    ("12.50", 12.5), ("12,50", 12.5), ("-1,234.50", -1234.5), ("1.234,50", 1234.5), ("1,234", 1234),
+    ("1.234.567", 1234567), ("$12.00", 12), ("(12.00)", -12), ("-7,5", -7.5), ("0.00", None), ("", None),
+    ("abc", None), ("1,23,4", None), ("12.5.0", None),
+])
+def test_parse_amount(value, amount):
+    assert _parse_amount(value) == amount
+
+
+def test_ofx_credits_are_skipped(tracker):
+    stats = import_file(tracker, write("statement.ofx", OFX), default_category="Food")
+    assert (stats.read, stats.imported, stats.credits) == (3, 1, 2)
+    assert [(exp["amount"], exp["description"]) for exp in tracker.query()] == [(12.5, "Grocer")]
+
+
+def test_signed_csv_amounts_skip_refunds(tracker):
+    path = write("bank.csv", "Date,Amount,Description\n2024-01-05,-12.50,Lunch\n2024-01-06,15.00,Refund\n"
+                             "2024-01-07,\"-4,20\",Coffee\n")
+    stats = import_file(tracker, path, default_category="Food")
+    assert (stats.imported, stats.credits) == (2, 1)
+    assert sorted(exp["amount"] for exp in tracker.query()) == [4.2, 12.5]
+
+
+def test_debit_column_and_debit_sign_option(tracker):
+    debit = write("debit.csv", "Date,Debit,Description\n2024-01-05,12.50,Lunch\n2024-01-06,-3.00,Reversal\n")
+    assert import_file(tracker, debit, default_category="Food").credits == 1
+
+    positive = write("positive.csv", "Date,Amount,Description\n2024-02-05,8.00,Taxi\n2024-02-06,-2.00,Refund\n")
+    stats = import_file(tracker, positive, default_category="Food", debit_sign="positive")
+    assert (stats.imported, stats.credits) == (1, 1)
+    with pytest.raises(ValueError):
+        import_file(tracker, positive, default_category="Food", debit_sign="outgoing")
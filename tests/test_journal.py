@@ -0,0 +1,125 @@
+# test_journal.py - Journal replay, torn and corrupt records, and crashes or failures while writing
+import os
+
+import pytest
+
+import file_manager
+from file_manager import DataStore, Journal, append_change
+
+EMPTY = {"items": [], "meta": {}}
+
+
+def open_store():
+    return DataStore("data.json", "data.journal", empty=EMPTY)
+
+
+def add_item(store, value):
+    store.commit([append_change(["items"], value)])
+
+
+def test_journal_replays_after_restart():
+    store = open_store()
+    for value in (1, 2, 3):
+        add_item(store, value)
+    assert open_store().get()["items"] == [1, 2, 3]
+
+
+def test_torn_tail_is_dropped_and_truncated():
+    store = open_store()
+    add_item(store, 1)
+    add_item(store, 2)
+    intact = open("data.journal", "rb").read()
+    with open("data.journal", "ab") as f:
+        f.write(b'0badc0de {"seq":3,"changes":[{"op":"app')  # A crash halfway through an append
+
+    reopened = open_store()
+    assert reopened.get()["items"] == [1, 2]
+    assert open("data.journal", "rb").read() == intact
+    add_item(reopened, 3)
+    assert open_store().get()["items"] == [1, 2, 3]
+
+
+def test_corrupt_record_ends_replay():
+    store = open_store()
+    add_item(store, 1)
+    add_item(store, 2)
+    lines = open("data.journal", "rb").read().splitlines(keepends=True)
+    with open("data.journal", "wb") as f:
+        f.write(lines[0] + lines[1].replace(b"2", b"9"))  # Checksum no longer matches
+    assert open_store().get()["items"] == [1]
+
+
+def test_crlf_journal_lines_replay():
+    store = open_store()
+    add_item(store, 1)
+    raw = open("data.journal", "rb").read()
+    with open("data.journal", "wb") as f:
+        f.write(raw.replace(b"\n", b"\r\n"))  # As a text-mode write on Windows leaves them
+    assert open_store().get()["items"] == [1]
+
+
+def test_crash_between_snapshot_rename_and_journal_reset(monkeypatch):
+    store = open_store()
+    for value in (1, 2, 3):
+        add_item(store, value)
+
+    def crash(self):
+        raise OSError("power lost")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(Journal, "reset", crash)
+        store.save()  # The new snapshot is in place but the journal still holds the records it contains
+    assert list(Journal("data.journal").read())
+
+    reopened = open_store()
+    assert reopened.get()["items"] == [1, 2, 3]  # Records already in the snapshot are not applied twice
+    add_item(reopened, 4)
+    assert reopened.generation == 4
+    assert open_store().get()["items"] == [1, 2, 3, 4]
+
+
+def test_failed_append_raises_and_keeps_memory_in_step_with_disk(monkeypatch):
+    store = open_store()
+    add_item(store, 1)
+
+    def full_disk(fd):
+        raise OSError("no space left on device")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(file_manager.os, "fsync", full_disk)
+        add_item(store, 2)  # Must not look like a successful commit
+
+    assert store.get()["items"] == [1]
+    assert store.generation == 1
+    add_item(store, 3)
+    assert open_store().get()["items"] == [1, 3]
+
+
+def test_failed_snapshot_write_in_rewrite_raises_and_keeps_disk_and_memory_in_step(monkeypatch):
+    store = open_store()
+    add_item(store, 1)
+    generation = store.generation
+
+    def full_disk(data, f):
+        raise OSError("no space left on device")
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(store, "dump", full_disk)
+        store.rewrite(lambda data: data["items"].append(99))
+
+    assert store.generation == generation
+    assert store.get()["items"] == [1]
+    assert open_store().get()["items"] == [1]
+    assert not os.path.exists("data.json.tmp")
+
+
+def test_failed_compaction_keeps_the_journaled_commit(monkeypatch):
+    store = open_store()
+    monkeypatch.setattr(file_manager, "COMPACT_THRESHOLD", 2)
+    add_item(store, 1)
+
+    def full_disk(data, f):
+        raise OSError("no space left on device")
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "dump", full_disk)
+        add_item(store, 2)  # Durable in the journal even though the snapshot could not be written
+
+    assert store.get()["items"] == [1, 2]
+    assert open_store().get()["items"] == [1, 2]
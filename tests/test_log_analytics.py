@@ -0,0 +1,17 @@
+# test_log_analytics.py - Finding app.log's rotated files
+from log_analytics import log_files
+
+
+def touch(*names):
+    for name in names:
+        open(name, "w").close()
+
+
+def test_size_rotated_logs_come_oldest_first_without_the_lock_file():
+    touch("app.log", "app.log.1", "app.log.2", "app.log.10", "app.log.lock", "app.log.tmp")
+    assert log_files("app.log") == ["app.log.10", "app.log.2", "app.log.1", "app.log"]
+
+
+def test_time_rotated_logs_sort_by_date():
+    touch("app.log", "app.log.2024-03-02", "app.log.2024-02-28", "app.log.2024-03-01_13", "app.log.lock")
+    assert log_files("app.log") == ["app.log.2024-02-28", "app.log.2024-03-01_13", "app.log.2024-03-02", "app.log"]
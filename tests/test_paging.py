@@ -0,0 +1,79 @@
+# test_paging.py - Cursor pagination over every sort key, with ties, filters and both backends
+import random
+
+import pytest
+
+import storage
+from expenses import SORTS, ExpenseTracker
+from models import User
+
+CATEGORIES = ("Food", "Transport", "Fun")
+
+
+def open_tracker(backend, reopen, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", backend)
+    reopen()
+    db = storage.get_storage()
+    if not db.categories():
+        for name in CATEGORIES:
+            db.add_category(name)
+    return ExpenseTracker(User("alice", "x", user_id=1))
+
+
+def fill(tracker, count=40):
+    """Adds expenses with few distinct dates and amounts, so every sort key has long runs of ties."""
+    rng = random.Random(3)
+    tracker.add_many([(rng.choice((5, 7.5, 12)), rng.choice(CATEGORIES), f"item {n} {rng.choice(('tea', 'taxi'))}",
+                       f"2024-0{rng.randint(1, 3)}-0{rng.randint(1, 2)}") for n in range(count)])
+
+
+def all_pages(tracker, limit, sort, **filters):
+    ids, cursor = [], None
+    while True:
+        page = tracker.page(limit, cursor, sort, **filters)
+        assert len(page["expenses"]) <= limit
+        ids += [exp["expense_id"] for exp in page["expenses"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("backend", storage.BACKENDS)
+@pytest.mark.parametrize("sort", list(SORTS))
+def test_pages_continue_through_ties_in_every_sort(backend, sort, reopen, monkeypatch):
+    tracker = open_tracker(backend, reopen, monkeypatch)
+    fill(tracker)
+    _, key, descending = SORTS[sort]
+    expected = [exp["expense_id"] for exp in sorted(tracker.store.all(), key=lambda exp: (exp[key], exp["expense_id"]),
+                                                    reverse=descending)]
+    for limit in (1, 3, 7, 40, 100):
+        assert all_pages(tracker, limit, sort) == expected
+
+
+@pytest.mark.parametrize("backend", storage.BACKENDS)
+def test_cursor_is_only_accepted_for_its_own_sort_and_filters(backend, reopen, monkeypatch):
+    tracker = open_tracker(backend, reopen, monkeypatch)
+    fill(tracker)
+    cursor = tracker.page(5, None, "-amount", category="Food", min_amount="6")["next_cursor"]
+    assert tracker.page(5, cursor, "-amount", category="Food", min_amount="6")["expenses"]
+    with pytest.raises(ValueError, match="sort"):
+        tracker.page(5, cursor, "amount", category="Food", min_amount="6")
+    with pytest.raises(ValueError, match="filters"):
+        tracker.page(5, cursor, "-amount", category="Fun", min_amount="6")
+    with pytest.raises(ValueError, match="filters"):
+        tracker.page(5, cursor, "-amount", category="Food")
+    with pytest.raises(ValueError, match="Invalid"):
+        tracker.page(5, "not-a-cursor", "-amount")
+
+
+def test_both_backends_return_the_same_pages(reopen, monkeypatch):
+    queries = [("date", {}), ("-date", {"start_date": "2024-02-01", "end_date": "2024-03-01"}),
+               ("amount", {"category": "Food"}), ("-amount", {"min_amount": "6", "max_amount": "12"}),
+               ("id", {"text": "TAX"}), ("-id", {"search": "tea"}), ("date", {"category": "Nope"})]
+    results = {}
+    for backend in storage.BACKENDS:
+        tracker = open_tracker(backend, reopen, monkeypatch)
+        fill(tracker)
+        results[backend] = [all_pages(tracker, 4, sort, **filters) for sort, filters in queries]
+    assert results["json"] == results["sqlite"]
+    assert all(results["json"][:-1]) and results["json"][-1] == []
@@ -0,0 +1,175 @@
+# test_search.py - Search matching, index persistence and catching up with other processes' writes
+import os
+import random
+
+import pytest
+
+import file_manager
+import search
+import storage
+from expenses import ExpenseTracker
+from models import User
+from search import SearchIndex, tokenize
+
+CATEGORIES = ("Food", "Groceries", "Transport", "Fun")
+
+
+def open_tracker():
+    db = storage.get_storage()
+    if not db.categories():
+        for name in CATEGORIES:
+            db.add_category(name)
+    return ExpenseTracker(User("alice", "x", user_id=1))
+
+
+def found(tracker, query, **filters):
+    return sorted(exp["expense_id"] for exp in tracker.iter_expenses(search=query, **filters))
+
+
+def no_rebuild(cls, *columns):
+    raise AssertionError("search index was rebuilt instead of opened from its file")
+
+
+def test_tokenize_splits_on_punctuation_and_lowercases():
+    assert tokenize("Café-bar, 7-Eleven!") == ["café", "bar", "7", "eleven"]
+
+
+def test_every_word_must_prefix_a_description_or_category_word():
+    tracker = open_tracker()
+    coffee = tracker.add(4, "Food", "Morning coffee", "2024-01-02")["expense_id"]
+    taxi = tracker.add(30, "Transport", "Taxi to airport", "2024-02-10")["expense_id"]
+    assert found(tracker, "coff") == [coffee]
+    assert found(tracker, "MORN cof") == [coffee]
+    assert found(tracker, "trans") == [taxi]  # Category name
+    assert found(tracker, "taxi food") == []
+    beans = tracker.add(9, "Groceries", "Coffee beans", "2024-02-03")["expense_id"]
+    assert found(tracker, "coffee") == [coffee, beans]
+    assert found(tracker, "coffee", start_date="2024-02-01") == [beans]
+    with pytest.raises(ValueError):
+        found(tracker, "!!!")
+
+
+def test_index_catches_up_with_another_process_from_the_journal(reopen, monkeypatch):
+    tracker = open_tracker()
+    pie = tracker.add(5, "Food", "Apple pie", "2024-01-01")["expense_id"]
+    bread = tracker.add(3, "Food", "Bakery bread", "2024-01-02")["expense_id"]
+    assert found(tracker, "apple") == [pie]
+    assert os.path.exists(file_manager.search_file(1))
+
+    reopen()  # Another process, which never opens the index, edits through the journal
+    other = open_tracker()
+    other.update(pie, description="Banana split")
+    other.delete(bread)
+    tart = other.add(6, "Fun", "Cherry tart", "2024-01-03")["expense_id"]
+
+    reopen()
+    monkeypatch.setattr(SearchIndex, "build", classmethod(no_rebuild))
+    tracker = open_tracker()
+    assert found(tracker, "apple") == []
+    assert found(tracker, "ban") == [pie]
+    assert found(tracker, "bread") == []
+    assert found(tracker, "cher") == [tart]
+    assert found(tracker, "fun") == [tart]
+
+
+def test_stale_entries_are_purged_when_the_index_is_saved_again(reopen, monkeypatch):
+    tracker = open_tracker()
+    pie = tracker.add(5, "Food", "Apple pie", "2024-01-01")["expense_id"]
+    found(tracker, "apple")
+    reopen()
+    open_tracker().update(pie, description="Banana split")
+
+    reopen()
+    tracker = open_tracker()
+    assert found(tracker, "apple") == []  # Caught up: the old words are only marked stale
+    monkeypatch.setattr(file_manager, "COMPACT_THRESHOLD", 1)
+    tracker.add(1, "Food", "Gum", "2024-01-05")  # Compacts, which saves the index with the stale entries purged
+
+    reopen()
+    monkeypatch.setattr(SearchIndex, "build", classmethod(no_rebuild))
+    index, _ = SearchIndex.load(file_manager.search_file(1))
+    assert "apple" not in index.words and not index.stale
+    assert found(open_tracker(), "ban") == [pie]
+
+
+def test_index_is_rebuilt_when_another_process_rewrote_the_snapshot(reopen, monkeypatch):
+    tracker = open_tracker()
+    pie = tracker.add(5, "Food", "Apple pie", "2024-01-01")["expense_id"]
+    found(tracker, "apple")
+
+    reopen()
+    monkeypatch.setattr(file_manager, "COMPACT_THRESHOLD", 1)
+    open_tracker().update(pie, description="Banana split")  # Compacted by a process without the index open
+    monkeypatch.setattr(file_manager, "COMPACT_THRESHOLD", 500)
+
+    builds = []
+    real_build = SearchIndex.build.__func__
+    monkeypatch.setattr(SearchIndex, "build", classmethod(lambda cls, *columns: builds.append(1)
+                                                          or real_build(cls, *columns)))
+    reopen()
+    tracker = open_tracker()
+    assert found(tracker, "apple") == []
+    assert found(tracker, "ban") == [pie]
+    assert builds == [1]
+
+
+def test_damaged_index_file_is_rebuilt(reopen):
+    tracker = open_tracker()
+    pie = tracker.add(5, "Food", "Apple pie", "2024-01-01")["expense_id"]
+    found(tracker, "apple")
+    with open(file_manager.search_file(1), "r+b") as f:
+        f.truncate(20)
+    reopen()
+    assert found(open_tracker(), "apple") == [pie]
+
+
+@pytest.mark.parametrize("backend", storage.BACKENDS)
+def test_random_edits_match_a_brute_force_search(backend, reopen, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", backend)
+    monkeypatch.setattr(file_manager, "COMPACT_THRESHOLD", 9)
+    reopen()
+    rng = random.Random(7)
+    words = ["uber", "ubiquitous", "grocery", "groceries", "gift", "fuel", "food", "7-eleven", "café-bar"]
+
+    def brute(tracker, query):
+        terms = tokenize(query)
+        return sorted(exp["expense_id"] for exp in tracker.store.all()
+                      if all(any(word.startswith(term) for word in tokenize(exp["description"])
+                                 + tokenize(exp["category"])) for term in terms))
+
+    tracker = open_tracker()
+    for step in range(80):
+        expenses = tracker.store.all()
+        description = " ".join(rng.sample(words, rng.randint(1, 3))) + f" #{rng.randint(1, 30)}"
+        if rng.random() < 0.5 or not expenses:
+            tracker.add(rng.randint(1, 99), rng.choice(CATEGORIES), description, f"2024-0{rng.randint(1, 6)}-15")
+        elif rng.random() < 0.6:
+            tracker.update(rng.choice(expenses)["expense_id"], description=description,
+                           category=rng.choice(CATEGORIES))
+        else:
+            tracker.delete(rng.choice(expenses)["expense_id"])
+        if step % 10 == 9:
+            if rng.random() < 0.5:
+                reopen()
+                tracker = open_tracker()
+            for query in ("u", "ubi", "gro", "groceries", "f", "7 elev", "caf", "1", "uber fo"):
+                assert found(tracker, query) == brute(tracker, query), query
+            pages, cursor = [], None
+            while True:
+                page = tracker.page(4, cursor, "-amount", search="g")
+                pages += [exp["expense_id"] for exp in page["expenses"]]
+                cursor = page["next_cursor"]
+                if not cursor:
+                    break
+            assert sorted(pages) == brute(tracker, "g") and len(pages) == len(set(pages))
+
+
+def test_matcher_and_find_agree_on_a_large_index():
+    index = SearchIndex()
+    for expense_id in range(1, 5001):
+        index.add(expense_id, f"item {expense_id % 7} note{expense_id % 3}", expense_id % 4)
+    terms = search.search_terms("item note1", {})
+    groups = index.lookup(terms)
+    test = index.matcher(terms, groups, lambda expense_id: None)
+    assert index.find(terms, groups, lambda expense_id: None) == {i for i in range(1, 5001) if test(i)}
+    assert len(index.find(terms, groups, lambda expense_id: None)) == len(range(1, 5001, 3))
@@ -0,0 +1,77 @@
+# test_server.py - Request validation and per-write failure isolation in coalesced batches
+import asyncio
+import json
+
+import pytest
+
+import storage
+from expenses import ExpenseTracker
+from models import User
+from server import ExpenseServer, HttpError, _expense_fields, _run_writes
+
+
+class Writer:
+    """Collects what the server writes to a connection."""
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+def exchange(raw):
+    """Feeds raw request bytes to a connection handler and returns the response status and JSON body."""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        writer = Writer()
+        await ExpenseServer().handle_connection(reader, writer)
+        return writer.data
+    head, _, body = asyncio.run(run()).partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5"])
+def test_bad_content_length_is_a_400(length):
+    status, payload = exchange(b"POST /login HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}")
+    assert status == 400
+    assert "Content-Length" in payload["error"]
+
+
+@pytest.mark.parametrize("body", [{"expense_id": 7}, {"amount": 5, "user_id": 2}, {"description": 12},
+                                  {"amount": True}, {"amount": [5]}, {"category": {"id": 1}}])
+def test_expense_fields_rejects_unknown_fields_and_wrong_types(body):
+    with pytest.raises(HttpError) as error:
+        _expense_fields(body)
+    assert error.value.status == 400
+
+
+def test_expense_fields_accepts_editable_fields():
+    body = {"amount": "12,50", "category": "Food", "description": "Lunch", "date": "2024-01-02"}
+    assert _expense_fields(body) == body
+    assert _expense_fields({"amount": 3.5}) == {"amount": 3.5}
+
+
+def test_a_failing_write_does_not_sink_the_rest_of_its_batch():
+    storage.get_storage().add_category("Food")
+    tracker = ExpenseTracker(User("alice", "x", user_id=1))
+
+    def broken():
+        raise KeyError("bug in a handler")
+    outcomes = _run_writes(tracker, [lambda: tracker.add(5, "Food", "Lunch", "2024-01-02"), broken,
+                                     lambda: tracker.add(6, "Nope", "Dinner", "2024-01-02"),
+                                     lambda: tracker.add(7, "Food", "Tea", "2024-01-03")])
+    assert [ok for ok, _ in outcomes] == [True, False, False, True]
+    assert isinstance(outcomes[1][1], KeyError) and isinstance(outcomes[2][1], ValueError)
+    assert sorted(exp["description"] for exp in tracker.store.all()) == ["Lunch", "Tea"]
@@ -0,0 +1,59 @@
+# test_shards.py - Splitting a monolithic data.json into per-user shards
+import json
+
+import pytest
+
+import file_manager
+
+MONOLITHIC = {
+    "users": [{"user_id": 1, "username": "alice", "password": "x", "role": "user"},
+              {"user_id": 2, "username": "bob", "password": "x", "role": "user"}],
+    "categories": {},
+    "expenses": {"1": [{"expense_id": 1, "amount": 5.0, "category": "Food", "description": "Lunch",
+                        "date": "2024-01-02"}],
+                 "2": [{"expense_id": 1, "amount": 7.0, "category": "Fun", "description": "Film",
+                        "date": "2024-01-03"},
+                       {"expense_id": 2, "amount": 3.0, "category": "Food", "description": "Tea",
+                        "date": "2024-01-04"}]},
+    "budgets": {"2": {"2024-01": 100}},
+}
+
+
+def write_monolithic():
+    with open(file_manager.DATA_FILE, "w") as f:
+        json.dump(MONOLITHIC, f)
+
+
+def test_migration_moves_every_user_into_a_shard(reopen):
+    write_monolithic()
+    assert file_manager.migrate_to_shards()
+
+    reopen()
+    assert "expenses" not in file_manager.load_data() and "budgets" not in file_manager.load_data()
+    assert len(file_manager.load_user_data(1)["expenses"]) == 1
+    assert len(file_manager.load_user_data(2)["expenses"]) == 2
+    assert file_manager.load_user_data(2)["budgets"] == {"2024-01": 100}
+    assert not file_manager.migrate_to_shards()
+
+
+def test_failed_shard_write_keeps_the_monolithic_copy(reopen, monkeypatch):
+    write_monolithic()
+    written = []
+
+    def dump(shard, f):
+        if written:
+            raise OSError("no space left on device")
+        written.append(shard)
+        file_manager.dump_shard(shard, f)
+    with monkeypatch.context() as patch, pytest.raises(OSError):
+        patch.setattr(file_manager, "user_store", lambda user_id: file_manager.DataStore(
+            f"shards/user_{user_id}.json", f"shards/user_{user_id}.journal", empty=file_manager.EMPTY_SHARD,
+            decode=file_manager.decode_shard, dump=dump))
+        file_manager.migrate_to_shards()
+
+    reopen()
+    with open(file_manager.DATA_FILE) as f:
+        assert json.load(f)["expenses"] == MONOLITHIC["expenses"]
+    assert file_manager.migrate_to_shards()  # The next start repeats the split
+    reopen()
+    assert sum(len(file_manager.load_user_data(user_id)["expenses"]) for user_id in (1, 2)) == 3
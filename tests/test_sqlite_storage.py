@@ -0,0 +1,44 @@
+# test_sqlite_storage.py - Expense IDs are never reused, on either backend and across a JSON import
+import pytest
+
+import storage
+from expenses import ExpenseTracker
+from models import User
+from sqlite_storage import SqliteStorage, import_from_json
+
+
+def open_tracker():
+    db = storage.get_storage()
+    if not db.categories():
+        db.add_category("Food")
+    return ExpenseTracker(User("alice", "x", user_id=1))
+
+
+@pytest.mark.parametrize("backend", storage.BACKENDS)
+def test_deleted_newest_id_is_not_reused(backend, reopen, monkeypatch):
+    monkeypatch.setattr(storage, "BACKEND", backend)
+    reopen()
+    tracker = open_tracker()
+    first = tracker.add(5, "Food", "Lunch", "2024-01-02")["expense_id"]
+    newest = tracker.add(6, "Food", "Dinner", "2024-01-02")["expense_id"]
+    tracker.delete(newest)
+
+    reopen()
+    tracker = open_tracker()
+    assert tracker.add(7, "Food", "Tea", "2024-01-03")["expense_id"] == newest + 1
+    tracker.delete(first)
+    tracker.delete(newest + 1)
+    assert tracker.add(8, "Food", "Cake", "2024-01-04")["expense_id"] == newest + 2
+
+
+def test_json_import_keeps_the_id_counter(reopen):
+    tracker = open_tracker()
+    tracker.add(5, "Food", "Lunch", "2024-01-02")
+    newest = tracker.add(6, "Food", "Dinner", "2024-01-02")["expense_id"]
+    tracker.delete(newest)
+    reopen()
+
+    import_from_json("imported.db")
+    db = SqliteStorage("imported.db")
+    assert db.user(1).add([{"date": "2024-01-03", "amount": 7.0, "category_id": 1, "description": "Tea"}]
+                          )[0]["expense_id"] == newest + 1